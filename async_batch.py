@@ -0,0 +1,561 @@
+"""
+基于 asyncio 的批量音频下载 —— 面向十万级别的超长 links 文件。
+
+与 batch_audio_only.py 的区别：
+- 链接文件在单独的读取线程里逐行流式读取（支持标准输入、.gz、JSONL）并规范化，经有界队列交给事件循环，
+  边读边去重，不会先把全部 URL / future 放进内存；
+- 同时处理中的条目数由 --max-inflight 限制（信号量），列表再长内存占用也保持平稳；
+- 任务日志的状态存放在下载索引库里（job_journal.IndexedJobJournal），不在内存中保留每个 URL 的记录；
+- 阻塞的 yt-dlp / ffmpeg 调用通过 run_in_executor 放到三个独立线程池：
+  元数据提取（可以开得很大，主要是等网络）、音频流下载、转码；
+- 每个站点有独立的并发上限和最小开始间隔（沿用 host_scheduler 的策略与 --host-limit），
+  遇到限流时推迟该站点之后的条目。
+
+处理逻辑（索引跳过、断点续传、重试分类、转码）与 batch_audio_only.py 完全复用。
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from audio_dedup import add_dedup_arguments, configure_dedup_from_args, default_dedup
+from audio_profile import AudioProfile, add_profile_arguments, profile_from_args, require_ffmpeg
+from batch_audio_only import (
+    DEFAULT_PROFILE,
+    check_stage,
+    download_stage,
+    expand_children,
+    local_check,
+    safe_print,
+    transcode_stage,
+)
+from host_scheduler import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    DEFAULT_POLICIES,
+    FALLBACK_POLICY,
+    HostPolicy,
+    host_key,
+    is_throttle_error,
+    parse_host_limit,
+)
+from job_journal import IndexedJobJournal, JobJournal
+from loudness import DEFAULT_TARGET_LUFS
+from js_challenge import enable_js_challenge_cache, js_cache_stats_line
+from links_input import STDIN_PATH, iter_links, make_seen_filter
+from metrics import add_metrics_arguments, configure_from_args, default_metrics
+from pipeline import FetchResult
+from progress import add_progress_arguments, default_progress
+from retry import (
+    ERROR_CLASS_LABELS,
+    POLICIES,
+    THROTTLED,
+    TRANSIENT,
+    RetryStats,
+    backoff_delay,
+    classify_error,
+)
+from segmented import add_segmented_arguments, configure_segmented_from_args, default_connections
+from url_canon import CanonicalURL, canonicalize_url
+from ydl_pool import default_pool, require_yt_dlp
+
+# 读取线程与事件循环之间的队列长度；读得比处理快时读取线程在队列满处等待
+INPUT_QUEUE_SIZE = 1024
+# 读取线程放在队列末尾的结束标记
+_INPUT_END = object()
+
+
+class _HostGate:
+    """单个站点的并发上限 + 最小开始间隔（1 / rate 秒）；被限流时整体推迟该站点。"""
+
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.semaphore = asyncio.Semaphore(policy.max_concurrency)
+        self.next_start = 0.0
+        self.backoff_level = 0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self._lock:
+            now = time.monotonic()
+            wait = self.next_start - now
+            self.next_start = max(now, self.next_start) + 1.0 / self.policy.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+    def throttled(self):
+        self.backoff_level += 1
+        delay = min(BACKOFF_BASE * 2 ** (self.backoff_level - 1), BACKOFF_MAX)
+        self.next_start = max(self.next_start, time.monotonic() + delay)
+
+    def succeeded(self):
+        self.backoff_level = max(self.backoff_level - 1, 0)
+
+
+class AsyncBatchRunner:
+    """
+    asyncio 批量下载器。
+
+    :param max_inflight: 同时处理中的条目数上限（含等待站点名额的条目）。
+    :param metadata_workers: 元数据提取线程数。
+    :param download_workers: 音频流下载线程数。
+    :param transcode_workers: 转码 worker 数，默认等于 CPU 核数。
+    :param transcode_processes: 转码阶段是否使用进程池。
+    :param host_limits: 按站点覆盖默认并发/限速策略，{站点: HostPolicy}。
+    :param bloom_capacity: 给出预计的链接数时用固定内存的布隆过滤器去重。
+    :param profile: 音频输出格式/码率/音量。
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        cookie_file=None,
+        force_overwrites=False,
+        journal: Optional[JobJournal] = None,
+        max_inflight=256,
+        metadata_workers=32,
+        download_workers=8,
+        transcode_workers=None,
+        transcode_processes=False,
+        host_limits: Optional[Dict[str, HostPolicy]] = None,
+        bloom_capacity: Optional[int] = None,
+        profile: AudioProfile = DEFAULT_PROFILE,
+    ):
+        self.output_dir = output_dir
+        self.profile = profile
+        self.cookie_file = cookie_file
+        self.force_overwrites = force_overwrites
+        self.journal = journal
+        self.max_inflight = max_inflight
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(host_limits or {})
+
+        self.metadata_pool = ThreadPoolExecutor(metadata_workers, thread_name_prefix="metadata")
+        self.download_pool = ThreadPoolExecutor(download_workers, thread_name_prefix="download")
+        self.transcode_workers = transcode_workers or os.cpu_count() or 1
+        if transcode_processes:
+            # 与 pipeline 一样，只在使用进程池时才导入 multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.transcode_pool = ProcessPoolExecutor(self.transcode_workers)
+        else:
+            self.transcode_pool = ThreadPoolExecutor(self.transcode_workers, thread_name_prefix="transcode")
+
+        self.retry_stats = RetryStats()
+        self.counts = {"成功": 0, "已存在": 0, "错误": 0, "展开": 0, "展开条目": 0, "此前已完成": 0}
+        self.peak_inflight = 0
+        self._gates: Dict[str, _HostGate] = {}
+        self.seen = make_seen_filter(bloom_capacity)
+        self._finished = 0
+        self._submitted = 0
+        self._exhausted = False
+        self._children = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _gate(self, url: str) -> _HostGate:
+        host = host_key(url)
+        gate = self._gates.get(host)
+        if gate is None:
+            gate = self._gates[host] = _HostGate(self.policies.get(host, FALLBACK_POLICY))
+        return gate
+
+    @staticmethod
+    def _read_input(loop, raw_urls, queue: asyncio.Queue):
+        """
+        读取线程：逐行读取输入（.gz 解压、标准输入都是阻塞读）并规范化链接（短链要联网展开），
+        结果放进有界队列；事件循环处理不过来时本线程在队列满处等待。最后放入 _INPUT_END 或读取时的异常。
+        """
+        try:
+            for raw in raw_urls:
+                item = canonicalize_url(raw)
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        except BaseException as exc:
+            item = exc
+        else:
+            item = _INPUT_END
+        try:
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        except RuntimeError:
+            # 事件循环已经关闭（例如被 Ctrl+C 中断），没有人再读队列
+            pass
+
+    async def _fetch_once(self, loop, url: str) -> FetchResult:
+        # 任务日志、本地索引能给出结论的条目不联网，也就不占站点的并发名额和速率
+        result = await loop.run_in_executor(
+            self.metadata_pool, default_metrics.bind(url, local_check),
+            url, self.output_dir, self.force_overwrites, self.journal, self.profile,
+        )
+        if result is not None:
+            return result
+
+        gate = self._gate(url)
+        t0 = time.time()
+        async with gate:
+            default_metrics.record("schedule", time.time() - t0, url=url)
+            result, info, logger = await loop.run_in_executor(
+                self.metadata_pool, default_metrics.bind(url, check_stage),
+                url, self.output_dir, self.cookie_file, self.force_overwrites, self.journal, True, self.profile,
+            )
+            if result is None:
+                result = await loop.run_in_executor(
+                    self.download_pool, default_metrics.bind(url, download_stage),
+                    url, info, logger, self.output_dir, self.cookie_file, self.force_overwrites, self.journal,
+                    self.profile,
+                )
+        if result.status == "错误" and is_throttle_error(result.extra):
+            gate.throttled()
+        else:
+            gate.succeeded()
+        return result
+
+    async def _fetch(self, loop, url: str) -> FetchResult:
+        # 与 call_with_retry 相同的分类重试，只是用 asyncio.sleep 等待，不占用线程
+        attempt = 0
+        while True:
+            try:
+                result = await self._fetch_once(loop, url)
+            except Exception as e:
+                result = FetchResult("错误", str(e))
+            if result.status != "错误":
+                return result
+            error_class = classify_error(result.extra)
+            policy = POLICIES[error_class]
+            attempt += 1
+            if error_class not in (TRANSIENT, THROTTLED) or attempt >= policy.max_attempts:
+                return result
+            delay = backoff_delay(attempt, policy)
+            self.retry_stats.add(url)
+            default_metrics.record_retry(error_class, url=url, attempt=attempt)
+            safe_print(
+                f"  [重试 {attempt}/{policy.max_attempts - 1}] {ERROR_CLASS_LABELS[error_class]}，"
+                f"{delay:.1f}s 后重试: {url}"
+            )
+            await asyncio.sleep(delay)
+
+    async def _process(self, loop, url: str):
+        start = time.time()
+        result = await self._fetch(loop, url)
+        if result.children:
+            # 播放列表展开出的条目交给 run() 的主循环调度，与输入链接共享 max_inflight 名额
+            for child in expand_children(url, result.children, self.seen, self.journal):
+                self._children.append(child)
+                self.counts["展开条目"] += 1
+            self._wakeup.set()
+        errors = []
+        if result.jobs:
+            errors = [
+                error for error in await asyncio.gather(*(self._transcode(loop, url, job) for job in result.jobs))
+                if error
+            ]
+        status, extra = result.status, result.extra
+        if status == "错误" or errors:
+            status, extra = "错误", extra or "; ".join(errors)
+        self._report(url, status, extra, time.time() - start)
+
+    async def _transcode(self, loop, url: str, job) -> Optional[str]:
+        # 进程池里的转码无法写入本进程的指标，转码耗时在这里按条目记录
+        t0 = time.time()
+        error = await loop.run_in_executor(self.transcode_pool, transcode_stage, job)
+        default_metrics.record("transcode", time.time() - t0, url=url, video_id=job.video_id)
+        return error
+
+    def _report(self, url, status, extra_info, elapsed_time):
+        self._finished += 1
+        self.counts[status] += 1
+        retries = self.retry_stats.retries(url)
+        retry_note = f", 重试 {retries} 次" if retries else ""
+        default_metrics.record_item(url, status, elapsed_time, retries)
+        default_progress.set_items(self._finished, self._submitted, self._exhausted and not self._children)
+        if status == "展开":
+            safe_print(f"+ [{self._finished}] 播放列表已展开为 {extra_info}: {url}")
+            return
+        if self.journal is not None:
+            if status == "错误":
+                self.journal.mark(url, 'failed', reason=extra_info)
+            else:
+                self.journal.mark(url, 'done')
+
+        if status == "成功":
+            safe_print(f"[OK] [{self._finished}] 下载成功 ({elapsed_time:.1f}s{retry_note}): {url}")
+        elif status == "已存在":
+            safe_print(f"- [{self._finished}] 文件已存在，跳过: {extra_info}")
+        else:
+            label_text = ERROR_CLASS_LABELS[classify_error(extra_info)]
+            safe_print(f"[FAIL] [{self._finished}] 下载失败 [{label_text}] ({elapsed_time:.1f}s{retry_note}): {url}")
+            safe_print(f"  错误信息: {extra_info}")
+
+    def _admit(self, canon: CanonicalURL) -> Optional[str]:
+        """规范化后的输入链接去重并对照任务日志；需要处理时返回规范 URL。"""
+        # 按 (站点, 视频ID) 去重；只保存键的哈希，不保存任务
+        if not self.seen.add(canon.key):
+            return None
+        url = canon.url
+        if self.journal is not None:
+            state = self.journal.state(url)
+            if state == 'done':
+                self.counts["此前已完成"] += 1
+                return None
+            if state is None:
+                self.journal.mark(url, 'queued')
+        return url
+
+    async def run(self, raw_urls):
+        """流式消费 raw_urls：边去重边提交，同时处理中的条目不超过 max_inflight。"""
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_inflight)
+        self._wakeup = asyncio.Event()
+        tasks = set()
+
+        def on_done(task):
+            tasks.discard(task)
+            slots.release()
+            self._wakeup.set()
+            if not task.cancelled() and task.exception() is not None:
+                safe_print(f"内部错误: {task.exception()}")
+
+        # 读取输入放到单独的线程，事件循环只从有界队列里取规范化好的链接
+        source: asyncio.Queue = asyncio.Queue(INPUT_QUEUE_SIZE)
+        threading.Thread(
+            target=self._read_input, args=(loop, raw_urls, source), name="input", daemon=True
+        ).start()
+        exhausted = False
+        while True:
+            # 优先调度播放列表展开出的条目，其次才继续读输入
+            if self._children:
+                url = self._children.popleft()
+            elif not exhausted:
+                item = await source.get()
+                if item is _INPUT_END:
+                    exhausted = self._exhausted = True
+                    continue
+                if isinstance(item, BaseException):
+                    raise item
+                url = self._admit(item)
+                if url is None:
+                    continue
+            elif tasks:
+                # 输入已读完，等进行中的条目结束（它们可能还会展开出新条目）
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            else:
+                break
+
+            await slots.acquire()
+            self._submitted += 1
+            task = loop.create_task(self._process(loop, url))
+            tasks.add(task)
+            task.add_done_callback(on_done)
+            self.peak_inflight = max(self.peak_inflight, len(tasks))
+
+    def close(self, wait=True):
+        for pool in (self.metadata_pool, self.download_pool, self.transcode_pool):
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def async_batch_download(
+    file_path,
+    output_dir,
+    cookie_file=None,
+    force_overwrites=False,
+    max_inflight=256,
+    metadata_workers=32,
+    download_workers=8,
+    transcode_workers=None,
+    transcode_processes=False,
+    host_limits=None,
+    fresh=False,
+    bloom_capacity=None,
+    js_worker=False,
+    audio_profile=None,
+    progress="auto",
+):
+    """
+    用 asyncio 驱动从文本文件中批量下载音频，参数含义见 AsyncBatchRunner。
+
+    :param fresh: 忽略该 links 文件已有的任务日志，从头开始（默认断点续传）。
+    :param js_worker: 是否用常驻 node 进程求解 YouTube JS 挑战。
+    :param audio_profile: 音频输出格式/码率/音量，默认与 batch_audio_only.py 相同。
+    :param progress: 进度显示方式，见 progress.PROGRESS_MODES。
+    """
+    if file_path != STDIN_PATH and not os.path.isfile(file_path):
+        print(f"错误: 文件 '{file_path}' 未找到。")
+        sys.exit(1)
+
+    os.makedirs(os.path.join(output_dir, 'audios'), exist_ok=True)
+    journal = IndexedJobJournal.for_links_file(output_dir, file_path)
+    if fresh:
+        journal.reset()
+    enable_js_challenge_cache(output_dir, persistent_worker=js_worker)
+
+    runner = AsyncBatchRunner(
+        output_dir, cookie_file, force_overwrites, journal,
+        max_inflight=max_inflight,
+        metadata_workers=metadata_workers,
+        download_workers=download_workers,
+        transcode_workers=transcode_workers,
+        transcode_processes=transcode_processes,
+        host_limits=host_limits,
+        bloom_capacity=bloom_capacity,
+        profile=audio_profile or DEFAULT_PROFILE,
+    )
+    print(
+        f"流式读取 '{file_path}'，最多同时处理 {max_inflight} 个条目 "
+        f"(元数据 {metadata_workers} 线程, 下载 {download_workers} 线程, 转码 {runner.transcode_workers} 个 worker)..."
+    )
+    print(f"输出目录: {os.path.abspath(output_dir)}")
+    print(f"输出格式: {runner.profile.describe()}")
+    if default_connections.enabled:
+        print(f"下载连接: {default_connections.describe()}")
+    if default_dedup.enabled:
+        print(f"音频去重: {default_dedup.mode}")
+    print("-" * 80)
+
+    batch_start_time = time.time()
+    default_progress.start(progress)
+    try:
+        asyncio.run(runner.run(iter_links(file_path)))
+    except KeyboardInterrupt:
+        safe_print("\n下载被用户中断。")
+        runner.close(wait=False)
+        default_progress.stop()
+        journal.close()
+        safe_print("进度已保存到任务日志，重新运行同一命令即可继续。")
+        sys.exit(0)
+    runner.close()
+    default_progress.stop()
+    journal.close()
+
+    counts = runner.counts
+    safe_print("-" * 80)
+    safe_print("批量音频下载完成！")
+    if counts["此前已完成"]:
+        safe_print(f"此前已完成: {counts['此前已完成']} 个")
+    if counts["展开"]:
+        safe_print(f"展开播放列表: {counts['展开']} 个，新入队 {counts['展开条目']} 个条目")
+    if runner.seen.duplicates:
+        safe_print(f"合并重复链接: {runner.seen.duplicates} 个")
+    safe_print(f"成功: {counts['成功']} 个")
+    safe_print(f"跳过: {counts['已存在']} 个")
+    safe_print(f"失败: {counts['错误']} 个")
+    if runner.retry_stats.total:
+        safe_print(f"重试: {runner.retry_stats.total} 次")
+    if default_dedup.enabled:
+        safe_print(default_dedup.summary_line())
+    safe_print(default_pool.stats_line())
+    js_stats = js_cache_stats_line()
+    if js_stats:
+        safe_print(js_stats)
+    safe_print(f"同时处理中的条目峰值: {runner.peak_inflight}")
+    safe_print(f"总用时: {time.time() - batch_start_time:.1f} 秒")
+    for line in default_metrics.summary_lines():
+        safe_print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="[仅音频] 用 asyncio 流式处理超长链接列表（十万级），内存占用不随列表长度增长。",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog="""
+适合非常长的 links 文件；普通规模的列表用 batch_audio_only.py 即可。
+默认断点续传，并跳过 'audios' 文件夹和下载索引中已存在的文件。
+
+示例:
+  # 最多同时处理 500 个条目，64 个线程做元数据提取
+  python async_batch.py huge_links.txt --max-inflight 500 --metadata-workers 64
+
+  # 限制 B 站并发与速率
+  python async_batch.py huge_links.txt --host-limit bilibili=2:0.5
+"""
+    )
+    parser.add_argument("file", help="包含 URL 列表的文件路径（支持 .gz 和 JSONL），'-' 表示从标准输入读取。")
+    parser.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
+    parser.add_argument("--force-overwrites", action="store_true", help="强制覆盖并重新下载已存在的文件。")
+    parser.add_argument("--cookies", metavar="FILE", help="指定包含 Cookies 的文本文件路径 (Netscape 格式)。")
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=256,
+        help="同时处理中的条目数上限 (默认为 256)。决定内存占用的上界。"
+    )
+    parser.add_argument("--metadata-workers", type=int, default=32, help="元数据提取线程数 (默认为 32)。")
+    parser.add_argument("--download-workers", type=int, default=8, help="音频流下载线程数 (默认为 8)。")
+    parser.add_argument("--transcode-workers", type=int, default=None, help="转码 worker 数 (默认为 CPU 核数)。")
+    parser.add_argument("--transcode-processes", action="store_true", help="转码阶段使用进程池而不是线程池。")
+    parser.add_argument(
+        "--host-limit",
+        metavar="SITE=N:RATE",
+        action="append",
+        default=[],
+        help="按站点限制并发数与每秒开始的条目数，可多次指定 (例如 bilibili=2:0.5)。"
+    )
+    parser.add_argument("--fresh", action="store_true", help="忽略任务日志从头开始。")
+    parser.add_argument(
+        "--bloom",
+        metavar="N",
+        type=int,
+        default=None,
+        help="预计链接数为 N 的超大输入时，用固定内存的布隆过滤器去重。"
+    )
+    add_profile_arguments(parser, default_loudnorm=DEFAULT_TARGET_LUFS)
+    parser.add_argument("--js-worker", action="store_true", help="用常驻的 node 进程求解 YouTube JS 挑战（n 参数/签名），省去每个视频启动 JS 运行时的开销。")
+    add_segmented_arguments(parser)
+    add_dedup_arguments(parser)
+    add_metrics_arguments(parser)
+    add_progress_arguments(parser)
+
+    args = parser.parse_args()
+
+    for name in ("max_inflight", "metadata_workers", "download_workers"):
+        if getattr(args, name) < 1:
+            print(f"错误: --{name.replace('_', '-')} 必须大于 0。")
+            sys.exit(1)
+    if args.transcode_workers is not None and args.transcode_workers < 1:
+        print("错误: 转码 worker 数必须大于 0。")
+        sys.exit(1)
+    if args.segments < 1 or (args.max_connections is not None and args.max_connections < 1):
+        print("错误: --segments 与 --max-connections 必须大于 0。")
+        sys.exit(1)
+    try:
+        host_limits = dict(parse_host_limit(spec) for spec in args.host_limit)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    try:
+        configure_from_args(args)
+    except OSError as e:
+        print(f"错误: 无法打开指标输出: {e}")
+        sys.exit(1)
+    require_yt_dlp()
+    require_ffmpeg()
+    configure_segmented_from_args(args)
+    configure_dedup_from_args(args)
+
+    async_batch_download(
+        args.file,
+        args.output,
+        args.cookies,
+        args.force_overwrites,
+        args.max_inflight,
+        args.metadata_workers,
+        args.download_workers,
+        args.transcode_workers,
+        args.transcode_processes,
+        host_limits,
+        args.fresh,
+        args.bloom,
+        args.js_worker,
+        profile_from_args(args),
+        args.progress,
+    )
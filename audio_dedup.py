@@ -0,0 +1,337 @@
+"""
+音频内容去重 —— 给每个输出音频算一个轻量的内容指纹存进下载索引，同一首歌从不同来源下载时只保留一份。
+
+同一首歌常常既有 YouTube 上传、又有 B 站搬运和网易云音轨，文件名末尾的 [ID] 各不相同，按视频 ID 的跳过检查认不出来。
+指纹的算法很简单：ffmpeg 把前 FINGERPRINT_SECONDS 秒解码成 4kHz 单声道 PCM，按 0.1 秒分帧计算能量，
+每帧记 1 位（能量高于前 SMOOTH_FRAMES 帧的平均值为 1）。不同来源的编码、码率和音量各不相同，能量的起伏走势基本不变；
+比较时允许几秒的整体错位（片头多一段静音），相同的位不少于 MATCH_THRESHOLD 即视为同一段音频。
+只和时长相差不超过 DURATION_TOLERANCE 秒的已有指纹比较。
+
+--dedup 的两种模式：
+- link：新文件换成指向已有文件的硬链接（扩展名沿用已有文件），磁盘上只占一份；文件系统不支持硬链接时按 skip 处理；
+- skip：删除新文件，下载索引里该视频 ID 直接指向已有文件，之后按索引跳过。
+
+下载前也能省掉流量：提取到元数据后，标题（去掉括号里的 “Official Video” 之类、标点和大小写）相同、
+时长相差不超过 TITLE_DURATION_TOLERANCE 秒的已有指纹视为同一首，不再下载，直接按上面的模式处理。
+先下载的文件保留，不比较音质。
+
+用法：
+  # 给已下载的音频补算指纹（加 --dedup link/skip 时顺便合并其中的重复文件）
+  python audio_dedup.py scan -o downloads
+  python audio_dedup.py scan -o downloads --dedup link
+"""
+
+import argparse
+import operator
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import unicodedata
+from array import array
+from typing import NamedTuple, Optional
+
+from download_index import normalize_extractor, open_index
+from metrics import default_metrics
+from progress import default_progress
+
+DEDUP_MODES = ("off", "link", "skip")
+
+# 解码参数：4kHz 单声道，每帧 0.1 秒；只取前 FINGERPRINT_SECONDS 秒
+SAMPLE_RATE = 4000
+FRAME_SAMPLES = SAMPLE_RATE // 10
+FINGERPRINT_SECONDS = 180
+# 每帧与前几帧的平均能量比较：比只和上一帧比，对帧边界错位和编码噪声更稳定
+SMOOTH_FRAMES = 4
+# 判定为同一段音频的相同位比例，比较时允许的最大错位帧数（3 秒），以及最少的重叠帧数（10 秒）
+MATCH_THRESHOLD = 0.8
+MAX_OFFSET_FRAMES = 30
+MIN_OVERLAP_FRAMES = 100
+# 参与指纹比较的时长差（秒）；只按标题判断时要求更严格的时长差
+DURATION_TOLERANCE = 2.0
+TITLE_DURATION_TOLERANCE = 1.0
+# 规范化后的标题短于这个长度（例如 “Intro”）时不按标题判断
+MIN_TITLE_KEY = 6
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+_BRACKETS_RE = re.compile(r"\([^()]*\)|\[[^\[\]]*\]|【[^【】]*】|（[^（）]*）")
+_TITLE_NOISE_RE = re.compile(
+    r"official\s*(?:music\s*)?(?:video|audio|mv)|lyrics?\s*video|\blyrics?\b|\bmv\b|\bhd\b|\b4k\b"
+    r"|高音质|无损|官方|歌词版?|完整版",
+    re.IGNORECASE,
+)
+# 输出文件名为 '标题 [ID].扩展名'
+_FILENAME_ID_RE = re.compile(r"\s*\[[^\[\]]+\]$")
+
+
+class Fingerprint(NamedTuple):
+    duration: float  # 整个文件的时长（秒）
+    frames: int      # 指纹位数
+    bits: int        # 第 i 位为第 i+SMOOTH_FRAMES 帧的能量是否高于它前 SMOOTH_FRAMES 帧的平均值
+
+
+def title_key(title: str) -> str:
+    """用于按标题匹配的规范化标题；太短时返回空串（不按标题判断）。"""
+    text = unicodedata.normalize("NFKC", title or "").lower()
+    text = _TITLE_NOISE_RE.sub("", _BRACKETS_RE.sub("", text))
+    key = "".join(ch for ch in text if ch.isalnum())
+    return key if len(key) >= MIN_TITLE_KEY else ""
+
+
+def title_from_path(path: str) -> str:
+    """从输出文件名中取回标题（去掉末尾的 [ID] 和扩展名）。"""
+    return _FILENAME_ID_RE.sub("", os.path.splitext(os.path.basename(path))[0])
+
+
+def fingerprint_audio(path: str) -> Optional[Fingerprint]:
+    """解码并计算指纹；没有 ffmpeg、解码失败或音频短于 MIN_OVERLAP_FRAMES 帧时返回 None。"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-nostdin", "-i", path, "-map", "0:a:0", "-vn", "-t", str(FINGERPRINT_SECONDS),
+         "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        return None
+    samples = array("h")
+    samples.frombytes(result.stdout[:len(result.stdout) // 2 * 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    energies = [
+        sum(map(operator.mul, frame, frame))
+        for frame in (samples[i:i + FRAME_SAMPLES] for i in range(0, len(samples) - FRAME_SAMPLES + 1, FRAME_SAMPLES))
+    ]
+    frames = len(energies) - SMOOTH_FRAMES
+    if frames < MIN_OVERLAP_FRAMES:
+        return None
+    bits = 0
+    window = sum(energies[:SMOOTH_FRAMES])
+    for i in range(frames):
+        if energies[i + SMOOTH_FRAMES] * SMOOTH_FRAMES > window:
+            bits |= 1 << i
+        window += energies[i + SMOOTH_FRAMES] - energies[i]
+    # 只解码了前一段，完整时长从 ffmpeg 打印的输入信息里读
+    match = _DURATION_RE.search(result.stderr.decode("utf-8", "replace"))
+    if match:
+        duration = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+    else:
+        duration = len(samples) / SAMPLE_RATE
+    return Fingerprint(round(duration, 2), frames, bits)
+
+
+def similarity(a_bits: int, a_frames: int, b_bits: int, b_frames: int) -> float:
+    """两个指纹在最佳错位下相同位的比例（0~1）；重叠部分不足 MIN_OVERLAP_FRAMES 时为 0。"""
+    best = 0.0
+    for offset in range(-MAX_OFFSET_FRAMES, MAX_OFFSET_FRAMES + 1):
+        if offset >= 0:
+            x, y, n = a_bits >> offset, b_bits, min(a_frames - offset, b_frames)
+        else:
+            x, y, n = a_bits, b_bits >> -offset, min(a_frames, b_frames + offset)
+        if n < MIN_OVERLAP_FRAMES:
+            continue
+        differ = bin((x ^ y) & ((1 << n) - 1)).count("1")
+        best = max(best, 1 - differ / n)
+    return best
+
+
+def _hardlink(existing: str, link_path: str) -> bool:
+    """把 link_path 原子地替换成 existing 的硬链接；文件系统不支持时返回 False。"""
+    tmp_path = link_path + ".part"
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.link(existing, tmp_path)
+        os.replace(tmp_path, link_path)
+    except OSError:
+        return False
+    return True
+
+
+class AudioDedup:
+    """进程内的去重设置与统计；指纹和匹配结果都存放在下载索引里。"""
+
+    def __init__(self):
+        self.mode = "off"
+        self._lock = threading.Lock()
+        self.duplicates = 0     # 下载后按指纹识别出的重复文件
+        self.prefetched = 0     # 下载前按标题 + 时长识别、没有下载的条目
+        self.saved_bytes = 0
+
+    def configure(self, mode: str = "off"):
+        """:param mode: "off"、"link" 或 "skip"，见模块说明。"""
+        self.mode = mode
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def summary_line(self) -> str:
+        return (f"音频去重 ({self.mode}): 重复文件 {self.duplicates} 个，节省 {self.saved_bytes / 1024 / 1024:.1f}MB；"
+                f"下载前按标题识别 {self.prefetched} 个")
+
+    def check_metadata(self, output_dir: str, extractor: str, video_id: Optional[str], title: Optional[str],
+                       duration: Optional[float], dest_path: str) -> Optional[str]:
+        """
+        下载前检查：标题与时长都和某个已有指纹相同时不再下载，返回该条目改用的音频路径，否则返回 None。
+
+        :param dest_path: 该条目本来的输出路径；link 模式在这里（扩展名换成已有文件的）建硬链接。
+        """
+        if not self.enabled or not video_id or not duration:
+            return None
+        key = title_key(title or "")
+        if not key:
+            return None
+        try:
+            index = open_index(output_dir)
+            for cand_extractor, cand_id, cand_path, _, _ in index.fingerprint_candidates(
+                    float(duration), TITLE_DURATION_TOLERANCE, key):
+                if (cand_extractor, cand_id) == (extractor, str(video_id)):
+                    continue
+                path = cand_path
+                if self.mode == "link":
+                    link_path = os.path.splitext(dest_path)[0] + os.path.splitext(cand_path)[1]
+                    if os.path.exists(link_path) or _hardlink(cand_path, link_path):
+                        path = link_path
+                index.record(extractor, str(video_id), "audio", path)
+                with self._lock:
+                    self.prefetched += 1
+                return path
+        except sqlite3.Error:
+            # 去重只是节省手段，索引读写失败时照常下载
+            pass
+        return None
+
+    def dedup_file(self, output_dir: str, extractor: str, video_id: Optional[str], path: str,
+                   mode: Optional[str] = None) -> str:
+        """
+        下载/转码完成后：计算指纹，与已有音频重复时按模式合并，否则登记指纹。返回该条目最终使用的音频路径。
+
+        :param mode: 覆盖进程内的设置（转码在子进程中进行时由任务带过去）；"record" 表示只登记指纹、不合并。
+        """
+        mode = mode or self.mode
+        if mode == "off" or not video_id or not os.path.exists(path):
+            return path
+        with default_metrics.stage("dedup", video_id=video_id):
+            fingerprint = fingerprint_audio(path)
+        if fingerprint is None:
+            return path
+        key = title_key(title_from_path(path))
+        try:
+            index = open_index(output_dir)
+            # 查找与登记放在同一把锁里，同时完成的两份重复文件不会都被当成“第一份”
+            with self._lock:
+                match = None
+                if mode != "record":
+                    match = self._find_match(index, extractor, video_id, path, fingerprint)
+                result = path
+                if match is not None:
+                    result = self._merge(path, match, mode)
+                    index.record(extractor, video_id, "audio", result)
+                index.record_fingerprint(extractor, video_id, result, fingerprint.duration, key,
+                                         fingerprint.frames, format(fingerprint.bits, "x"))
+        except sqlite3.Error:
+            return path
+        if match is not None:
+            action = "改为硬链接" if result != match and os.path.exists(result) else "已删除，改用已有文件"
+            default_progress.log(f"重复音频（与 {os.path.basename(match)} 相同）{action}: {os.path.basename(path)}")
+        return result
+
+    @staticmethod
+    def _find_match(index, extractor: str, video_id: str, path: str, fingerprint: Fingerprint) -> Optional[str]:
+        for cand_extractor, cand_id, cand_path, frames, bits in index.fingerprint_candidates(
+                fingerprint.duration, DURATION_TOLERANCE):
+            if (cand_extractor, cand_id) == (extractor, video_id):
+                continue
+            try:
+                if os.path.samefile(cand_path, path):
+                    continue
+            except OSError:
+                continue
+            if similarity(fingerprint.bits, fingerprint.frames, int(bits, 16), frames) >= MATCH_THRESHOLD:
+                return cand_path
+        return None
+
+    def _merge(self, path: str, existing: str, mode: str) -> str:
+        """按模式处理重复的新文件 path（调用方持有锁），返回该条目改用的路径。"""
+        size = os.path.getsize(path)
+        result = existing
+        if mode == "link":
+            link_path = os.path.splitext(path)[0] + os.path.splitext(existing)[1]
+            if _hardlink(existing, link_path):
+                result = link_path
+        if result != path:
+            os.remove(path)
+        self.duplicates += 1
+        self.saved_bytes += size
+        return result
+
+
+# 进程内共享的设置：下载/转码完成时按它决定是否去重
+default_dedup = AudioDedup()
+
+
+def make_dedup_hook(output_dir: str):
+    """生成 yt-dlp 的 postprocessor_hooks 回调：音频文件移动到最终位置后做去重（放在 make_index_hook 之后）。"""
+    def hook(d):
+        if d.get("status") != "finished" or d.get("postprocessor") != "MoveFiles":
+            return
+        info = d.get("info_dict") or {}
+        if info.get("filepath"):
+            default_dedup.dedup_file(
+                output_dir, normalize_extractor(info.get("extractor_key")), info.get("id"), info["filepath"]
+            )
+    return hook
+
+
+def add_dedup_arguments(parser):
+    """给命令行加上 --dedup。"""
+    parser.add_argument(
+        "--dedup",
+        choices=DEDUP_MODES,
+        default="off",
+        help="按音频内容去重 (默认为 off)：同一首歌从不同来源下载时，link 把新文件换成已有文件的硬链接，\n"
+             "skip 删除新文件、索引指向已有文件；标题和时长都相同的已有音频在下载前就跳过。"
+    )
+
+
+def configure_dedup_from_args(args):
+    default_dedup.configure(args.dedup)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="音频内容去重：给已下载的音频补算指纹。",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog=__doc__.split("用法：", 1)[1],
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan = sub.add_parser("scan", help="给索引中还没有指纹的音频计算指纹")
+    scan.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
+    scan.add_argument("--dedup", choices=("record", "link", "skip"), default="record",
+                      help="record 只登记指纹 (默认)；link/skip 同时合并其中的重复文件。")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.output):
+        print(f"错误: 目录 '{args.output}' 不存在。")
+        sys.exit(1)
+    if not shutil.which("ffmpeg"):
+        print("错误: 计算指纹需要 ffmpeg。")
+        sys.exit(1)
+    rows = open_index(args.output).audio_without_fingerprint()
+    print(f"待计算指纹: {len(rows)} 个音频（先运行 python download_index.py rebuild-index 可登记已有文件）")
+    for n, (extractor, video_id, path) in enumerate(rows, 1):
+        default_dedup.dedup_file(args.output, extractor, video_id, path, args.dedup)
+        if n % 100 == 0:
+            print(f"已处理 {n}/{len(rows)}")
+    if args.dedup != "record":
+        print(f"重复文件 {default_dedup.duplicates} 个，节省 {default_dedup.saved_bytes / 1024 / 1024:.1f}MB")
+    print("完成。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+音频输出配置 —— 输出格式（mp3/opus/m4a/flac）、码率、响度标准化/音量调整，以及免转码的直接封装。
+
+源音频流的编码与目标格式一致、且不需要调整音量时，直接 `-c:a copy` 换个容器封装，
+不解码也不重新编码：速度只取决于磁盘读写，也没有二次有损压缩。
+例如 YouTube 的 Opus 流输出 opus、AAC 流输出 m4a 时都走这条路径。
+"""
+
+import shutil
+import subprocess
+import sys
+from typing import List, NamedTuple, Optional
+
+from loudness import DEFAULT_TARGET_LUFS
+
+
+class _Codec(NamedTuple):
+    encoder: str           # ffmpeg 编码器
+    ext: str               # 输出文件扩展名
+    muxer: str             # ffmpeg 封装格式 (-f)
+    copy_from: tuple       # 可以直接封装（不重新编码）的源编码
+    lossless: bool = False
+
+
+CODECS = {
+    "mp3": _Codec("libmp3lame", "mp3", "mp3", ("mp3",)),
+    "opus": _Codec("libopus", "opus", "ogg", ("opus",)),
+    "m4a": _Codec("aac", "m4a", "ipod", ("aac", "mp4a")),
+    "flac": _Codec("flac", "flac", "flac", ("flac",), lossless=True),
+}
+
+
+# 找不到 ffmpeg 时转码步骤返回的错误信息；retry.classify_error 把它归为永久错误，不再重试
+FFMPEG_MISSING = "缺少 ffmpeg，无法转码"
+
+
+def require_ffmpeg():
+    """
+    入口脚本启动时调用：PATH 中找不到 ffmpeg 时打印安装提示并退出，
+    而不是等到下载完每个音频流后才逐个报"转码失败"。
+    """
+    if shutil.which("ffmpeg") is None:
+        print("错误：找不到 ffmpeg。请在 conda 环境中运行 'conda install -c conda-forge ffmpeg' 来安装，"
+              "或把 ffmpeg 所在目录加入 PATH。")
+        sys.exit(1)
+
+
+def normalize_codec(acodec: Optional[str]) -> Optional[str]:
+    """yt-dlp/ffprobe 的编码名归一化：'mp4a.40.2' -> 'mp4a'，'none' -> None。"""
+    if not acodec:
+        return None
+    codec = acodec.split(".")[0].strip().lower()
+    return None if codec in ("", "none") else codec
+
+
+def probe_audio_codec(path: str) -> Optional[str]:
+    """用 ffprobe 读取第一条音轨的编码名；没有 ffprobe 或读取失败时返回 None。"""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, text=True, encoding="utf-8", errors="replace",
+    )
+    if result.returncode != 0:
+        return None
+    return normalize_codec(result.stdout.strip())
+
+
+class AudioProfile(NamedTuple):
+    """
+    音频输出配置。
+
+    :param codec: 输出格式，CODECS 中的一个。
+    :param bitrate: 码率 (kbps)，无损格式忽略。
+    :param volume: 音量倍数，1.0 表示不调整；启用 loudnorm 时忽略。
+    :param stream_copy: 源编码与输出格式一致且不调整音量时，是否直接封装而不重新编码。
+    :param loudnorm: EBU R128 响度标准化的目标响度 (LUFS)，None 表示不标准化（见 loudness.py）。
+    """
+    codec: str = "mp3"
+    bitrate: Optional[int] = 192
+    volume: float = 1.0
+    stream_copy: bool = True
+    loudnorm: Optional[float] = None
+
+    @property
+    def ext(self) -> str:
+        return CODECS[self.codec].ext
+
+    @property
+    def needs_filter(self) -> bool:
+        if self.loudnorm is not None:
+            return True
+        return bool(self.volume) and self.volume != 1.0
+
+    def can_copy(self, src_codec: Optional[str]) -> bool:
+        """源编码为 src_codec 时能否直接封装。"""
+        return (
+            self.stream_copy
+            and not self.needs_filter
+            and normalize_codec(src_codec) in CODECS[self.codec].copy_from
+        )
+
+    def ffmpeg_args(self, src_codec: Optional[str] = None, gain_db: Optional[float] = None) -> List[str]:
+        """
+        输入之后、输出路径之前的 ffmpeg 参数（编码器/码率/滤镜/封装格式）。
+
+        :param gain_db: 响度标准化时由测量结果算出的增益（见 loudness.normalization_gain）；
+                        测量失败时为 None，按原音量编码。
+        """
+        codec = CODECS[self.codec]
+        if self.can_copy(src_codec):
+            return ["-c:a", "copy", "-f", codec.muxer]
+        args = ["-c:a", codec.encoder]
+        if self.bitrate and not codec.lossless:
+            args += ["-b:a", f"{self.bitrate}k"]
+        if self.loudnorm is not None:
+            if gain_db:
+                args += ["-af", f"volume={gain_db:+.2f}dB"]
+        elif self.needs_filter:
+            args += ["-af", f"volume={self.volume}"]
+        return args + ["-f", codec.muxer]
+
+    def ytdlp_postprocessor(self) -> dict:
+        """
+        对应的 yt-dlp FFmpegExtractAudio 配置（编码一致时 yt-dlp 同样会直接封装）。
+
+        只适用于不调整音量且允许直接封装的配置：FFmpegExtractAudio 在源编码与目标一致时总是 -c:a copy，
+        扩展名一致时甚至跳过转换，其他配置应下载原始音频流后交给 ffmpeg_args（见 main.download_media）。
+        """
+        pp = {"key": "FFmpegExtractAudio", "preferredcodec": self.codec}
+        if self.bitrate and not CODECS[self.codec].lossless:
+            pp["preferredquality"] = str(self.bitrate)
+        return pp
+
+    def describe(self) -> str:
+        parts = [self.codec]
+        if self.bitrate and not CODECS[self.codec].lossless:
+            parts.append(f"{self.bitrate}k")
+        if self.loudnorm is not None:
+            parts.append(f"响度标准化 {self.loudnorm:g} LUFS")
+        elif self.needs_filter:
+            parts.append(f"音量 x{self.volume:g}")
+        if self.stream_copy and not self.needs_filter:
+            parts.append("编码一致时直接封装")
+        return ", ".join(parts)
+
+
+def add_profile_arguments(parser, default_volume: float = 1.0, default_loudnorm: Optional[float] = None):
+    """给命令行加上 --audio-format / --audio-bitrate / --loudnorm / --volume / --no-stream-copy。"""
+    parser.add_argument(
+        "--audio-format",
+        choices=sorted(CODECS),
+        default="mp3",
+        help="音频输出格式 (默认为 mp3)。源音频编码相同且不调音量时直接封装、不重新编码，\n"
+             "例如 YouTube 的 Opus 流选 opus、AAC 流选 m4a。"
+    )
+    parser.add_argument("--audio-bitrate", type=int, default=192, help="有损格式的码率 kbps (默认为 192)。")
+    loudnorm_default = "不标准化" if default_loudnorm is None else f"{default_loudnorm:g}"
+    parser.add_argument(
+        "--loudnorm",
+        metavar="LUFS",
+        type=float,
+        default=default_loudnorm,
+        help=f"按 EBU R128 把每个音频标准化到目标响度 (默认为 {loudnorm_default}，常用 {DEFAULT_TARGET_LUFS:g})。\n"
+             "每个视频只测量一次并缓存在下载索引中，换格式重新转码时直接复用。"
+    )
+    parser.add_argument("--no-loudnorm", action="store_true", help="不做响度标准化，改用 --volume 的固定倍数。")
+    parser.add_argument(
+        "--volume",
+        type=float,
+        default=default_volume,
+        help=f"不做响度标准化时的音量倍数 (默认为 {default_volume:g})，1 表示不调整；调整音量时总会重新编码。"
+    )
+    parser.add_argument("--no-stream-copy", action="store_true", help="总是重新编码，不直接封装源音频流。")
+
+
+def profile_from_args(args) -> AudioProfile:
+    loudnorm = None if args.no_loudnorm else args.loudnorm
+    return AudioProfile(args.audio_format, args.audio_bitrate, args.volume, not args.no_stream_copy, loudnorm)
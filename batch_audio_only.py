@@ -1,17 +1,45 @@
 import argparse
 import os
+import shutil
 import sys
-import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import NamedTuple, Optional
 
-from main import download_media, extra_ydl_opts_for_url, preferred_js_runtimes
-
-try:
-    import yt_dlp
-except ImportError:
-    print("错误：yt-dlp 未安装。请在 conda 环境中运行 'conda install -c conda-forge yt-dlp' 来安装。")
-    sys.exit(1)
+from audio_dedup import add_dedup_arguments, configure_dedup_from_args, default_dedup
+from audio_profile import FFMPEG_MISSING, AudioProfile, add_profile_arguments, profile_from_args, require_ffmpeg
+from channel_sync import ChannelSync, add_sync_arguments, is_sync_source
+from download_index import normalize_extractor, open_index
+from host_scheduler import HostScheduler, is_throttle_error, parse_host_limit
+from job_journal import JobJournal
+from loudness import DEFAULT_TARGET_LUFS, cached_loudness
+from js_challenge import enable_js_challenge_cache, js_cache_stats_line
+from links_input import STDIN_PATH, iter_links, make_seen_filter
+from main import (
+    audio_path_for,
+    expected_audio_path,
+    extract_audio_from_file,
+    extract_media_info,
+    fetch_audio,
+    is_single_video,
+    playlist_entry_urls,
+    YtdlpErrorCollector,
+)
+from metrics import add_metrics_arguments, configure_from_args, default_metrics
+from pipeline import FetchResult, StagedPipeline
+from progress import add_progress_arguments, default_progress
+from retry import (
+    ERROR_CLASS_LABELS,
+    PERMANENT,
+    POSTPROCESS,
+    TRANSIENT,
+    RetryStats,
+    call_with_retry,
+    classify_error,
+)
+from segmented import add_segmented_arguments, configure_segmented_from_args, default_connections
+from url_canon import canonicalize_url, unique_canonical_urls
+from ydl_pool import default_pool, require_yt_dlp
 
 # 在 Windows 的默认 GBK 控制台下，某些 Unicode 字符（例如 ✓/✗）会触发编码异常并导致脚本中断。
 # 这里尽量把标准输出切到 UTF-8；若环境不支持则忽略，后续打印也避免使用特殊符号。
@@ -22,69 +50,284 @@ except Exception:
     pass
 
 
-# 创建线程锁用于线程安全的打印
-print_lock = threading.Lock()
+# 默认输出：MP3 192k，按 EBU R128 标准化到统一响度（测量结果按视频 ID 缓存，见 loudness.py）
+DEFAULT_PROFILE = AudioProfile(loudnorm=DEFAULT_TARGET_LUFS)
 
 
 def safe_print(*args, **kwargs):
-    """线程安全的打印函数"""
-    with print_lock:
-        print(*args, **kwargs)
+    """线程安全的打印：交给 progress.default_progress 的渲染线程输出，调用方不会阻塞在终端上。"""
+    default_progress.log(*args, **kwargs)
+
+
+class TranscodeJob(NamedTuple):
+    """转码阶段的任务：把 src_path 的原始音频流按 profile 转成 dst_path，并登记到下载索引。"""
+    src_path: str
+    dst_path: str
+    output_dir: str
+    extractor: str
+    video_id: Optional[str]
+    force_overwrites: bool
+    profile: AudioProfile = DEFAULT_PROFILE
+    src_codec: Optional[str] = None  # yt-dlp 报告的源音频编码，用于判断能否直接封装
+    dedup: str = "off"  # 转码完成后的去重模式（见 audio_dedup.py）；进程池转码时随任务带到子进程
+
+    @classmethod
+    def from_record(cls, values) -> "TranscodeJob":
+        """从任务日志中的 JSON 列表恢复（profile 在日志里是普通列表）。"""
+        job = cls(*values)
+        return job._replace(profile=AudioProfile(*job.profile))
+
+
+def local_check(url, output_dir, force_overwrites=False, journal=None,
+                profile: AudioProfile = DEFAULT_PROFILE) -> Optional[FetchResult]:
+    """
+    不联网的跳过检查：断点续传记录（停在转码阶段的条目）和本地下载索引。
+
+    流水线在条目进入站点调度器之前调用它（StagedPipeline 的 precheck_fn），命中的条目不占站点的并发和令牌。
+
+    :return: 命中时返回结论（已存在 / 可直接转码），否则返回 None。
+    """
+    # 上次运行已下载完原始音频流、停在转码阶段：原始文件都还在就直接从转码继续
+    record = journal.record(url) if journal is not None else None
+    if record and record.get('state') == 'transcoding' and record.get('jobs'):
+        jobs = tuple(TranscodeJob.from_record(job) for job in record['jobs'])
+        if all(os.path.exists(job.src_path) for job in jobs):
+            return FetchResult("成功", None, jobs)
+
+    # 本地下载索引：从 URL 直接解析视频 ID，命中则无需任何网络请求
+    if not force_overwrites:
+        indexed_path = open_index(output_dir).lookup_url(url, 'audio')
+        # 索引里是其他格式的文件时不算命中（换了 --audio-format 需要重新生成）；
+        # 去重时索引可能指向其他来源的同一首歌，格式不同也算已下载
+        if indexed_path and (indexed_path.endswith('.' + profile.ext) or default_dedup.enabled):
+            return FetchResult("已存在", os.path.basename(indexed_path))
+    return None
+
+
+def check_stage(url, output_dir, cookie_file=None, force_overwrites=False, journal=None, expand_playlists=False,
+                profile: AudioProfile = DEFAULT_PROFILE, sync: Optional[ChannelSync] = None):
+    """
+    跳过检查与元数据提取：断点续传记录、本地索引（零网络，见 local_check）、提取 info_dict 后检查目标文件是否已存在。
+
+    :param expand_playlists: 播放列表不整体下载，而是返回 "展开" 结果，children 为各条目链接。
+    :param profile: 音频输出配置，决定目标文件的扩展名。
+    :param sync: 增量同步状态；展开频道/UP 主空间时只返回比高水位新的条目（可能为空），其他播放列表照常完整展开。
+
+    :return: (result, info, logger)。result 不为 None 时该条目已有结论（已存在/可直接转码/被限流），
+             否则应把 info 和 logger 交给 download_stage 继续下载。
+    """
+    logger = YtdlpErrorCollector()
+
+    result = local_check(url, output_dir, force_overwrites, journal, profile)
+    if result is not None:
+        return result, None, logger
+
+    # 元数据只提取一次：既用于存在性检查，也直接用于下载
+    if journal is not None:
+        journal.mark(url, 'extracting')
+    info = None
+    try:
+        info = extract_media_info(url, cookie_file=cookie_file, logger=logger)
+    except Exception:
+        pass
+    # 提取阶段就被限流/风控时直接返回错误，由调度器对该站点退避后重试，不再重复请求
+    if info is None and is_throttle_error(logger.last_error):
+        return FetchResult("错误", logger.last_error), None, logger
+
+    # 播放列表展开成独立条目，各自做跳过检查、重试和进度统计，共享全部下载 worker
+    if expand_playlists and sync is not None and is_sync_source(info):
+        children = sync.new_entries(url, info)
+        if journal is not None:
+            journal.mark(url, 'expanded', entries=len(children))
+        return FetchResult("展开", f"{len(children)} 个新条目", children=tuple(children)), info, logger
+    if expand_playlists:
+        children = playlist_entry_urls(info)
+        if children and children != [url]:
+            if journal is not None:
+                journal.mark(url, 'expanded', entries=len(children))
+            return FetchResult("展开", f"{len(children)} 个条目", children=tuple(children)), info, logger
+
+    # 如果不是强制覆盖，检查音频文件是否已存在
+    if not force_overwrites and is_single_video(info):
+        try:
+            expected_path = expected_audio_path(info, output_dir, profile.ext)
+            if os.path.exists(expected_path):
+                # 顺手补登记到索引，下次运行即可零网络跳过
+                open_index(output_dir).record(
+                    normalize_extractor(info.get('extractor_key')), info['id'], 'audio', expected_path
+                )
+                return FetchResult("已存在", os.path.basename(expected_path)), info, logger
+            # 同一首歌已从其他来源下载过（标题与时长相同）：不再下载
+            duplicate = default_dedup.check_metadata(
+                output_dir, normalize_extractor(info.get('extractor_key')), info['id'], info.get('title'),
+                info.get('duration'), expected_path,
+            )
+            if duplicate:
+                return FetchResult("已存在", f"{os.path.basename(duplicate)}（与已下载的音频相同）"), info, logger
+        except Exception:
+            pass
+
+    return None, info, logger
+
+
+def download_stage(url, info, logger, output_dir, cookie_file=None, force_overwrites=False, journal=None,
+                   profile: AudioProfile = DEFAULT_PROFILE) -> FetchResult:
+    """只下载原始音频流（复用 check_stage 提取的 info），返回需要转码的 TranscodeJob。"""
+    if journal is not None:
+        journal.mark(url, 'downloading')
+    files = fetch_audio(
+        url, output_dir, cookie_file=cookie_file, force_overwrites=force_overwrites, info=info, logger=logger
+    )
+    if not files:
+        return FetchResult("错误", logger.last_error or "未下载到任何音频流")
+
+    jobs = tuple(
+        TranscodeJob(
+            src_path,
+            audio_path_for(src_path, output_dir, profile.ext),
+            output_dir,
+            normalize_extractor(file_info.get('extractor_key')),
+            file_info.get('id'),
+            force_overwrites,
+            profile,
+            file_info.get('acodec'),
+            default_dedup.mode,
+        )
+        for file_info, src_path in files
+    )
+    if journal is not None:
+        journal.mark(url, 'transcoding', jobs=[list(job) for job in jobs])
+    return FetchResult("成功", None, jobs)
+
+
+def fetch_stage(url, output_dir, cookie_file=None, force_overwrites=False, journal=None,
+                expand_playlists=False, profile: AudioProfile = DEFAULT_PROFILE,
+                sync: Optional[ChannelSync] = None) -> FetchResult:
+    """
+    流水线第一级（网络）：跳过检查 + 只下载原始音频流，不做转码。
+
+    :param journal: 可选的 JobJournal，记录 extracting/downloading/transcoding 状态以便断点续传。
+    :param expand_playlists: 播放列表展开为 children 返回，而不是在本线程内整体下载。
+    :param profile: 音频输出配置（格式/码率/音量）。
+    :param sync: 增量同步状态（见 channel_sync.py），None 表示完整展开播放列表。
+    :return: FetchResult；需要转码的文件以 TranscodeJob 的形式放在 jobs 中。
+    """
+    result, info, logger = check_stage(
+        url, output_dir, cookie_file, force_overwrites, journal, expand_playlists, profile, sync
+    )
+    if result is not None:
+        return result
+    return download_stage(url, info, logger, output_dir, cookie_file, force_overwrites, journal, profile)
+
+
+def fetch_with_retry(url, output_dir, cookie_file=None, force_overwrites=False, journal=None,
+                     retry_stats=None, expand_playlists=False,
+                     profile: AudioProfile = DEFAULT_PROFILE, sync: Optional[ChannelSync] = None) -> FetchResult:
+    """
+    带重试的 fetch_stage：临时错误退避后在本线程重试，永久错误立即失败；
+    限流错误直接返回，由 HostScheduler 对整个站点退避后重新排队。
+    """
+    def on_retry(attempt, error_class, error, delay):
+        if retry_stats is not None:
+            retry_stats.add(url)
+        safe_print(f"  {ERROR_CLASS_LABELS[error_class]}，{delay:.1f} 秒后第 {attempt} 次重试: {url}")
+
+    return call_with_retry(
+        lambda: fetch_stage(url, output_dir, cookie_file, force_overwrites, journal, expand_playlists, profile, sync),
+        lambda result: result.extra if result.status == "错误" else None,
+        retry_classes=(TRANSIENT,),
+        on_retry=on_retry,
+    )
+
+
+def transcode_stage(job: TranscodeJob) -> Optional[str]:
+    """
+    流水线第二级（CPU）：ffmpeg 按 job.profile 转码（编码一致且不调音量时直接封装），成功后删除原始流并登记索引。
+    转码失败时原始流仍在，只重试转码这一步。
+
+    :return: 出错时返回错误信息，成功返回 None。
+    """
+    return call_with_retry(lambda: _transcode_once(job), lambda error: error, retry_classes=(POSTPROCESS,))
+
+
+def _transcode_once(job: TranscodeJob) -> Optional[str]:
+    if shutil.which('ffmpeg') is None:
+        return f"{FFMPEG_MISSING}: {os.path.basename(job.src_path)}"
+    loudness = None
+    if job.profile.loudnorm is not None and os.path.exists(job.src_path):
+        loudness = cached_loudness(job.output_dir, job.extractor, job.video_id, job.src_path)
+    if not extract_audio_from_file(
+        job.src_path, job.dst_path, force_overwrites=job.force_overwrites, remove_source=True,
+        profile=job.profile, src_codec=job.src_codec, loudness=loudness,
+    ):
+        return f"转码失败: {os.path.basename(job.src_path)}"
+    safe_print(f"处理完成: {os.path.basename(job.dst_path)}")
+    if job.video_id:
+        open_index(job.output_dir).record(job.extractor, job.video_id, 'audio', job.dst_path)
+        default_dedup.dedup_file(job.output_dir, job.extractor, job.video_id, job.dst_path, job.dedup)
+    return None
+
+
+def expand_children(parent_url, children, seen=None, journal=None):
+    """
+    过滤播放列表展开出的条目：按 (站点, 视频ID) 与已有条目去重，跳过任务日志中已完成的条目。
+
+    与父链接规范键相同的条目（例如 B 站多 P 视频的 ?p=1）保留原始链接，否则会再次被当作整个列表。
+    """
+    parent_key = canonicalize_url(parent_url, resolve_short_links=False).key
+    for child in children:
+        canon = canonicalize_url(child, resolve_short_links=False)
+        if canon.key == parent_key:
+            url = child
+        elif seen is None or seen.add(canon.key):
+            url = canon.url
+        else:
+            continue
+        if journal is not None:
+            state = journal.state(url)
+            if state == 'done':
+                continue
+            if state is None:
+                journal.mark(url, 'queued', parent=parent_url)
+        yield url
 
 
-def download_single_url(url, output_dir, cookie_file=None, force_overwrites=False):
+def download_single_url(url, output_dir, cookie_file=None, force_overwrites=False,
+                        profile: AudioProfile = DEFAULT_PROFILE):
     """
-    下载单个 URL 的音频文件。这个函数将在线程池中被调用。
+    下载单个 URL 的音频文件（在当前线程内依次执行下载与转码两级）。
     
     :param url: 要下载的 URL
     :param output_dir: 输出目录
     :param cookie_file: Cookie 文件路径
     :param force_overwrites: 是否强制覆盖已存在的文件
+    :param profile: 音频输出配置
     :return: 包含 URL 和下载结果的元组
     """
     start_time = time.time()
     
     try:
-        # 如果不是强制覆盖，检查音频文件是否已存在
-        if not force_overwrites:
-            check_opts = {
-                'quiet': True,
-                'ignoreerrors': True,
-                'extract_flat': 'in_playlist',
-            }
-            js_rt = preferred_js_runtimes()
-            if js_rt:
-                check_opts['js_runtimes'] = js_rt
-            if cookie_file:
-                check_opts['cookiefile'] = cookie_file
-            check_opts.update(extra_ydl_opts_for_url(url))
-            try:
-                with yt_dlp.YoutubeDL(check_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    if info and info.get('_type') != 'playlist':
-                        audio_info = info.copy()
-                        audio_info['ext'] = 'mp3'
-                        
-                        audio_path_template = os.path.join(output_dir, 'audios', '%(title)s [%(id)s].%(ext)s')
-                        expected_audio_path = ydl.prepare_filename(audio_info, outtmpl=audio_path_template)
-                        
-                        if os.path.exists(expected_audio_path):
-                            return (url, "已存在", os.path.basename(expected_audio_path), 0)
-            except Exception:
-                pass
-
-        # 下载音频
-        download_media(
-            url,
-            output_dir,
-            download_video=False,  # 固定为只下载音频
-            download_audio=True,
-            cookie_file=cookie_file,
-            force_overwrites=force_overwrites,
-            audio_volume_multiplier=3  # 音量增加50%
-        )
-        
+        result = fetch_with_retry(url, output_dir, cookie_file, force_overwrites, expand_playlists=True, profile=profile)
+        if result.status == "已存在":
+            return (url, "已存在", result.extra, 0)
+        if result.children:
+            child_errors = [
+                f"{child}: {extra}"
+                for child, status, extra, _ in (
+                    download_single_url(child, output_dir, cookie_file, force_overwrites, profile)
+                    for child in expand_children(url, result.children)
+                )
+                if status == "错误"
+            ]
+            elapsed_time = time.time() - start_time
+            if child_errors:
+                return (url, "错误", "; ".join(child_errors), elapsed_time)
+            return (url, "成功", None, elapsed_time)
+
+        errors = [error for error in map(transcode_stage, result.jobs) if error]
         elapsed_time = time.time() - start_time
+        if result.status == "错误" or errors:
+            return (url, "错误", result.extra or "; ".join(errors), elapsed_time)
         return (url, "成功", None, elapsed_time)
         
     except Exception as e:
@@ -97,30 +340,107 @@ def batch_download_audio_only(
     output_dir,
     cookie_file=None,
     force_overwrites=False,
-    max_workers=4
+    max_workers=4,
+    transcode_workers=None,
+    queue_size=None,
+    transcode_processes=False,
+    host_limits=None,
+    fresh=False,
+    retry_failed_passes=1,
+    bloom_capacity=None,
+    js_worker=False,
+    audio_profile=None,
+    progress="auto",
+    sync=False,
+    sync_max_new=None,
 ):
     """
-    从文本文件中读取 URL 列表，并使用多线程批量下载音频。
+    从文本文件中读取 URL 列表，用“下载 / 转码”两级流水线批量下载音频。
 
     :param file_path: 包含 URL 的文本文件路径。
     :param output_dir: 输出的根目录。
     :param cookie_file: Cookie 文件的路径。
     :param force_overwrites: 是否强制覆盖已存在的文件。
-    :param max_workers: 最大线程数。
+    :param max_workers: 下载阶段的线程数。
+    :param transcode_workers: 转码阶段的 worker 数，默认等于 CPU 核数。
+    :param queue_size: 两级之间待转码队列的容量，默认为转码 worker 数的 2 倍。
+    :param transcode_processes: 转码阶段是否使用进程池。
+    :param host_limits: 按站点覆盖默认并发/限速策略，{站点: HostPolicy}。
+    :param fresh: 忽略该 links 文件已有的任务日志，从头开始（默认断点续传）。
+    :param retry_failed_passes: 全部处理完后，对非永久性失败的 URL 再重试的轮数。
+    :param bloom_capacity: 给出预计的链接数时用固定内存的布隆过滤器去重（适合数百万行的输入）。
+    :param js_worker: 是否用常驻 node 进程求解 YouTube JS 挑战（挑战结果和预处理播放器总会缓存）。
+    :param audio_profile: 音频输出格式/码率/音量（AudioProfile），默认 DEFAULT_PROFILE。
+    :param progress: 进度显示方式，见 progress.PROGRESS_MODES。
+    :param sync: 增量同步频道/UP 主空间，只下载上次同步之后的新上传（见 channel_sync.py）。
+    :param sync_max_new: 同步时每个来源最多取的新条目数。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-    except FileNotFoundError:
+    audio_profile = audio_profile or DEFAULT_PROFILE
+    if file_path != STDIN_PATH and not os.path.isfile(file_path):
         print(f"错误: 文件 '{file_path}' 未找到。")
         sys.exit(1)
 
-    if not urls:
-        print(f"文件 '{file_path}' 为空或不包含有效的 URL。")
-        return
+    # 任务日志：记录每个 URL 的状态，中断后重新运行同一命令只处理未完成的条目
+    journal = JobJournal.for_links_file(output_dir, file_path)
+    if fresh:
+        journal.reset()
+    enable_js_challenge_cache(output_dir, persistent_worker=js_worker)
+    channel_sync = ChannelSync(output_dir, sync_max_new) if sync else None
 
-    print(f"从 '{file_path}' 中找到 {len(urls)} 个 URL。使用 {max_workers} 个线程开始批量下载音频...")
+    # 输入全程是生成器：边读文件、边按 (站点, 视频ID) 去重、边跳过已完成条目、边交给调度器，
+    # 第一条链接不必等整个文件读完就开始下载，内存占用也不随列表长度增长
+    seen = make_seen_filter(bloom_capacity)
+    input_counts = {"queued": 0, "resumed": 0, "children": 0, "exhausted": False}
+
+    def stream_urls():
+        for item in unique_canonical_urls(iter_links(file_path), seen=seen):
+            if journal.state(item) == 'done':
+                input_counts["resumed"] += 1
+                continue
+            if journal.state(item) is None:
+                journal.mark(item, 'queued')
+            input_counts["queued"] += 1
+            yield item
+        input_counts["exhausted"] = True
+
+    def expand(parent_url, children):
+        # 播放列表展开出的条目与输入链接共用同一个去重结构和任务日志
+        for child in expand_children(parent_url, children, seen, journal):
+            input_counts["queued"] += 1
+            input_counts["children"] += 1
+            yield child
+
+    def make_pipeline():
+        return StagedPipeline(
+            partial(
+                fetch_with_retry, output_dir=output_dir, cookie_file=cookie_file,
+                force_overwrites=force_overwrites, journal=journal, retry_stats=retry_stats,
+                expand_playlists=True, profile=audio_profile, sync=channel_sync,
+            ),
+            transcode_stage,
+            download_workers=max_workers,
+            transcode_workers=transcode_workers,
+            queue_size=queue_size,
+            use_processes=transcode_processes,
+            scheduler=HostScheduler(host_limits),
+            expand_fn=expand,
+            precheck_fn=partial(local_check, output_dir=output_dir, force_overwrites=force_overwrites,
+                                journal=journal, profile=audio_profile),
+        )
+
+    retry_stats = RetryStats()
+    pipeline = make_pipeline()
+
+    print(
+        f"从 '{file_path}' 流式读取 URL。使用 {pipeline.download_workers} 个下载线程、"
+        f"{pipeline.transcode_workers} 个转码 worker 开始批量下载音频..."
+    )
     print(f"输出目录: {os.path.abspath(output_dir)}")
+    print(f"输出格式: {audio_profile.describe()}")
+    if default_connections.enabled:
+        print(f"下载连接: {default_connections.describe()}")
+    if default_dedup.enabled:
+        print(f"音频去重: {default_dedup.mode}")
     print("-" * 80)
 
     # 创建输出目录
@@ -130,47 +450,98 @@ def batch_download_audio_only(
     completed = 0
     skipped = 0
     failed = 0
-    total_time = 0
+    success_time = 0
+    recovered = 0
+    expanded = 0
+    # 失败的 URL 及最后一次的错误信息，供最后的“重试失败”轮使用
+    failures = {}
 
     # 记录开始时间
     batch_start_time = time.time()
+    default_progress.start(progress)
 
-    # 使用线程池执行下载
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        try:
-            # 提交所有下载任务
-            future_to_url = {
-                executor.submit(download_single_url, url, output_dir, cookie_file, force_overwrites): url
-                for url in urls
-            }
-
-            # 处理完成的任务
-            for future in as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    url, status, extra_info, elapsed_time = future.result()
-                    total_time += elapsed_time
-                    
-                    if status == "成功":
-                        completed += 1
-                        safe_print(f"[OK] [{completed + skipped + failed}/{len(urls)}] 下载成功 ({elapsed_time:.1f}s): {url}")
-                    elif status == "已存在":
-                        skipped += 1
-                        safe_print(f"- [{completed + skipped + failed}/{len(urls)}] 文件已存在，跳过: {extra_info}")
-                    else:  # 错误
-                        failed += 1
-                        safe_print(f"[FAIL] [{completed + skipped + failed}/{len(urls)}] 下载失败 ({elapsed_time:.1f}s): {url}")
-                        safe_print(f"  错误信息: {extra_info}")
-                        
-                except Exception as e:
-                    failed += 1
-                    safe_print(f"[FAIL] [{completed + skipped + failed}/{len(urls)}] 处理失败: {url}")
-                    safe_print(f"  错误信息: {e}")
-
-        except KeyboardInterrupt:
-            safe_print("\n下载被用户中断。正在停止所有线程...")
-            executor.shutdown(wait=True)
-            sys.exit(0)
+    def run_pass(pass_pipeline, pass_urls, label=""):
+        nonlocal completed, skipped, failed, success_time, expanded
+        done_in_pass = 0
+        children_before = input_counts["children"]
+        for url, status, extra_info, elapsed_time in pass_pipeline.run(pass_urls):
+            done_in_pass += 1
+            if isinstance(pass_urls, list):
+                pass_total = len(pass_urls) + input_counts["children"] - children_before
+                position = f"{label}{done_in_pass}/{pass_total}"
+                default_progress.set_items(done_in_pass, pass_total)
+            else:
+                # 输入还没读完时总数未知，以 “已入队数+” 显示
+                more = "" if input_counts["exhausted"] else "+"
+                position = f"{done_in_pass}/{input_counts['queued']}{more}"
+                default_progress.set_items(done_in_pass, input_counts["queued"], input_counts["exhausted"])
+            retries = retry_stats.retries(url)
+            retry_note = f", 重试 {retries} 次" if retries else ""
+            default_metrics.record_item(url, status, elapsed_time, retries)
+            if status == "展开":
+                # 列表本身不记为完成：下次运行会重新展开（可发现新加入的条目），已完成的条目按日志跳过
+                expanded += 1
+                failures.pop(url, None)
+                safe_print(f"+ [{position}] 播放列表已展开为 {extra_info}: {url}")
+                continue
+            if status == "错误":
+                journal.mark(url, 'failed', reason=extra_info)
+            else:
+                journal.mark(url, 'done')
+                failures.pop(url, None)
+
+            if status == "成功":
+                completed += 1
+                success_time += elapsed_time
+                safe_print(f"[OK] [{position}] 下载成功 ({elapsed_time:.1f}s{retry_note}): {url}")
+            elif status == "已存在":
+                skipped += 1
+                safe_print(f"- [{position}] 文件已存在，跳过: {extra_info}")
+            else:  # 错误
+                failed += 1
+                failures[url] = extra_info
+                label_text = ERROR_CLASS_LABELS[classify_error(extra_info)]
+                safe_print(f"[FAIL] [{position}] 下载失败 [{label_text}] ({elapsed_time:.1f}s{retry_note}): {url}")
+                safe_print(f"  错误信息: {extra_info}")
+
+    # 使用两级流水线执行下载与转码
+    try:
+        run_pass(pipeline, stream_urls())
+
+        # 最后对非永久性失败的条目再统一重试一轮（此时各站点的限流通常已经恢复）
+        retryable = [url for url, reason in failures.items() if classify_error(reason) != PERMANENT]
+        for _ in range(retry_failed_passes):
+            if not retryable:
+                break
+            safe_print("-" * 80)
+            safe_print(f"重试失败的 {len(retryable)} 个 URL...")
+            failed -= len(retryable)
+            before = completed + skipped
+            pipeline = make_pipeline()
+            run_pass(pipeline, retryable, label="重试 ")
+            recovered += completed + skipped - before
+            retryable = [url for url in retryable if url in failures and classify_error(failures[url]) != PERMANENT]
+
+    except KeyboardInterrupt:
+        safe_print("\n下载被用户中断。正在等待进行中的任务结束...")
+        pipeline.stop()
+        default_progress.stop()
+        journal.close()
+        safe_print("进度已保存到任务日志，重新运行同一命令即可继续。")
+        sys.exit(0)
+    default_progress.stop()
+    journal.close()
+    # 整批跑完（含重试轮）后才更新高水位，中断时不更新，下次同步重新列出
+    sync_counts = channel_sync.commit(failures) if channel_sync is not None else None
+
+    total_urls = input_counts["queued"] + input_counts["resumed"]
+    resumed_done = input_counts["resumed"]
+    if not total_urls:
+        print(f"文件 '{file_path}' 为空或不包含有效的 URL。")
+        return
+    if not input_counts["queued"]:
+        print(f"所有 URL 均已完成（任务日志中已完成 {resumed_done} 个，--fresh 可从头开始）。")
+        return
 
     # 计算总时间
     batch_elapsed_time = time.time() - batch_start_time
@@ -178,14 +549,35 @@ def batch_download_audio_only(
     # 显示最终统计
     safe_print("-" * 80)
     safe_print(f"批量音频下载完成！")
-    safe_print(f"总计: {len(urls)} 个 URL")
+    safe_print(f"总计: {total_urls} 个 URL")
+    if sync_counts is not None:
+        updated, held = sync_counts
+        safe_print(f"增量同步: 列出 {channel_sync.listed} 个来源，新条目 {input_counts['children']} 个，"
+                   f"更新高水位 {updated} 个" + (f"，{held} 个来源有失败条目、下次重新列出" if held else ""))
+    elif expanded:
+        safe_print(f"展开播放列表: {expanded} 个，新入队 {input_counts['children']} 个条目")
+    if seen.duplicates:
+        safe_print(f"合并重复链接: {seen.duplicates} 个")
+    if resumed_done:
+        safe_print(f"此前已完成: {resumed_done} 个")
     safe_print(f"成功: {completed} 个")
     safe_print(f"跳过: {skipped} 个")
     safe_print(f"失败: {failed} 个")
+    if retry_stats.total or recovered:
+        safe_print(f"重试: {retry_stats.total} 次，最后重试轮恢复 {recovered} 个")
+    if default_dedup.enabled:
+        safe_print(default_dedup.summary_line())
+    safe_print(default_pool.stats_line())
+    js_stats = js_cache_stats_line()
+    if js_stats:
+        safe_print(js_stats)
     safe_print(f"总用时: {batch_elapsed_time:.1f} 秒")
     if completed > 0:
-        safe_print(f"平均下载时间: {total_time/completed:.1f} 秒/个")
-    safe_print(f"并发效率: {max_workers} 个线程")
+        safe_print(f"平均下载时间: {success_time/completed:.1f} 秒/个（成功条目从开始下载到转码完成）")
+    for line in pipeline.stats_lines():
+        safe_print(line)
+    for line in default_metrics.summary_lines():
+        safe_print(line)
 
 
 if __name__ == '__main__':
@@ -201,9 +593,12 @@ if __name__ == '__main__':
   # 从 links.txt 批量下载音频（使用默认 8 个线程）
   python batch_audio_only.py links.txt
 
-  # 使用 8 个线程下载
+  # 使用 8 个下载线程
   python batch_audio_only.py links.txt --max-workers 8
 
+  # 16 个下载线程 + 32 个转码进程（适合多核机器）
+  python batch_audio_only.py links.txt --max-workers 16 --transcode-workers 32 --transcode-processes
+
   # 下载并强制覆盖已存在的文件
   python batch_audio_only.py links.txt --force-overwrites
 
@@ -211,7 +606,7 @@ if __name__ == '__main__':
   python batch_audio_only.py links.txt --cookies cookies.txt --output my_downloads
 """
     )
-    parser.add_argument("file", help="包含 URL 列表的文本文件路径。")
+    parser.add_argument("file", help="包含 URL 列表的文件路径（支持 .gz 和 JSONL），'-' 表示从标准输入读取。")
     parser.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
     parser.add_argument(
         "--force-overwrites",
@@ -224,11 +619,67 @@ if __name__ == '__main__':
         help="指定包含 Cookies 的文本文件路径 (Netscape 格式)。"
     )
     parser.add_argument(
-        "--max-workers",
+        "--max-workers", "--download-workers",
+        dest="max_workers",
         type=int,
         default=8,
-        help="最大线程数 (默认为 8)。增加线程数可以提高下载速度，但也会增加系统负载。"
+        help="下载线程数 (默认为 8)。增加线程数可以提高下载速度，但也会增加系统负载。"
+    )
+    parser.add_argument(
+        "--transcode-workers",
+        type=int,
+        default=None,
+        help="转码 worker 数 (默认为 CPU 核数)。"
     )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=None,
+        help="下载与转码之间的待转码队列容量 (默认为转码 worker 数的 2 倍)。队列满时下载线程会等待。"
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="忽略任务日志从头开始。默认会断点续传：跳过上次已完成的 URL，只处理未完成的条目。"
+    )
+    parser.add_argument(
+        "--retry-failed-passes",
+        type=int,
+        default=1,
+        help="全部处理完后，对失败的 URL（私有/已删除等永久错误除外）再重试的轮数 (默认为 1，0 表示不重试)。"
+    )
+    parser.add_argument(
+        "--host-limit",
+        metavar="SITE=N:RATE",
+        action="append",
+        default=[],
+        help="按站点限制并发数与每秒开始的条目数，可多次指定 (例如 bilibili=2:0.5)。\n"
+             "默认: youtube=4:2, bilibili=2:0.5, douyin=2:0.5, netease=2:1, 其他域名=4:4。"
+    )
+    parser.add_argument(
+        "--transcode-processes",
+        action="store_true",
+        help="转码阶段使用进程池而不是线程池。"
+    )
+    parser.add_argument(
+        "--bloom",
+        metavar="N",
+        type=int,
+        default=None,
+        help="预计链接数为 N 的超大输入（数百万行）时，用固定内存的布隆过滤器去重，\n"
+             "代价是极小概率把新链接误判为重复。"
+    )
+    add_profile_arguments(parser, default_loudnorm=DEFAULT_TARGET_LUFS)
+    parser.add_argument(
+        "--js-worker",
+        action="store_true",
+        help="用常驻的 node 进程求解 YouTube JS 挑战（n 参数/签名），省去每个视频启动 JS 运行时的开销。"
+    )
+    add_sync_arguments(parser)
+    add_segmented_arguments(parser)
+    add_dedup_arguments(parser)
+    add_metrics_arguments(parser)
+    add_progress_arguments(parser)
 
     args = parser.parse_args()
 
@@ -238,11 +689,46 @@ if __name__ == '__main__':
         sys.exit(1)
     elif args.max_workers > 20:
         print("警告: 使用过多线程可能会导致系统不稳定或被网站限制。建议使用 1-20 个线程。")
+    if args.transcode_workers is not None and args.transcode_workers < 1:
+        print("错误: 转码 worker 数必须大于 0。")
+        sys.exit(1)
+    if args.queue_size is not None and args.queue_size < 1:
+        print("错误: 队列容量必须大于 0。")
+        sys.exit(1)
+    if args.segments < 1 or (args.max_connections is not None and args.max_connections < 1):
+        print("错误: --segments 与 --max-connections 必须大于 0。")
+        sys.exit(1)
+    try:
+        host_limits = dict(parse_host_limit(spec) for spec in args.host_limit)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    try:
+        configure_from_args(args)
+    except OSError as e:
+        print(f"错误: 无法打开指标输出: {e}")
+        sys.exit(1)
+    require_yt_dlp()
+    require_ffmpeg()
+    configure_segmented_from_args(args)
+    configure_dedup_from_args(args)
 
     batch_download_audio_only(
         args.file,
         args.output,
         args.cookies,
         args.force_overwrites,
-        args.max_workers
+        args.max_workers,
+        args.transcode_workers,
+        args.queue_size,
+        args.transcode_processes,
+        host_limits,
+        args.fresh,
+        args.retry_failed_passes,
+        args.bloom,
+        args.js_worker,
+        profile_from_args(args),
+        args.progress,
+        args.sync,
+        args.sync_max_new,
     ) 
\ No newline at end of file
@@ -1,13 +1,15 @@
 import argparse
 import os
 import sys
-from main import download_media, preferred_js_runtimes
-
-try:
-    import yt_dlp
-except ImportError:
-    print("错误：yt-dlp 未安装。请在 conda 环境中运行 'conda install -c conda-forge yt-dlp' 来安装。")
-    sys.exit(1)
+from audio_dedup import add_dedup_arguments, configure_dedup_from_args, default_dedup
+from audio_profile import AudioProfile, add_profile_arguments, profile_from_args
+from download_index import normalize_extractor, open_index
+from js_challenge import enable_js_challenge_cache
+from links_input import STDIN_PATH, iter_links, make_seen_filter
+from main import download_media, expected_audio_path, extract_media_info, is_single_video
+from segmented import add_segmented_arguments, configure_segmented_from_args
+from url_canon import unique_canonical_urls
+from ydl_pool import require_yt_dlp
 
 def batch_download(
     file_path,
@@ -17,6 +19,10 @@ def batch_download(
     browser_cookies=None,
     cookie_file=None,
     force_overwrites=False,
+    audio_from_video=True,
+    bloom_capacity=None,
+    js_worker=False,
+    audio_profile=None,
 ):
     """
     从文本文件中读取 URL 列表并批量下载。
@@ -28,55 +34,58 @@ def batch_download(
     :param browser_cookies: 从哪个浏览器加载 cookies。
     :param cookie_file: Cookie 文件的路径。
     :param force_overwrites: 是否强制覆盖已存在的文件。
+    :param audio_from_video: 同时下载视频和音频时，是否直接从已下载的视频抽取音轨。
+    :param bloom_capacity: 给出预计的链接数时用固定内存的布隆过滤器去重。
+    :param js_worker: 是否用常驻 node 进程求解 YouTube JS 挑战。
+    :param audio_profile: 音频输出格式/码率/音量（AudioProfile），默认 MP3 192k。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-    except FileNotFoundError:
+    audio_profile = audio_profile or AudioProfile()
+    if file_path != STDIN_PATH and not os.path.isfile(file_path):
         print(f"错误: 文件 '{file_path}' 未找到。")
         sys.exit(1)
 
-    if not urls:
-        print(f"文件 '{file_path}' 为空或不包含有效的 URL。")
-        return
+    # 边读边按 (站点, 视频ID) 去重，避免同一视频的不同写法被重复下载和转码；
+    # 不预先读入整个文件，第一条链接立即开始处理
+    seen = make_seen_filter(bloom_capacity)
+    urls = unique_canonical_urls(iter_links(file_path), seen=seen)
 
-    print(f"从 '{file_path}' 中找到 {len(urls)} 个 URL。开始批量下载...")
+    enable_js_challenge_cache(output_dir, persistent_worker=js_worker)
+    print(f"从 '{file_path}' 流式读取 URL。开始批量下载...")
 
+    count = 0
     for i, url in enumerate(urls):
-        print(f"\n--- [{i+1}/{len(urls)}] 正在处理 URL: {url} ---")
+        count += 1
+        print(f"\n--- [{i+1}] 正在处理 URL: {url} ---")
         
-        # 默认行为：如果不是强制覆盖，则预先检查音频文件是否存在
+        # 先查本地下载索引：从 URL 解析视频 ID，命中则完全不联网
         if not force_overwrites and download_audio:
-            check_opts = {
-                'quiet': True,
-                'ignoreerrors': True,
-                'extract_flat': 'in_playlist', # 快速获取播放列表信息而不深入
-            }
-            js_rt = preferred_js_runtimes()
-            if js_rt:
-                check_opts['js_runtimes'] = js_rt
-            if cookie_file:
-                check_opts['cookiefile'] = cookie_file
-            elif browser_cookies:
-                check_opts['cookiesfrombrowser'] = (browser_cookies,)
-            
+            indexed_path = open_index(output_dir).lookup_url(url, 'audio')
+            # 索引里是其他格式的文件时不算命中（换了 --audio-format 需要重新生成）；
+            # 去重时索引可能指向其他来源的同一首歌，格式不同也算已下载
+            if indexed_path and (indexed_path.endswith('.' + audio_profile.ext) or default_dedup.enabled):
+                print(f"音频文件已存在（索引命中），跳过：{os.path.basename(indexed_path)}")
+                continue
+
+        # 元数据只提取一次：预检查与视频/音频两个阶段共用同一个 info_dict
+        info = None
+        try:
+            info = extract_media_info(url, browser_cookies, cookie_file)
+        except Exception:
+            # 如果预提取失败，没关系，继续执行下载，让下载器自己处理
+            pass
+
+        # 默认行为：如果不是强制覆盖，则预先检查音频文件是否存在
+        # 仅对单个视频进行检查，播放列表由下载器内部处理
+        if not force_overwrites and download_audio and is_single_video(info):
             try:
-                with yt_dlp.YoutubeDL(check_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    # 仅对单个视频进行检查，播放列表由下载器内部处理
-                    if info and info.get('_type') != 'playlist':
-                        audio_info = info.copy()
-                        audio_info['ext'] = 'mp3'
-                        
-                        # 构建预期的音频文件路径
-                        audio_path_template = os.path.join(output_dir, 'audios', '%(title)s [%(id)s].%(ext)s')
-                        expected_audio_path = ydl.prepare_filename(audio_info, outtmpl=audio_path_template)
-                        
-                        if os.path.exists(expected_audio_path):
-                            print(f"音频文件已存在，跳过：{os.path.basename(expected_audio_path)}")
-                            continue # 继续下一个 URL
+                expected_path = expected_audio_path(info, output_dir, audio_profile.ext)
+                if os.path.exists(expected_path):
+                    open_index(output_dir).record(
+                        normalize_extractor(info.get('extractor_key')), info['id'], 'audio', expected_path
+                    )
+                    print(f"音频文件已存在，跳过：{os.path.basename(expected_path)}")
+                    continue # 继续下一个 URL
             except Exception:
-                # 如果预检查失败，没关系，继续执行下载，让下载器自己处理
                 pass
 
         try:
@@ -87,7 +96,10 @@ def batch_download(
                 download_audio,
                 browser_cookies,
                 cookie_file,
-                force_overwrites
+                force_overwrites,
+                info=info,
+                audio_from_video=audio_from_video,
+                audio_profile=audio_profile,
             )
         except Exception as e:
             print(f"处理 URL {url} 时发生未知严重错误: {e}")
@@ -95,6 +107,13 @@ def batch_download(
             print("\n下载被用户中断。")
             sys.exit(0)
     
+    if not count:
+        print(f"文件 '{file_path}' 为空或不包含有效的 URL。")
+        return
+    if seen.duplicates:
+        print(f"已合并 {seen.duplicates} 个重复链接。")
+    if default_dedup.enabled:
+        print(default_dedup.summary_line())
     print("\n--- 批量下载完成 ---")
 
 
@@ -116,10 +135,15 @@ if __name__ == '__main__':
   python batch_download.py links.txt -o my_collection
 """
     )
-    parser.add_argument("file", help="包含 URL 列表的文本文件路径。")
+    parser.add_argument("file", help="包含 URL 列表的文件路径（支持 .gz 和 JSONL），'-' 表示从标准输入读取。")
     parser.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
     parser.add_argument("--no-video", action="store_true", help="不下载视频文件")
     parser.add_argument("--no-audio", action="store_true", help="不提取音频文件")
+    parser.add_argument(
+        "--audio-from-network",
+        action="store_true",
+        help="同时下载视频和音频时，音频也单独联网下载（默认直接从已下载的视频中抽取音轨）。"
+    )
     parser.add_argument(
         "--force-overwrites",
         action="store_true",
@@ -135,6 +159,17 @@ if __name__ == '__main__':
         metavar="BROWSER",
         help="从指定浏览器加载 Cookies (例如: chrome, firefox, edge, opera)。对抖音等网站可能需要此选项。"
     )
+    parser.add_argument(
+        "--bloom",
+        metavar="N",
+        type=int,
+        default=None,
+        help="预计链接数为 N 的超大输入时，用固定内存的布隆过滤器去重。"
+    )
+    add_profile_arguments(parser)
+    parser.add_argument("--js-worker", action="store_true", help="用常驻的 node 进程求解 YouTube JS 挑战（n 参数/签名），省去每个视频启动 JS 运行时的开销。")
+    add_segmented_arguments(parser)
+    add_dedup_arguments(parser)
 
     args = parser.parse_args()
 
@@ -144,6 +179,9 @@ if __name__ == '__main__':
     if not should_download_video and not should_download_audio:
         print("错误: 您必须选择下载视频或音频中的至少一项。")
         sys.exit(1)
+    require_yt_dlp()
+    configure_segmented_from_args(args)
+    configure_dedup_from_args(args)
 
     batch_download(
         args.file,
@@ -152,5 +190,9 @@ if __name__ == '__main__':
         should_download_audio,
         args.cookies_from_browser,
         args.cookies,
-        args.force_overwrites
+        args.force_overwrites,
+        audio_from_video=not args.audio_from_network,
+        bloom_capacity=args.bloom,
+        js_worker=args.js_worker,
+        audio_profile=profile_from_args(args),
     )
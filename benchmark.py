@@ -0,0 +1,453 @@
+"""
+离线基准测试 —— 不访问任何真实站点，衡量批量流水线随 worker 数、列表长度、站点组合的扩展情况。
+
+本地起一个 HTTP 替身服务，提供合成的音频文件（默认生成一段正弦波 WAV，也可用 --fixture 指定真实音频），
+由 yt-dlp 的 generic 提取器当作直链媒体处理；可配置每个请求的延迟、单连接带宽和错误率：
+- --error-rate   ：返回 503 的请求比例（临时错误，会被重试）
+- --throttle-rate：返回 429 的请求比例（限流，交给站点调度器退避）
+- --missing-rate ：固定返回 404 的条目比例（永久错误）
+- --sites N      ：把条目分散到 127.0.0.1 ~ 127.0.0.N 这 N 个“站点”（按域名分别调度，仅 Linux/Windows）
+替身服务和 CDN 一样支持 Range 请求，带宽限制按单个连接计算，可用来对比 --segments 分段下载的效果。
+
+每组配置在独立的子进程里跑真实的代码路径（audio 模式为 batch_download_audio_only 的流水线，
+media 模式为按 --workers 个线程并发调用 main.download_media），统计吞吐、单条目耗时的 p50/p99、
+CPU 时间（含 ffmpeg 子进程）和峰值内存，便于对比调度或转码改动前后是否有退化。
+
+用法：
+  # 200 个条目，分别用 1/4/8 个下载线程
+  python benchmark.py --items 200 --workers 1,4,8
+
+  # 模拟高延迟、限速 2MB/s、5% 的 503，分散到 3 个站点，结果存为基线
+  python benchmark.py --items 100 --latency 0.2 --bandwidth 2M --error-rate 0.05 --sites 3 --json base.json
+
+  # 改动后与基线对比
+  python benchmark.py --items 100 --latency 0.2 --bandwidth 2M --error-rate 0.05 --sites 3 --compare base.json
+
+  # 单连接限速 1MB/s 时，每个文件分 4 段下载（2 分钟的 WAV 约 20MB）
+  python benchmark.py --items 20 --duration 120 --bandwidth 1M --segments 4 --max-connections 16
+"""
+
+import argparse
+import http.server
+import json
+import math
+import os
+import random
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from typing import Dict, List, Optional
+
+# 写入带宽限制时每次发送的块大小
+CHUNK_SIZE = 64 * 1024
+
+MODES = ("audio", "media")
+
+
+def make_fixture_wav(path: str, seconds: float = 30.0, sample_rate: int = 44100):
+    """生成一段双声道 16 bit 的 440Hz 正弦波 WAV，作为合成的“音频流”。"""
+    frames = int(seconds * sample_rate)
+    period = [int(12000 * math.sin(2 * math.pi * 440 * i / sample_rate)) for i in range(sample_rate // 440 * 440)]
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        block = b"".join(struct.pack("<hh", s, s) for s in period)
+        samples_per_block = len(period)
+        for start in range(0, frames, samples_per_block):
+            n = min(samples_per_block, frames - start)
+            w.writeframes(block[:n * 4])
+
+
+def parse_size(text: str) -> float:
+    """'2M' / '500k' / '1048576' -> 字节数；0 表示不限速。"""
+    text = text.strip().upper()
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法的百分位数；没有数据时返回 None。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class StandInServer:
+    """
+    媒体站点替身：GET/HEAD /media/<名字>.<扩展名> 返回同一份 fixture 文件（支持单个 Range）。
+
+    错误按 seed 决定，同一组参数每次运行的错误序列相同（并发下请求到达顺序不同，只保证比例一致）。
+    """
+
+    def __init__(self, fixture: str, hosts: List[str], latency=0.0, bandwidth=0.0,
+                 error_rate=0.0, throttle_rate=0.0, missing_rate=0.0, seed=0):
+        with open(fixture, "rb") as f:
+            self.body = f.read()
+        self.ext = os.path.splitext(fixture)[1].lstrip(".") or "wav"
+        self.content_type = {"wav": "audio/wav", "mp3": "audio/mpeg", "m4a": "audio/mp4",
+                             "opus": "audio/ogg", "ogg": "audio/ogg", "flac": "audio/flac"}.get(self.ext, "audio/wav")
+        self.hosts = hosts
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.missing_rate = missing_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self._servers: List[http.server.ThreadingHTTPServer] = []
+        self.port = 0
+
+    def is_missing(self, name: str) -> bool:
+        return random.Random(f"{self.seed}:{name}").random() < self.missing_rate
+
+    def _draw_error(self) -> Optional[int]:
+        with self._lock:
+            self.requests += 1
+            r = self._random.random()
+        if r < self.error_rate:
+            return 503
+        if r < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+    def start(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, send_body: bool):
+                if server.latency:
+                    time.sleep(server.latency)
+                name = self.path.split("?", 1)[0].rsplit("/", 1)[-1]
+                if not self.path.startswith("/media/") or server.is_missing(name):
+                    self.send_error(404)
+                    return
+                status = server._draw_error()
+                if status:
+                    self.send_error(status)
+                    return
+                size = len(server.body)
+                start, end = 0, size - 1
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+                if match and int(match.group(1)) < size:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Type", server.content_type)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                if send_body:
+                    self._send_body(memoryview(server.body)[start:end + 1])
+
+            def _send_body(self, body: memoryview):
+                started = time.monotonic()
+                for offset in range(0, len(body), CHUNK_SIZE):
+                    self.wfile.write(body[offset:offset + CHUNK_SIZE])
+                    if server.bandwidth:
+                        # 按单连接带宽节流：发送进度领先于时间时睡眠补齐
+                        ahead = (offset + CHUNK_SIZE) / server.bandwidth - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+            def do_GET(self):
+                try:
+                    self._respond(True)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_HEAD(self):
+                self._respond(False)
+
+            def log_message(self, format, *args):
+                pass
+
+        for host in self.hosts:
+            httpd = http.server.ThreadingHTTPServer((host, self.port), Handler)
+            httpd.daemon_threads = True
+            # 第一个站点决定端口，其余站点绑定同一端口，URL 只有主机名不同
+            self.port = httpd.server_address[1]
+            self._servers.append(httpd)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def urls(self, count: int) -> List[str]:
+        """count 个条目的 URL，按顺序轮流分配到各站点。"""
+        return [
+            f"http://{self.hosts[i % len(self.hosts)]}:{self.port}/media/item{i:06d}.{self.ext}"
+            for i in range(count)
+        ]
+
+    def stop(self):
+        for httpd in self._servers:
+            httpd.shutdown()
+            httpd.server_close()
+
+
+# ---- 子进程：跑一组配置 ----
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _run_audio(config: dict, links_path: str, output_dir: str, metrics_path: str) -> List[float]:
+    from batch_audio_only import DEFAULT_PROFILE, batch_download_audio_only
+    from host_scheduler import parse_host_limit
+    from metrics import default_metrics
+    from segmented import default_connections
+
+    default_metrics.configure(jsonl_path=metrics_path)
+    default_connections.configure(config["segments"], config["max_connections"])
+    batch_download_audio_only(
+        links_path, output_dir,
+        max_workers=config["workers"],
+        transcode_workers=config["transcode_workers"],
+        host_limits=dict(parse_host_limit(spec) for spec in config["host_limits"]),
+        retry_failed_passes=0,
+        audio_profile=DEFAULT_PROFILE,
+    )
+    default_metrics.close()
+    latencies = []
+    with open(metrics_path, encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event["event"] == "item" and event["status"] == "ok":
+                latencies.append(event["seconds"])
+    return latencies
+
+
+def _run_media(config: dict, urls: List[str], output_dir: str) -> List[float]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    from main import download_media
+    from segmented import default_connections
+
+    default_connections.configure(config["segments"], config["max_connections"])
+
+    def one(url):
+        start = time.time()
+        download_media(url, output_dir, download_video=False, download_audio=True)
+        stem = url.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        produced = any(stem in name for name in os.listdir(os.path.join(output_dir, "audios")))
+        return time.time() - start if produced else None
+
+    with ThreadPoolExecutor(config["workers"]) as pool:
+        return [latency for latency in pool.map(one, urls) if latency is not None]
+
+
+def run_child(config: dict) -> dict:
+    """在当前（子）进程里跑一组配置，返回统计结果。"""
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    links_path = os.path.join(work_dir, "links.txt")
+    with open(links_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(config["urls"]) + "\n")
+    output_dir = os.path.join(work_dir, "out")
+
+    t0, cpu0 = time.time(), os.times()
+    # 被测代码的输出很多，子进程里全部丢弃，只保留统计结果
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = devnull
+    try:
+        if config["mode"] == "audio":
+            latencies = _run_audio(config, links_path, output_dir, os.path.join(work_dir, "metrics.jsonl"))
+        else:
+            latencies = _run_media(config, config["urls"], output_dir)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        devnull.close()
+    wall = time.time() - t0
+    cpu1 = os.times()
+    if not config["keep"]:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    ok = len(latencies)
+    return {
+        "mode": config["mode"],
+        "workers": config["workers"],
+        "items": len(config["urls"]),
+        "ok": ok,
+        "wall": wall,
+        "items_per_sec": ok / wall if wall else 0.0,
+        "mb_per_sec": ok * config["fixture_bytes"] / wall / 1e6 if wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "cpu": (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system),
+        "cpu_children": (cpu1.children_user - cpu0.children_user) + (cpu1.children_system - cpu0.children_system),
+        "peak_rss_mb": _peak_rss_mb(),
+        "work_dir": work_dir if config["keep"] else None,
+    }
+
+
+# ---- 主进程 ----
+
+def _fmt(value, spec=".2f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_table(results: List[dict], baseline: Optional[Dict[int, dict]] = None):
+    header = f"{'workers':>7} {'成功/总数':>10} {'用时s':>8} {'条目/s':>8} {'MB/s':>7} {'p50 s':>7} {'p99 s':>7} " \
+             f"{'CPU s':>7} {'子进程CPU':>9} {'峰值MB':>7}"
+    print(header)
+    print("-" * 96)
+    for r in results:
+        line = (
+            f"{r['workers']:>7} {r['ok']:>5}/{r['items']:<4} {r['wall']:>8.1f} {r['items_per_sec']:>8.2f} "
+            f"{r['mb_per_sec']:>7.2f} {_fmt(r['p50']):>7} {_fmt(r['p99']):>7} {r['cpu']:>7.1f} "
+            f"{r['cpu_children']:>9.1f} {_fmt(r['peak_rss_mb'], '.0f'):>7}"
+        )
+        base = (baseline or {}).get(r["workers"])
+        if base:
+            # 与基线对比：吞吐越高越好、p99 越低越好
+            line += f"  吞吐 {_change(r['items_per_sec'], base['items_per_sec'])}"
+            if r["p99"] is not None and base.get("p99"):
+                line += f", p99 {_change(r['p99'], base['p99'])}"
+        print(line)
+
+
+def _change(value: float, base: float) -> str:
+    if not base:
+        return "-"
+    return f"{(value - base) / base:+.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="离线基准测试：用本地 HTTP 替身服务跑真实的批量下载代码路径，统计吞吐/延迟/CPU/内存。",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog=__doc__.split("用法：", 1)[1],
+    )
+    parser.add_argument("--mode", choices=MODES, default="audio",
+                        help="audio: batch_download_audio_only 流水线 (默认)；media: 并发调用 main.download_media。")
+    parser.add_argument("--items", type=int, default=50, help="条目数 (默认为 50)。")
+    parser.add_argument("--workers", default="1,4,8", help="逗号分隔的下载线程数，每个值跑一组 (默认为 1,4,8)。")
+    parser.add_argument("--transcode-workers", type=int, default=None, help="audio 模式的转码 worker 数 (默认为 CPU 核数)。")
+    parser.add_argument("--sites", type=int, default=1, help="把条目分散到的站点数 (127.0.0.1 ~ 127.0.0.N，默认为 1)。")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的响应延迟秒数 (默认为 0)。")
+    parser.add_argument("--bandwidth", default="0", help="单连接带宽，例如 2M、500k (默认为 0，不限速)。")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的请求比例 (默认为 0)。")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 的请求比例 (默认为 0)。")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="固定返回 404 的条目比例 (默认为 0)。")
+    parser.add_argument("--seed", type=int, default=0, help="错误序列的随机种子 (默认为 0)。")
+    parser.add_argument("--fixture", metavar="FILE", help="作为媒体内容的音频文件 (默认生成 --duration 秒的正弦波 WAV)。")
+    parser.add_argument("--duration", type=float, default=30.0, help="生成的 WAV 时长秒数 (默认为 30)。")
+    parser.add_argument(
+        "--host-limit",
+        metavar="SITE=N:RATE",
+        action="append",
+        default=[],
+        help="同 batch_audio_only.py，替身站点默认按“其他域名”策略 (4 并发, 每秒 4 个) 调度，\n"
+             "例如 127.0.0.1=16:100 解除限制。"
+    )
+    parser.add_argument("--segments", type=int, default=1, metavar="N",
+                        help="每个文件分 N 段并发下载 (默认为 1)，同 batch_audio_only.py。")
+    parser.add_argument("--max-connections", type=int, default=None, metavar="M",
+                        help="所有下载线程合计的媒体连接上限，同 batch_audio_only.py。")
+    parser.add_argument("--json", metavar="FILE", help="把结果写入 JSON 文件（可作为之后 --compare 的基线）。")
+    parser.add_argument("--compare", metavar="FILE", help="与之前 --json 保存的基线对比吞吐与 p99。")
+    parser.add_argument("--keep", action="store_true", help="保留每组的临时输出目录。")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.child, encoding="utf-8") as f:
+            config = json.load(f)
+        result = run_child(config)
+        with open(args.child, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    try:
+        worker_counts = [int(n) for n in args.workers.split(",") if n.strip()]
+        bandwidth = parse_size(args.bandwidth)
+    except ValueError:
+        print("错误: --workers 或 --bandwidth 格式不正确。")
+        sys.exit(1)
+    if args.items < 1 or args.sites < 1 or not worker_counts or min(worker_counts) < 1:
+        print("错误: --items、--sites 与 --workers 必须大于 0。")
+        sys.exit(1)
+
+    fixture_dir = None
+    fixture = args.fixture
+    if not fixture:
+        fixture_dir = tempfile.mkdtemp(prefix="bench_fixture_")
+        fixture = os.path.join(fixture_dir, "fixture.wav")
+        make_fixture_wav(fixture, args.duration)
+
+    hosts = [f"127.0.0.{i + 1}" for i in range(args.sites)]
+    server = StandInServer(fixture, hosts, args.latency, bandwidth, args.error_rate, args.throttle_rate,
+                           args.missing_rate, args.seed)
+    try:
+        server.start()
+    except OSError as e:
+        print(f"错误: 无法在 {', '.join(hosts)} 上启动替身服务: {e}")
+        sys.exit(1)
+    fixture_bytes = len(server.body)
+    print(f"替身服务: {', '.join(hosts)} 端口 {server.port}，fixture {fixture_bytes / 1e6:.1f} MB ({server.ext})")
+    print(f"模式: {args.mode}，条目: {args.items}，延迟 {args.latency}s，带宽 {args.bandwidth}，"
+          f"503 {args.error_rate:.0%} / 429 {args.throttle_rate:.0%} / 404 {args.missing_rate:.0%}")
+
+    urls = server.urls(args.items)
+    results = []
+    try:
+        for workers in worker_counts:
+            config = {
+                "mode": args.mode, "workers": workers, "transcode_workers": args.transcode_workers,
+                "host_limits": args.host_limit, "segments": args.segments, "max_connections": args.max_connections,
+                "urls": urls, "fixture_bytes": fixture_bytes, "keep": args.keep,
+            }
+            fd, config_path = tempfile.mkstemp(prefix="bench_", suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(config, f)
+            print(f"运行 workers={workers} ...", flush=True)
+            # 每组配置一个新进程：峰值内存、CPU 和进程内缓存互不影响
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", config_path])
+            with open(config_path, encoding="utf-8") as f:
+                result = json.load(f) if proc.returncode == 0 else None
+            os.remove(config_path)
+            if result is None or "wall" not in result:
+                print(f"workers={workers} 运行失败 (退出码 {proc.returncode})")
+                continue
+            results.append(result)
+    finally:
+        server.stop()
+        if fixture_dir:
+            shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {r["workers"]: r for r in json.load(f)["results"]}
+    print()
+    print_table(results, baseline)
+    print(f"替身服务共收到 {server.requests} 个媒体请求")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+频道/UP 主空间的增量同步 —— 每个来源记住最近见过的上传（高水位），之后只列出比它新的条目。
+
+不加 --sync 时，links 文件里的频道链接每次都会被完整展开：YouTube 频道要一页页翻完全部上传历史，
+B 站空间要请求所有分页，几百个频道每天同步一次要花几个小时。--sync 模式下：
+
+- 频道/空间的条目按“新的在前”逐页读取（yt-dlp 的分页列表是惰性的），遇到高水位里的条目 ID，
+  或上传时间早于记录的最新上传时间，就停止翻页，后面的页不再请求；
+- 只有新条目进入批量流水线；频道主页展开出的各个标签页（视频、Shorts、直播）各自作为来源同步；
+- 高水位存放在下载索引里（download_index.sync_marks），整批跑完后才更新：某个来源的新条目
+  有临时性失败时不更新它的高水位，下次同步会重新列出（已下载的条目按索引零网络跳过）；
+  私有/已删除等永久错误不影响更新。
+
+首次同步一个来源时没有高水位，会列出全部历史；--sync-max-new N 可以只取最近的 N 个（更早的不再补下）。
+只适用于按上传时间倒序排列的列表（频道、UP 主空间，见 is_sync_source）；按添加顺序排列的普通播放列表、
+合集等即使加了 --sync 也照常完整展开。
+"""
+
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from download_index import open_index, url_media_key
+from retry import PERMANENT, classify_error
+from url_canon import canonicalize_url
+
+# 每个来源保留的最近条目 ID 数：最新的几个视频被删除/设为私有后，仍能在后面的 ID 处停下
+KEEP_IDS = 50
+# 分页列表没有声明页大小时每次读取的条目数
+DEFAULT_PAGE_SIZE = 50
+# 条目按上传时间倒序排列、可以增量同步的列表（yt-dlp extractor_key）；youtube:tab 还要求是频道本身
+SYNC_EXTRACTORS = ("YoutubeTab", "BilibiliSpaceVideo")
+
+
+class _PendingMark(NamedTuple):
+    known_ids: List[str]
+    latest_ts: Optional[int]
+    child_keys: Set[Tuple[str, str]]
+
+
+def iter_playlist_entries(info: dict) -> Iterator[dict]:
+    """逐个产出（extract_flat 得到的）播放列表条目；分页列表按页读取，停止迭代后不再请求后面的页。"""
+    entries = info.get("entries") or []
+    if not hasattr(entries, "getslice"):
+        yield from entries
+        return
+    page_size = getattr(entries, "_pagesize", None) or DEFAULT_PAGE_SIZE
+    start = 0
+    while True:
+        page = entries.getslice(start, start + page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
+def entry_timestamp(entry: dict) -> Optional[int]:
+    """条目的上传时间（Unix 时间戳）；只有 upload_date 时按当天 0 点计，都没有时返回 None。"""
+    if entry.get("timestamp"):
+        return int(entry["timestamp"])
+    upload_date = entry.get("upload_date")
+    if upload_date:
+        try:
+            return int(datetime.strptime(upload_date, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            return None
+    return None
+
+
+def _is_nested_list(entry: dict, entry_url: str) -> bool:
+    """条目本身是否还是一个列表（例如频道主页展开出的“视频”“Shorts”标签页）。"""
+    if url_media_key(entry_url) is not None or entry.get("duration"):
+        return False
+    ie_key = entry.get("ie_key")
+    if not ie_key:
+        return False
+    from yt_dlp.extractor import get_info_extractor
+
+    try:
+        return get_info_extractor(ie_key)._RETURN_TYPE in ("playlist", "any")
+    except Exception:
+        return False
+
+
+def is_sync_source(info: Optional[dict]) -> bool:
+    """
+    已提取的列表是否是频道/UP 主空间（可以按高水位增量同步）。
+
+    youtube:tab 同时负责普通播放列表，只有频道页（列表 ID 就是频道 ID，包括各个标签页）才算。
+    """
+    if not info or info.get("extractor_key") not in SYNC_EXTRACTORS:
+        return False
+    if info["extractor_key"] == "YoutubeTab":
+        return bool(info.get("channel_id")) and info.get("id") == info.get("channel_id")
+    return True
+
+
+class ChannelSync:
+    """一次批量运行中的增量同步状态：列出各来源的新条目，运行结束后统一提交高水位。"""
+
+    def __init__(self, output_dir: str, max_new: Optional[int] = None):
+        """
+        :param output_dir: 输出根目录，高水位存放在其中的下载索引里。
+        :param max_new: 每个来源最多列出的新条目数，None 表示不限制。
+        """
+        self.index = open_index(output_dir)
+        self.max_new = max_new
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _PendingMark] = {}
+        self.listed = 0
+
+    @staticmethod
+    def source_key(url: str) -> str:
+        return canonicalize_url(url, resolve_short_links=False).url
+
+    def new_entries(self, url: str, info: dict) -> List[str]:
+        """
+        列出来源 url（已提取的 info 为播放列表）中比高水位新的条目链接，新的在前。
+
+        嵌套的列表（标签页）总是原样返回，作为独立来源再同步。返回空列表表示没有新条目。
+        """
+        source = self.source_key(url)
+        mark = self.index.lookup_sync_mark(source)
+        known_ids, latest_ts = mark if mark else ([], None)
+        known = set(known_ids)
+
+        children: List[str] = []
+        new_ids: List[str] = []
+        child_keys: Set[Tuple[str, str]] = set()
+        newest_ts = latest_ts
+        for entry in iter_playlist_entries(info):
+            if not entry:
+                continue
+            entry_url = entry.get("url") or entry.get("webpage_url")
+            if not entry_url:
+                continue
+            if _is_nested_list(entry, entry_url):
+                children.append(entry_url)
+                continue
+            entry_id = entry.get("id") or canonicalize_url(entry_url, resolve_short_links=False).media_id
+            ts = entry_timestamp(entry)
+            if entry_id in known or (ts is not None and latest_ts is not None and ts < latest_ts):
+                break
+            if self.max_new is not None and len(new_ids) >= self.max_new:
+                break
+            children.append(entry_url)
+            new_ids.append(entry_id)
+            child_keys.add(canonicalize_url(entry_url, resolve_short_links=False).key)
+            if ts is not None and (newest_ts is None or ts > newest_ts):
+                newest_ts = ts
+
+        with self._lock:
+            self._pending[source] = _PendingMark((new_ids + known_ids)[:KEEP_IDS], newest_ts, child_keys)
+            self.listed += 1
+        return children
+
+    def commit(self, failures: Dict[str, str]) -> Tuple[int, int]:
+        """
+        运行结束后更新高水位。
+
+        :param failures: 最终仍失败的条目 {url: 错误信息}；来源的新条目中有非永久性失败时不更新该来源。
+        :return: (已更新的来源数, 因失败暂不更新的来源数)
+        """
+        failed_keys = {
+            canonicalize_url(url, resolve_short_links=False).key
+            for url, reason in failures.items()
+            if classify_error(reason) != PERMANENT
+        }
+        updated = held = 0
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for source, mark in pending.items():
+            if mark.child_keys & failed_keys:
+                held += 1
+                continue
+            self.index.record_sync_mark(source, mark.known_ids, mark.latest_ts)
+            updated += 1
+        return updated, held
+
+
+def add_sync_arguments(parser):
+    """给命令行加上 --sync / --sync-max-new。"""
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="增量同步：links 文件中的频道/UP 主空间只列出上次同步之后的新上传，\n"
+             "遇到已见过的条目就停止翻页（高水位记录在下载索引中）。"
+    )
+    parser.add_argument(
+        "--sync-max-new",
+        metavar="N",
+        type=int,
+        default=None,
+        help="同步时每个来源最多取 N 个新条目（首次同步时可只取最近的 N 个，更早的不再补下）。"
+    )
+
@@ -0,0 +1,556 @@
+"""
+常驻下载服务 —— 一个进程长期运行，通过本地 HTTP（或 Unix socket）接口接收任务，worker 池始终保持预热。
+
+每次运行 main.py / batch_audio_only.py 都要导入 Python 与 yt-dlp、探测 JS 运行时、加载 Cookie、
+建立新的连接，然后退出；频繁提交小任务时这些启动开销比下载本身还长。服务模式下这些只做一次：
+下载/转码流水线（batch_audio_only 的两级流水线）常驻，YoutubeDL 实例、cookie jar、JS 挑战缓存
+和 HTTP 连接都在任务之间复用。
+
+接口（JSON，只监听 127.0.0.1 或 Unix socket）：
+  POST   /jobs        {"urls": [...]} 或 {"url": "..."}，返回 {"id": ...}
+  GET    /jobs        所有任务的概要
+  GET    /jobs/<id>   任务详情（每个链接的状态与错误信息）
+  DELETE /jobs/<id>   取消任务：尚未开始的链接不再处理，已在下载的链接会做完
+  GET    /status      服务状态（运行时长、处理中的链接数、实例复用统计）
+
+任务队列持久化在输出目录的 .jobs/ 下：提交/取消/播放列表展开追加写入 daemon-jobs.jsonl，
+每个链接的状态写入任务日志 daemon.jsonl（与批量脚本的断点续传相同）。服务重启后未完成的链接自动重新排队，
+停在转码阶段的链接直接从转码继续。
+
+用法：
+  # 启动服务（默认端口 8766），参数与 batch_audio_only.py 相同
+  python daemon.py serve -o downloads --max-workers 8
+
+  # 提交链接 / links 文件，查询与取消
+  python daemon.py submit "URL1" "URL2"
+  python daemon.py submit -f links.txt
+  python daemon.py status [任务ID]
+  python daemon.py cancel 任务ID
+"""
+
+import argparse
+import http.client
+import http.server
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Set
+from urllib.parse import quote
+
+from audio_dedup import add_dedup_arguments, configure_dedup_from_args
+from audio_profile import add_profile_arguments, profile_from_args, require_ffmpeg
+from batch_audio_only import (
+    DEFAULT_PROFILE,
+    expand_children,
+    fetch_with_retry,
+    local_check,
+    safe_print,
+    transcode_stage,
+)
+from host_scheduler import HostScheduler, parse_host_limit
+from job_journal import JOURNAL_DIRNAME, JobJournal
+from js_challenge import enable_js_challenge_cache
+from links_input import iter_links
+from loudness import DEFAULT_TARGET_LUFS
+from metrics import add_metrics_arguments, configure_from_args, default_metrics
+from pipeline import FetchResult, StagedPipeline
+from retry import ERROR_CLASS_LABELS, classify_error
+from segmented import add_segmented_arguments, configure_segmented_from_args
+from url_canon import unique_canonical_urls
+from ydl_pool import default_pool, require_yt_dlp
+
+DEFAULT_PORT = 8766
+# 已结束的任务保留多久（秒），超过后重启时从任务文件中清除
+JOB_RETENTION = 7 * 24 * 3600
+
+# 链接处理结束的状态；其余状态（queued/extracting/...）在重启后重新排队
+TERMINAL_STATES = ("done", "failed", "cancelled", "expanded")
+
+
+class Job:
+    __slots__ = ("id", "urls", "created", "cancelled")
+
+    def __init__(self, job_id: str, urls: List[str], created: float, cancelled: bool = False):
+        self.id = job_id
+        self.urls = urls
+        self.created = created
+        self.cancelled = cancelled
+
+
+class DownloadDaemon:
+    """常驻的任务队列：提交的链接进入一条一直运行的 StagedPipeline，结果写回任务日志。"""
+
+    def __init__(self, output_dir: str, cookie_file=None, force_overwrites=False, max_workers=8,
+                 transcode_workers=None, host_limits=None, js_worker=False, audio_profile=None):
+        """
+        :param output_dir: 输出根目录；任务文件与任务日志在其中的 .jobs/ 下。
+        其余参数与 batch_audio_only.batch_download_audio_only 相同，对所有任务生效。
+        """
+        self.output_dir = output_dir
+        self.started = time.time()
+        os.makedirs(os.path.join(output_dir, 'audios'), exist_ok=True)
+        enable_js_challenge_cache(output_dir, persistent_worker=js_worker)
+
+        self.journal = JobJournal(os.path.join(output_dir, JOURNAL_DIRNAME, "daemon.jsonl"))
+        self._jobs_path = os.path.join(output_dir, JOURNAL_DIRNAME, "daemon-jobs.jsonl")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        # 每个链接属于哪些任务；处理中（已进入流水线、还没有结果）的链接
+        self._owners: Dict[str, Set[str]] = {}
+        self._active: Set[str] = set()
+        self._inbox: "queue.Queue" = queue.Queue()
+        self.processed = 0
+
+        fetch = partial(
+            fetch_with_retry, output_dir=output_dir, cookie_file=cookie_file, force_overwrites=force_overwrites,
+            journal=self.journal, expand_playlists=True, profile=audio_profile or DEFAULT_PROFILE,
+        )
+        self.pipeline = StagedPipeline(
+            lambda url: self._fetch(fetch, url),
+            transcode_stage,
+            download_workers=max_workers,
+            transcode_workers=transcode_workers,
+            scheduler=HostScheduler(host_limits),
+            expand_fn=self._expand,
+            precheck_fn=partial(local_check, output_dir=output_dir, force_overwrites=force_overwrites,
+                                journal=self.journal, profile=audio_profile or DEFAULT_PROFILE),
+        )
+        self._restore()
+        self._file = open(self._jobs_path, "a", encoding="utf-8", buffering=1)
+        self._consumer = threading.Thread(target=self._consume, name="daemon-results", daemon=True)
+        self._consumer.start()
+
+    # ---- 任务文件 ----
+    def _restore(self):
+        """回放任务文件，清理过期任务后重写，并把未完成的链接重新排队。"""
+        if os.path.exists(self._jobs_path):
+            with open(self._jobs_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    job = self._jobs.get(record.get("id"))
+                    if record.get("event") == "submit":
+                        self._jobs[record["id"]] = Job(record["id"], record["urls"], record["ts"])
+                    elif job is not None and record.get("event") == "expand":
+                        job.urls.extend(record["urls"])
+                    elif job is not None and record.get("event") == "cancel":
+                        job.cancelled = True
+        cutoff = time.time() - JOB_RETENTION
+        for job in list(self._jobs.values()):
+            if job.created < cutoff and self._job_state(job) != "running":
+                del self._jobs[job.id]
+
+        os.makedirs(os.path.dirname(self._jobs_path), exist_ok=True)
+        tmp_path = self._jobs_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for job in self._jobs.values():
+                f.write(json.dumps({"event": "submit", "id": job.id, "urls": job.urls, "ts": job.created},
+                                   ensure_ascii=False) + "\n")
+                if job.cancelled:
+                    f.write(json.dumps({"event": "cancel", "id": job.id}) + "\n")
+        os.replace(tmp_path, self._jobs_path)
+
+        resumed = 0
+        for job in self._jobs.values():
+            for url in job.urls:
+                self._owners.setdefault(url, set()).add(job.id)
+            if job.cancelled:
+                continue
+            for url in job.urls:
+                if self.journal.state(url) not in TERMINAL_STATES and url not in self._active:
+                    self._active.add(url)
+                    self._inbox.put(url)
+                    resumed += 1
+        if resumed:
+            safe_print(f"从任务文件恢复 {resumed} 个未完成的链接。")
+
+    def _append(self, record: dict):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    # ---- 提交/取消/查询 ----
+    def submit(self, urls) -> Job:
+        """提交一组链接（按站点+视频 ID 去重），返回新任务；已在处理中的链接只登记归属，不重复下载。"""
+        job = Job(uuid.uuid4().hex[:12], list(unique_canonical_urls(urls)), time.time())
+        self._append({"event": "submit", "id": job.id, "urls": job.urls, "ts": job.created})
+        with self._lock:
+            self._jobs[job.id] = job
+            for url in job.urls:
+                self._owners.setdefault(url, set()).add(job.id)
+                if url in self._active:
+                    continue
+                self._active.add(url)
+                self.journal.mark(url, 'queued', job=job.id)
+                self._inbox.put(url)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """取消任务；只属于被取消任务的链接在轮到时跳过。返回 None 表示没有这个任务。"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.cancelled:
+                return job
+            job.cancelled = True
+        self._append({"event": "cancel", "id": job_id})
+        return job
+
+    def _wanted(self, url: str) -> bool:
+        with self._lock:
+            return any(not self._jobs[job_id].cancelled
+                       for job_id in self._owners.get(url, ()) if job_id in self._jobs)
+
+    def _job_state(self, job: Job) -> str:
+        if job.cancelled:
+            return "cancelled"
+        if all(self.journal.state(url) in TERMINAL_STATES for url in job.urls):
+            return "finished"
+        return "running"
+
+    def job_info(self, job: Job, items: bool = True) -> dict:
+        counts: Dict[str, int] = {}
+        details = []
+        for url in list(job.urls):
+            record = self.journal.record(url) or {}
+            state = record.get("state", "queued")
+            if job.cancelled and state == "queued":
+                state = "cancelled"
+            counts[state] = counts.get(state, 0) + 1
+            if items:
+                details.append({"url": url, "state": state, "error": record.get("reason")})
+        info = {"id": job.id, "created": job.created, "state": self._job_state(job), "counts": counts}
+        if items:
+            info["items"] = details
+        return info
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created)
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self) -> dict:
+        with self._lock:
+            active = len(self._active)
+            jobs = len(self._jobs)
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            "jobs": jobs,
+            "active": active,
+            "processed": self.processed,
+            "ydl_instances": {"created": default_pool.created, "reused": default_pool.reused},
+        }
+
+    # ---- 流水线 ----
+    def _inbox_urls(self) -> Iterator[str]:
+        # 流水线的输入在服务运行期间不会结束，收到 None 时才关闭
+        while True:
+            url = self._inbox.get()
+            if url is None:
+                return
+            yield url
+
+    def _fetch(self, fetch, url: str) -> FetchResult:
+        if not self._wanted(url):
+            return FetchResult("已取消")
+        return fetch(url)
+
+    def _expand(self, parent_url: str, children) -> Iterator[str]:
+        """播放列表展开出的条目归属到父链接所在的任务，并写入任务文件以便重启后恢复。"""
+        children = list(expand_children(parent_url, children))
+        with self._lock:
+            owners = [self._jobs[job_id] for job_id in self._owners.get(parent_url, ()) if job_id in self._jobs]
+        for job in owners:
+            job.urls.extend(child for child in children if child not in job.urls)
+            self._append({"event": "expand", "id": job.id, "urls": children})
+        for child in children:
+            with self._lock:
+                self._owners.setdefault(child, set()).update(job.id for job in owners)
+                if child in self._active:
+                    continue
+                self._active.add(child)
+            self.journal.mark(child, 'queued', parent=parent_url)
+            yield child
+
+    def _consume(self):
+        for url, status, extra_info, elapsed_time in self.pipeline.run(self._inbox_urls()):
+            with self._lock:
+                self._active.discard(url)
+            self.processed += 1
+            default_metrics.record_item(url, status, elapsed_time)
+            if status == "展开":
+                safe_print(f"+ 播放列表已展开为 {extra_info}: {url}")
+            elif status == "已取消":
+                self.journal.mark(url, 'cancelled')
+                safe_print(f"- 任务已取消，跳过: {url}")
+            elif status == "错误":
+                self.journal.mark(url, 'failed', reason=extra_info)
+                label = ERROR_CLASS_LABELS[classify_error(extra_info)]
+                safe_print(f"[FAIL] 下载失败 [{label}] ({elapsed_time:.1f}s): {url}")
+                safe_print(f"  错误信息: {extra_info}")
+            else:
+                self.journal.mark(url, 'done')
+                if status == "已存在":
+                    safe_print(f"- 文件已存在，跳过: {extra_info}")
+                else:
+                    safe_print(f"[OK] 下载成功 ({elapsed_time:.1f}s): {url}")
+
+    def close(self):
+        """停止服务：尚未开始的链接留在任务文件里，下次启动继续；已在处理的链接会做完。"""
+        self.pipeline.stop()
+        self._inbox.put(None)
+        self._consumer.join()
+        with self._lock:
+            self._file.close()
+        self.journal.close()
+
+
+# ---- HTTP 接口 ----
+
+def make_handler(daemon: DownloadDaemon):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def _send(self, code: int, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job_id(self) -> Optional[str]:
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/status":
+                self._send(200, daemon.status())
+            elif path == "/jobs":
+                self._send(200, [daemon.job_info(job, items=False) for job in daemon.jobs()])
+            elif self._job_id():
+                job = daemon.get_job(self._job_id())
+                if job is None:
+                    self._send(404, {"error": "没有这个任务"})
+                else:
+                    self._send(200, daemon.job_info(job))
+            else:
+                self._send(404, {"error": "未知路径"})
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0].rstrip("/") != "/jobs":
+                self._send(404, {"error": "未知路径"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                data = json.loads(self.rfile.read(length) or b"{}")
+                urls = data.get("urls") or ([data["url"]] if data.get("url") else [])
+                if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+                    raise ValueError
+            except (ValueError, AttributeError):
+                self._send(400, {"error": "请求体应为 JSON: {\"urls\": [...]} 或 {\"url\": \"...\"}"})
+                return
+            if not urls:
+                self._send(400, {"error": "没有链接"})
+                return
+            job = daemon.submit(urls)
+            self._send(201, {"id": job.id, "urls": len(job.urls)})
+
+        def do_DELETE(self):
+            job_id = self._job_id()
+            job = daemon.cancel(job_id) if job_id else None
+            if job is None:
+                self._send(404, {"error": "没有这个任务"})
+            else:
+                self._send(202, {"id": job.id, "state": "cancelled"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(daemon: DownloadDaemon, port: int = DEFAULT_PORT, socket_path: Optional[str] = None):
+    """在 127.0.0.1:port（或 Unix socket）上提供接口，直到 Ctrl+C / SIGTERM。"""
+    handler = make_handler(daemon)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, handler)
+        where = socket_path
+    else:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+        server.daemon_threads = True
+        where = f"http://127.0.0.1:{server.server_address[1]}"
+    # SIGTERM 与 Ctrl+C 一样优雅退出（systemd / 任务计划停止服务时）
+    signal.signal(signal.SIGTERM, lambda signum, frame: (_ for _ in ()).throw(KeyboardInterrupt()))
+    print(f"下载服务已启动: {where}，输出目录: {os.path.abspath(daemon.output_dir)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止服务，进行中的链接做完后退出（未开始的链接下次启动继续）...")
+    finally:
+        # 收尾期间再收到 SIGTERM / Ctrl+C 不再抛 KeyboardInterrupt，否则 close() 会在等待
+        # 进行中的链接、写任务日志时被打断（需要强制结束时用 SIGKILL）
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        daemon.close()
+
+
+# ---- 客户端 ----
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def request(method: str, path: str, payload=None, port: int = DEFAULT_PORT, socket_path: Optional[str] = None):
+    """向服务发送一个请求，返回 (状态码, JSON)。"""
+    if socket_path:
+        conn = _UnixHTTPConnection(socket_path)
+    else:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else None
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        conn.close()
+
+
+def _print_job(info: dict):
+    counts = ", ".join(f"{state} {n}" for state, n in sorted(info["counts"].items()))
+    created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(info["created"]))
+    print(f"{info['id']}  {info['state']:<9}  {created}  {counts}")
+    for item in info.get("items", []):
+        line = f"  {item['state']:<11} {item['url']}"
+        if item.get("error"):
+            line += f"\n              {item['error']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="常驻下载服务：保持 worker 池预热，通过本地 HTTP / Unix socket 接口接收任务。",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog=__doc__.split("用法：", 1)[1],
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_endpoint(p):
+        p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"本地 HTTP 端口 (默认为 {DEFAULT_PORT})。")
+        p.add_argument("--socket", metavar="PATH", help="改用 Unix socket（Linux/macOS）。")
+
+    p_serve = sub.add_parser("serve", help="启动服务", formatter_class=argparse.RawTextHelpFormatter)
+    add_endpoint(p_serve)
+    p_serve.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
+    p_serve.add_argument("--force-overwrites", action="store_true", help="强制覆盖并重新下载已存在的文件。")
+    p_serve.add_argument("--cookies", metavar="FILE", help="指定包含 Cookies 的文本文件路径 (Netscape 格式)。")
+    p_serve.add_argument("--max-workers", "--download-workers", dest="max_workers", type=int, default=8,
+                         help="下载线程数 (默认为 8)。")
+    p_serve.add_argument("--transcode-workers", type=int, default=None, help="转码 worker 数 (默认为 CPU 核数)。")
+    p_serve.add_argument("--host-limit", metavar="SITE=N:RATE", action="append", default=[],
+                         help="按站点限制并发数与每秒开始的条目数，可多次指定 (例如 bilibili=2:0.5)。")
+    add_profile_arguments(p_serve, default_loudnorm=DEFAULT_TARGET_LUFS)
+    p_serve.add_argument("--js-worker", action="store_true",
+                         help="用常驻的 node 进程求解 YouTube JS 挑战（n 参数/签名）。")
+    add_segmented_arguments(p_serve)
+    add_dedup_arguments(p_serve)
+    add_metrics_arguments(p_serve)
+
+    p_submit = sub.add_parser("submit", help="提交链接")
+    add_endpoint(p_submit)
+    p_submit.add_argument("urls", nargs="*", help="要下载的链接")
+    p_submit.add_argument("-f", "--file", help="从 links 文件读取链接（支持 .gz 和 JSONL），'-' 表示标准输入。")
+
+    p_status = sub.add_parser("status", help="查询任务（不指定 ID 时列出所有任务）")
+    add_endpoint(p_status)
+    p_status.add_argument("job_id", nargs="?", help="任务 ID")
+
+    p_cancel = sub.add_parser("cancel", help="取消任务")
+    add_endpoint(p_cancel)
+    p_cancel.add_argument("job_id", help="任务 ID")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if args.max_workers < 1 or (args.transcode_workers is not None and args.transcode_workers < 1):
+            print("错误: 线程数必须大于 0。")
+            sys.exit(1)
+        try:
+            host_limits = dict(parse_host_limit(spec) for spec in args.host_limit)
+            configure_from_args(args)
+        except (ValueError, OSError) as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        require_yt_dlp()
+        require_ffmpeg()
+        configure_segmented_from_args(args)
+        configure_dedup_from_args(args)
+        daemon = DownloadDaemon(
+            args.output, args.cookies, args.force_overwrites, args.max_workers, args.transcode_workers,
+            host_limits, args.js_worker, profile_from_args(args),
+        )
+        try:
+            serve(daemon, args.port, args.socket)
+        except OSError as e:
+            daemon.close()
+            print(f"错误: 无法监听 {args.socket or args.port}: {e}")
+            sys.exit(1)
+        return
+
+    try:
+        if args.command == "submit":
+            urls = list(args.urls)
+            if args.file:
+                urls.extend(iter_links(args.file))
+            if not urls:
+                print("错误: 没有要提交的链接。")
+                sys.exit(1)
+            code, data = request("POST", "/jobs", {"urls": urls}, args.port, args.socket)
+            if code == 201:
+                print(f"已提交任务 {data['id']} ({data['urls']} 个链接)")
+        elif args.command == "status":
+            path = f"/jobs/{quote(args.job_id)}" if args.job_id else "/jobs"
+            code, data = request("GET", path, None, args.port, args.socket)
+            if code == 200:
+                for info in (data if isinstance(data, list) else [data]):
+                    _print_job(info)
+        else:
+            code, data = request("DELETE", f"/jobs/{quote(args.job_id)}", None, args.port, args.socket)
+            if code == 202:
+                print(f"已取消任务 {data['id']}")
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法连接下载服务（先运行 python daemon.py serve）: {e}")
+        sys.exit(1)
+    if code >= 400:
+        print(f"错误: {data.get('error') if isinstance(data, dict) else data}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
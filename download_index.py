@@ -0,0 +1,388 @@
+"""
+本地下载索引 —— 以 (extractor, 视频 ID) 为键记录已下载的文件，批量脚本可据此零网络跳过。
+
+索引是输出目录下的一个 SQLite 文件（<output_dir>/.download_index.sqlite3），
+由 main.download_media 在 yt-dlp 后处理完成时写入；批量脚本直接从 URL 解析出视频 ID
+（YouTube 的 v=、Bilibili 的 BV 号等）查询索引，命中且文件仍存在时无需任何网络请求。
+同一个库里还缓存每个视频音频的 EBU R128 响度测量结果（见 loudness.py），
+增量同步时每个频道/UP 主空间的高水位（见 channel_sync.py），以及音频内容指纹（见 audio_dedup.py）。
+
+用法：
+  # 扫描已有的 audios/ 与 videos/ 目录，一次性重建索引
+  python download_index.py rebuild-index
+
+  # 指定输出根目录
+  python download_index.py rebuild-index -o my_downloads
+
+  # 清除增量同步的高水位（下次 --sync 重新完整列出这些来源；不指定来源时清除全部）
+  python download_index.py reset-sync https://www.youtube.com/@example/videos
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from url_canon import BILIBILI_BV_RE, YOUTUBE_ID_RE, canonicalize_url
+
+INDEX_FILENAME = ".download_index.sqlite3"
+
+# 输出目录下子目录与索引中 kind 字段的对应关系
+KIND_DIRS = {"audio": "audios", "video": "videos"}
+
+# 文件名模板为 '%(title)s [%(id)s].%(ext)s'，从末尾的 [id] 中取回视频 ID
+_FILENAME_ID_RE = re.compile(r"\[([^\[\]]+)\]\.[^.\\/]+$")
+# 下载过程中的临时文件，重建索引时忽略
+_TEMP_SUFFIXES = (".part", ".ytdl", ".temp", ".tmp")
+
+# 能从 URL 直接解析出单个视频 ID 的站点
+INDEXED_EXTRACTORS = ("youtube", "bilibili", "douyin", "netease")
+
+# yt-dlp extractor_key（小写）与 url_canon 站点名不一致的，按站点名登记，从 URL 查询时才能命中
+_EXTRACTOR_ALIASES = {"neteasemusic": "netease"}
+
+
+def normalize_extractor(extractor_key: Optional[str]) -> str:
+    """把 yt-dlp 的 extractor_key（如 'Youtube'、'BiliBili'、'NetEaseMusic'）规范成索引里使用的站点名。"""
+    name = (extractor_key or "").strip().lower()
+    return _EXTRACTOR_ALIASES.get(name, name)
+
+
+def guess_extractor_from_id(video_id: str) -> str:
+    """重建索引时只能看到文件名里的 ID，按 ID 形态推断来源站点；无法判断时返回空串。"""
+    if BILIBILI_BV_RE.fullmatch(video_id.split("_p")[0]):
+        return "bilibili"
+    if YOUTUBE_ID_RE.match(video_id):
+        return "youtube"
+    return ""
+
+
+def url_media_key(url: str) -> Optional[Tuple[str, str]]:
+    """
+    不联网，直接从 URL 中解析 (extractor, 视频 ID)。
+
+    解析规则见 url_canon.canonicalize_url（不展开短链）；解析不出单个视频时返回 None，
+    调用方应回退到联网提取。
+    """
+    canon = canonicalize_url(url, resolve_short_links=False)
+    if canon.extractor not in INDEXED_EXTRACTORS:
+        return None
+    if canon.extractor == "bilibili" and canon.media_id.startswith("av"):
+        # yt-dlp 以 BV 号为 ID 登记，av 号不联网换算不出对应的 BV 号
+        return None
+    return canon.key
+
+
+class DownloadIndex:
+    """线程安全的 SQLite 下载索引，键为 (extractor, video_id, kind)。"""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS downloads (
+                    extractor TEXT NOT NULL,
+                    video_id  TEXT NOT NULL,
+                    kind      TEXT NOT NULL,
+                    path      TEXT NOT NULL,
+                    size      INTEGER NOT NULL,
+                    mtime     REAL NOT NULL,
+                    PRIMARY KEY (extractor, video_id, kind)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS loudness (
+                    extractor  TEXT NOT NULL,
+                    video_id   TEXT NOT NULL,
+                    integrated REAL NOT NULL,
+                    true_peak  REAL NOT NULL,
+                    lra        REAL NOT NULL,
+                    PRIMARY KEY (extractor, video_id)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sync_marks (
+                    source    TEXT PRIMARY KEY,
+                    known_ids TEXT NOT NULL,
+                    latest_ts INTEGER,
+                    synced_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    extractor TEXT NOT NULL,
+                    video_id  TEXT NOT NULL,
+                    path      TEXT NOT NULL,
+                    duration  REAL NOT NULL,
+                    title_key TEXT NOT NULL,
+                    frames    INTEGER NOT NULL,
+                    bits      TEXT NOT NULL,
+                    PRIMARY KEY (extractor, video_id)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_duration ON fingerprints (duration)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_title ON fingerprints (title_key)")
+            # 早先的记录直接用了 yt-dlp 的 extractor_key，改成站点名
+            for table in ("downloads", "loudness", "fingerprints"):
+                for old, new in _EXTRACTOR_ALIASES.items():
+                    self._conn.execute(f"UPDATE OR REPLACE {table} SET extractor = ? WHERE extractor = ?", (new, old))
+            self._conn.commit()
+
+    def record(self, extractor: str, video_id: str, kind: str, path: str) -> bool:
+        """记录一个已完成的输出文件；文件不存在时不写入并返回 False。"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?)",
+                (extractor, video_id, kind, os.path.abspath(path), st.st_size, st.st_mtime),
+            )
+            self._conn.commit()
+        return True
+
+    def lookup(self, extractor: str, video_id: str, kind: str) -> Optional[str]:
+        """
+        查询已下载文件的路径。
+
+        extractor 为空串的记录（重建索引时无法判断来源）同样参与匹配。
+        文件已被删除或大小变化时视为失效，删除该记录并返回 None。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT extractor, path, size FROM downloads "
+                "WHERE video_id = ? AND kind = ? AND extractor IN (?, '')",
+                (video_id, kind, extractor),
+            ).fetchall()
+        for row_extractor, path, size in rows:
+            try:
+                if os.path.getsize(path) == size:
+                    return path
+            except OSError:
+                pass
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM downloads WHERE extractor = ? AND video_id = ? AND kind = ?",
+                    (row_extractor, video_id, kind),
+                )
+                self._conn.commit()
+        return None
+
+    def lookup_url(self, url: str, kind: str = "audio") -> Optional[str]:
+        """从 URL 直接解析视频 ID 查询索引（不联网）。"""
+        key = url_media_key(url)
+        if key is None:
+            return None
+        return self.lookup(key[0], key[1], kind)
+
+    def record_loudness(self, extractor: str, video_id: str, integrated: float, true_peak: float, lra: float):
+        """缓存一个视频音频的响度测量结果（与输出格式无关，重新转码时复用）。"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?, ?)",
+                (extractor, video_id, integrated, true_peak, lra),
+            )
+            self._conn.commit()
+
+    def lookup_loudness(self, extractor: str, video_id: str) -> Optional[Tuple[float, float, float]]:
+        """查询缓存的响度测量结果 (integrated, true_peak, lra)，没有时返回 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT integrated, true_peak, lra FROM loudness WHERE video_id = ? AND extractor IN (?, '')",
+                (video_id, extractor),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def record_sync_mark(self, source: str, known_ids: List[str], latest_ts: Optional[int]):
+        """记录一个同步来源的高水位：最近见过的条目 ID（新的在前）与最新的上传时间。"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_marks VALUES (?, ?, ?, ?)",
+                (source, json.dumps(known_ids), latest_ts, time.time()),
+            )
+            self._conn.commit()
+
+    def lookup_sync_mark(self, source: str) -> Optional[Tuple[List[str], Optional[int]]]:
+        """查询同步来源的高水位 (known_ids, latest_ts)，从未同步过时返回 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT known_ids, latest_ts FROM sync_marks WHERE source = ?", (source,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def clear_sync_marks(self, sources: Optional[List[str]] = None) -> int:
+        """删除指定来源（默认全部）的高水位，返回删除的数量。"""
+        with self._lock:
+            if sources:
+                cursor = self._conn.executemany("DELETE FROM sync_marks WHERE source = ?", [(s,) for s in sources])
+            else:
+                cursor = self._conn.execute("DELETE FROM sync_marks")
+            self._conn.commit()
+        return cursor.rowcount
+
+    def record_fingerprint(self, extractor: str, video_id: str, path: str, duration: float, title_key: str,
+                           frames: int, bits: str):
+        """记录一个音频文件的内容指纹（bits 为十六进制的位串，frames 为位数）。"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (extractor, video_id, os.path.abspath(path), duration, title_key, frames, bits),
+            )
+            self._conn.commit()
+
+    def fingerprint_candidates(self, duration: float, tolerance: float,
+                               title_key: Optional[str] = None) -> List[Tuple[str, str, str, int, str]]:
+        """
+        时长相差不超过 tolerance 秒的指纹记录 [(extractor, video_id, path, frames, bits)]，
+        给出 title_key 时只返回标题也相同的记录。文件已不存在的记录会被删除、不返回。
+        """
+        query = "SELECT extractor, video_id, path, frames, bits FROM fingerprints WHERE duration BETWEEN ? AND ?"
+        params: tuple = (duration - tolerance, duration + tolerance)
+        if title_key is not None:
+            query += " AND title_key = ?"
+            params += (title_key,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        alive = []
+        for row in rows:
+            if os.path.exists(row[2]):
+                alive.append(row)
+                continue
+            with self._lock:
+                self._conn.execute("DELETE FROM fingerprints WHERE extractor = ? AND video_id = ?", row[:2])
+                self._conn.commit()
+        return alive
+
+    def audio_without_fingerprint(self) -> List[Tuple[str, str, str]]:
+        """索引中还没有指纹的音频文件 [(extractor, video_id, path)]。"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT d.extractor, d.video_id, d.path FROM downloads d "
+                "LEFT JOIN fingerprints f ON f.extractor = d.extractor AND f.video_id = d.video_id "
+                "WHERE d.kind = 'audio' AND f.video_id IS NULL"
+            ).fetchall()
+
+    def rebuild(self) -> Dict[str, int]:
+        """清空索引并扫描 audios/、videos/ 目录重新登记，返回各 kind 的登记数量。"""
+        counts = {kind: 0 for kind in KIND_DIRS}
+        with self._lock:
+            self._conn.execute("DELETE FROM downloads")
+            self._conn.commit()
+        for kind, video_id, path in _scan_output_tree(self.output_dir):
+            if self.record(guess_extractor_from_id(video_id), video_id, kind, path):
+                counts[kind] += 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _scan_output_tree(output_dir: str) -> Iterator[Tuple[str, str, str]]:
+    """遍历输出目录，产出 (kind, video_id, path)。"""
+    for kind, sub in KIND_DIRS.items():
+        root_dir = os.path.join(output_dir, sub)
+        if not os.path.isdir(root_dir):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root_dir):
+            # 跳过 .raw 等隐藏的暂存目录
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if name.endswith(_TEMP_SUFFIXES):
+                    continue
+                m = _FILENAME_ID_RE.search(name)
+                if m:
+                    yield kind, m.group(1), os.path.join(dirpath, name)
+
+
+_open_indexes: Dict[str, DownloadIndex] = {}
+_open_indexes_lock = threading.Lock()
+
+
+def open_index(output_dir: str) -> DownloadIndex:
+    """按输出目录复用同一个索引实例（多线程共享一个连接）。"""
+    key = os.path.abspath(output_dir)
+    with _open_indexes_lock:
+        index = _open_indexes.get(key)
+        if index is None:
+            index = _open_indexes[key] = DownloadIndex(output_dir)
+        return index
+
+
+def make_index_hook(output_dir: str, kind: str):
+    """
+    生成 yt-dlp 的 postprocessor_hooks 回调：文件移动到最终位置（MoveFiles 完成）后登记到索引。
+    """
+    def hook(d):
+        if d.get("status") != "finished" or d.get("postprocessor") != "MoveFiles":
+            return
+        info = d.get("info_dict") or {}
+        video_id = info.get("id")
+        filepath = info.get("filepath")
+        if not video_id or not filepath:
+            return
+        try:
+            open_index(output_dir).record(
+                normalize_extractor(info.get("extractor_key")), video_id, kind, filepath
+            )
+        except sqlite3.Error:
+            # 索引只是加速手段，写入失败不影响下载本身
+            pass
+    return hook
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="本地下载索引维护工具。",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild-index", help="扫描 audios/ 与 videos/ 目录重建索引")
+    rebuild.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
+    reset_sync = sub.add_parser("reset-sync", help="清除增量同步的高水位，下次 --sync 时重新完整列出")
+    reset_sync.add_argument("sources", nargs="*", help="频道/UP 主空间链接（与 links 文件中的写法一致），不指定时清除全部")
+    reset_sync.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
+
+    args = parser.parse_args()
+
+    if args.command == "rebuild-index":
+        if not os.path.isdir(args.output):
+            print(f"错误: 目录 '{args.output}' 不存在。")
+            sys.exit(1)
+        index = DownloadIndex(args.output)
+        counts = index.rebuild()
+        index.close()
+        print(f"索引已重建: {index.path}")
+        print(f"音频: {counts['audio']} 个，视频: {counts['video']} 个")
+    elif args.command == "reset-sync":
+        if not os.path.isdir(args.output):
+            print(f"错误: 目录 '{args.output}' 不存在。")
+            sys.exit(1)
+        index = DownloadIndex(args.output)
+        sources = [canonicalize_url(url, resolve_short_links=False).url for url in args.sources]
+        removed = index.clear_sync_marks(sources)
+        index.close()
+        print(f"已清除 {removed} 个来源的同步高水位。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+按站点调度的任务队列：每个站点（YouTube / Bilibili / 抖音 / 网易云 / 其他域名）独立的并发上限和令牌桶限速，
+遇到 412/429/403 等风控响应时对该站点自适应退避，并在各站点之间轮转出队，
+避免一个被限流的站点占满所有下载线程、拖慢其他站点。
+"""
+
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from url_canon import canonicalize_url
+
+
+class HostPolicy(NamedTuple):
+    max_concurrency: int  # 同一站点同时进行的条目数上限
+    rate: float           # 令牌桶：每秒允许开始的条目数
+    burst: float = 2.0    # 令牌桶容量
+
+
+# 各站点的默认策略；B 站等风控较严的站点并发和速率都压低一些
+DEFAULT_POLICIES: Dict[str, HostPolicy] = {
+    "youtube": HostPolicy(4, 2.0, 4),
+    "bilibili": HostPolicy(2, 0.5, 2),
+    "douyin": HostPolicy(2, 0.5, 2),
+    "netease": HostPolicy(2, 1.0, 2),
+}
+FALLBACK_POLICY = HostPolicy(4, 4.0, 8)
+
+# 视为“被限流/风控”的错误：HTTP 412/429/403 及常见的文字提示
+_THROTTLE_RE = re.compile(
+    r"HTTP Error (?:412|429|403)|Too Many Requests|Precondition Failed|rate.?limit", re.IGNORECASE
+)
+
+BACKOFF_BASE = 5.0    # 首次退避秒数
+BACKOFF_MAX = 300.0   # 退避上限秒数
+MAX_REQUEUE = 3       # 同一条目因限流重新排队的最多次数
+
+
+def is_throttle_error(message: Optional[str]) -> bool:
+    return bool(message) and bool(_THROTTLE_RE.search(message))
+
+
+def host_key(url: str) -> str:
+    """条目所属的调度分组：已知站点用站点名，其余按域名分组。"""
+    extractor = canonicalize_url(url, resolve_short_links=False).extractor
+    if extractor != "generic":
+        return extractor.split(":")[0]
+    try:
+        host = (urlparse(url).hostname or "").lower()
+    except ValueError:
+        host = ""
+    return host[4:] if host.startswith("www.") else (host or "other")
+
+
+def parse_host_limit(spec: str) -> tuple:
+    """解析命令行的 'bilibili=2:0.5'（站点=并发:每秒条目数），返回 (站点, HostPolicy)。"""
+    try:
+        host, value = spec.split("=", 1)
+        concurrency, rate = value.split(":", 1)
+        policy = HostPolicy(int(concurrency), float(rate), max(float(rate) * 2, 1.0))
+    except ValueError:
+        raise ValueError(f"无效的站点限制 '{spec}'，格式应为 站点=并发:每秒条目数，例如 bilibili=2:0.5")
+    if policy.max_concurrency < 1 or policy.rate <= 0:
+        raise ValueError(f"无效的站点限制 '{spec}'：并发必须大于 0，速率必须为正数")
+    return host.strip().lower(), policy
+
+
+class _HostState:
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.queue: Deque[str] = deque()
+        self.active = 0
+        self.rate = policy.rate          # 当前速率，受限流后减半，成功后逐步恢复
+        self.tokens = policy.burst
+        self.last_refill = time.monotonic()
+        self.backoff_until = 0.0
+        self.backoff_level = 0
+        self.started = 0
+        self.throttled = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.policy.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+
+class HostScheduler:
+    """
+    线程安全的按站点调度队列。
+
+    put() 在排队总数达到 capacity 时阻塞（输入可以是很长的流）；get() 按站点轮转，
+    只返回当前未超并发、未在退避期且有令牌的站点的条目，全部完成后返回 None。
+    下载完一个条目后必须调用 release()。
+    """
+
+    def __init__(self, policies: Optional[Dict[str, HostPolicy]] = None, capacity: int = 256):
+        self.policies = dict(DEFAULT_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        self.capacity = capacity
+        self._hosts: Dict[str, _HostState] = {}
+        self._order: List[str] = []   # 轮转顺序
+        self._rr = 0
+        self._size = 0
+        self._active = 0
+        self._requeues: Dict[str, int] = {}
+        self._closed = False
+        self._cancelled = False
+        self._cond = threading.Condition()
+
+    def _state(self, host: str) -> _HostState:
+        st = self._hosts.get(host)
+        if st is None:
+            st = self._hosts[host] = _HostState(self.policies.get(host, FALLBACK_POLICY))
+            self._order.append(host)
+        return st
+
+    def put(self, url: str) -> bool:
+        """加入一个输入条目；队列已关闭（或已 cancel）时丢弃并返回 False。"""
+        host = host_key(url)
+        with self._cond:
+            while self._size >= self.capacity and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._state(host).queue.append(url)
+            self._size += 1
+            self._cond.notify_all()
+            return True
+
+    def add(self, url: str) -> bool:
+        """
+        由 worker 追加条目（例如播放列表展开出的条目）：不受容量限制、关闭后仍可加入，
+        避免 worker 在自己的队列上阻塞；已 cancel 时丢弃并返回 False。
+        """
+        host = host_key(url)
+        with self._cond:
+            if self._cancelled:
+                return False
+            self._state(host).queue.append(url)
+            self._size += 1
+            self._cond.notify_all()
+            return True
+
+    def put_many(self, urls: Iterable[str]):
+        for url in urls:
+            self.put(url)
+
+    def close(self):
+        """声明不会再有新的输入；队列排空且所有条目 release 后 get() 返回 None。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def cancel(self) -> int:
+        """丢弃所有尚未开始的条目并关闭队列，返回丢弃的条目数。"""
+        with self._cond:
+            dropped = 0
+            for st in self._hosts.values():
+                dropped += len(st.queue)
+                st.queue.clear()
+            self._size -= dropped
+            self._closed = True
+            self._cancelled = True
+            self._cond.notify_all()
+            return dropped
+
+    def qsize(self) -> int:
+        return self._size
+
+    def get(self) -> Optional[str]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wake_at = None
+                n = len(self._order)
+                for i in range(n):
+                    host = self._order[(self._rr + i) % n]
+                    st = self._hosts[host]
+                    if not st.queue or st.active >= st.policy.max_concurrency:
+                        continue
+                    if now < st.backoff_until:
+                        wake_at = min(wake_at or st.backoff_until, st.backoff_until)
+                        continue
+                    st.refill(now)
+                    if st.tokens < 1:
+                        ready = now + (1 - st.tokens) / st.rate
+                        wake_at = min(wake_at or ready, ready)
+                        continue
+                    st.tokens -= 1
+                    st.active += 1
+                    st.started += 1
+                    self._active += 1
+                    self._size -= 1
+                    self._rr = (self._rr + i + 1) % n
+                    self._cond.notify_all()
+                    return st.queue.popleft()
+
+                # 仍有进行中的条目时不能退出：它们可能因限流被重新排队
+                if self._closed and self._size == 0 and self._active == 0:
+                    return None
+                self._cond.wait(timeout=None if wake_at is None else max(wake_at - now, 0.01))
+
+    def release(self, url: str, error: Optional[str] = None) -> bool:
+        """
+        条目结束后归还并发名额。
+
+        error 是限流/风控错误时，对该站点退避（指数增长 + 抖动）并把速率减半，
+        条目重新排到该站点队尾等待重试，返回 True；否则逐步恢复速率，返回 False。
+        """
+        host = host_key(url)
+        with self._cond:
+            st = self._state(host)
+            st.active = max(st.active - 1, 0)
+            self._active = max(self._active - 1, 0)
+            requeued = False
+            if is_throttle_error(error):
+                st.throttled += 1
+                st.backoff_level += 1
+                delay = min(BACKOFF_BASE * 2 ** (st.backoff_level - 1), BACKOFF_MAX)
+                st.backoff_until = time.monotonic() + delay * random.uniform(0.8, 1.2)
+                st.rate = max(st.rate / 2, st.policy.rate / 16)
+                count = self._requeues.get(url, 0)
+                if count < MAX_REQUEUE and not self._cancelled:
+                    self._requeues[url] = count + 1
+                    st.queue.append(url)
+                    self._size += 1
+                    requeued = True
+            else:
+                st.backoff_level = max(st.backoff_level - 1, 0)
+                st.rate = min(st.policy.rate, st.rate + st.policy.rate / 8)
+                self._requeues.pop(url, None)
+            self._cond.notify_all()
+            return requeued
+
+    def stats_lines(self) -> List[str]:
+        with self._cond:
+            return [
+                f"站点 {host}: 开始 {st.started} 次, 被限流 {st.throttled} 次, "
+                f"并发上限 {st.policy.max_concurrency}, 当前速率 {st.rate:.2f}/s"
+                for host, st in self._hosts.items()
+            ]
@@ -0,0 +1,258 @@
+"""
+批量任务日志（job journal）—— 记录每个 URL 的处理状态，进程被杀或断电后可以断点续传。
+
+日志是输出目录下 .jobs/ 中的一个追加写的 JSONL 文件（每个 links 文件一个），每行一条状态变更：
+  {"url": ..., "state": "queued|extracting|downloading|transcoding|expanded|done|failed|cancelled", "ts": ..., ...}
+重新运行同一命令时回放日志：done 的条目直接跳过；停在 transcoding 且原始音频流仍在的条目
+直接从转码继续；其余条目重新处理（yt-dlp 会接着已有的 .part 文件继续下载）。
+
+JobJournal 打开时把整个日志回放进内存（每个 URL 一条）。面向十万级列表的 async_batch.py 使用
+IndexedJobJournal：每个 URL 的最新状态保存在输出目录的下载索引库（SQLite）里，内存占用与列表长度无关，
+打开时也只回放上次之后追加的日志行。JSONL 日志照常追加写，两种运行方式可以交替续传同一个 links 文件。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, Optional
+
+from download_index import INDEX_FILENAME
+
+JOURNAL_DIRNAME = ".jobs"
+
+# expanded: 播放列表已展开为独立条目（列表本身不记为 done，下次运行会重新展开以发现新条目）
+# cancelled: 所属任务被取消（daemon.py），条目没有处理
+STATES = ("queued", "extracting", "downloading", "transcoding", "expanded", "done", "failed", "cancelled")
+
+# 日志中过期记录超过有效记录的这个倍数时，打开时先压缩
+_COMPACT_RATIO = 4
+
+
+class JobJournal:
+    """线程安全的追加写状态日志；内存中只保留每个 URL 的最新一条记录。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._latest: Dict[str, dict] = {}
+        lines = self._replay()
+        if lines > max(len(self._latest) * _COMPACT_RATIO, 1000):
+            self._rewrite()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    @classmethod
+    def for_links_file(cls, output_dir: str, links_path: str) -> "JobJournal":
+        """每个 links 文件在输出目录下对应一个日志（按文件绝对路径区分同名文件）。"""
+        # 标准输入（'-'）没有文件路径，共用一个 stdin 日志
+        abs_path = links_path if links_path == "-" else os.path.abspath(links_path)
+        digest = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:8]
+        name = os.path.basename(abs_path)
+        if name.endswith(".gz"):
+            name = name[:-3]
+        stem = "stdin" if links_path == "-" else (os.path.splitext(name)[0] or "links")
+        return cls(os.path.join(output_dir, JOURNAL_DIRNAME, f"{stem}-{digest}.jsonl"))
+
+    def _replay(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                count += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程被杀时最后一行可能只写了一半
+                    continue
+                if isinstance(record, dict) and record.get("url"):
+                    self._latest[record["url"]] = record
+        return count
+
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self._latest.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def mark(self, url: str, state: str, **extra):
+        """记录一次状态变更（立即写入文件）。"""
+        record = {"url": url, "state": state, "ts": round(time.time(), 3), **extra}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._latest[url] = record
+            self._file.write(line)
+
+    def record(self, url: str) -> Optional[dict]:
+        with self._lock:
+            return self._latest.get(url)
+
+    def state(self, url: str) -> Optional[str]:
+        record = self.record(url)
+        return record["state"] if record else None
+
+    def unfinished(self, urls: Iterable[str]) -> Iterator[str]:
+        """过滤掉已完成的 URL。"""
+        for url in urls:
+            if self.state(url) != "done":
+                yield url
+
+    def reset(self):
+        """丢弃全部历史记录，从头开始。"""
+        with self._lock:
+            self._latest.clear()
+            self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8", buffering=1)
+
+    def summary(self) -> Counter:
+        with self._lock:
+            return Counter(record["state"] for record in self._latest.values())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class IndexedJobJournal(JobJournal):
+    """
+    状态保存在下载索引库里的任务日志，接口与 JobJournal 相同，内存中不保留任何 URL 的记录。
+
+    JSONL 文件仍是权威记录：每次 mark 同时追加到文件并写入库中的 journal_states 表；
+    库里记下已经同步到的文件位置和该位置之前的最后几个字节，打开时只回放之后追加的行
+    （例如 batch_audio_only.py 写入的）；文件被压缩重写、截断或 --fresh 清空过（末尾字节对不上）时从头重新同步。
+    """
+
+    # 回放日志时每批写入库的记录数
+    _SYNC_BATCH = 1000
+    # 同步位置之前保存多少字节用于识别文件是否被重写过（最后一行带毫秒时间戳，足以区分）
+    _TAIL_BYTES = 64
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._name = os.path.abspath(path)
+        # 日志固定位于 <output_dir>/.jobs/ 下，与下载索引共用 <output_dir> 里的库文件
+        output_dir = os.path.dirname(os.path.dirname(self._name))
+        os.makedirs(os.path.dirname(self._name), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(output_dir, INDEX_FILENAME), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # 日志文件才是权威记录，库写入不必每次落盘
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal_states (
+                journal TEXT NOT NULL,
+                url     TEXT NOT NULL,
+                state   TEXT NOT NULL,
+                record  TEXT NOT NULL,
+                PRIMARY KEY (journal, url)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal_files (
+                journal TEXT PRIMARY KEY,
+                offset  INTEGER NOT NULL,
+                tail    BLOB NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self._sync()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def _sync(self):
+        """把上次同步之后追加到 JSONL 文件里的记录写入库。"""
+        if not os.path.exists(self.path):
+            self._clear()
+            return
+        row = self._conn.execute("SELECT offset, tail FROM journal_files WHERE journal = ?", (self._name,)).fetchone()
+        batch = []
+        with open(self.path, "rb") as f:
+            offset, tail = row or (0, b"")
+            f.seek(max(offset - len(tail), 0))
+            if f.read(len(tail)) != tail or f.tell() != offset:
+                self._clear()
+                offset, tail = 0, b""
+                f.seek(0)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 进程被杀时最后一行可能只写了一半，下次从这一行重新读
+                    break
+                offset += len(line)
+                tail = (tail + line)[-self._TAIL_BYTES:]
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and record.get("url"):
+                    batch.append(self._row(record))
+                if len(batch) >= self._SYNC_BATCH:
+                    self._upsert(batch, offset, tail)
+                    batch = []
+        self._upsert(batch, offset, tail)
+
+    def _row(self, record: dict) -> tuple:
+        return (self._name, record["url"], record.get("state") or "", json.dumps(record, ensure_ascii=False))
+
+    def _upsert(self, rows, offset: int, tail: bytes):
+        self._conn.executemany("INSERT OR REPLACE INTO journal_states VALUES (?, ?, ?, ?)", rows)
+        self._conn.execute("INSERT OR REPLACE INTO journal_files VALUES (?, ?, ?)", (self._name, offset, tail))
+        self._conn.commit()
+
+    def _clear(self):
+        self._conn.execute("DELETE FROM journal_states WHERE journal = ?", (self._name,))
+        self._upsert([], 0, b"")
+
+    def mark(self, url: str, state: str, **extra):
+        """记录一次状态变更（立即写入文件和库）。"""
+        record = {"url": url, "state": state, "ts": round(time.time(), 3), **extra}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._conn.execute("INSERT OR REPLACE INTO journal_states VALUES (?, ?, ?, ?)", self._row(record))
+            # 文件位置随记录一起提交，下次打开不必再回放这一行
+            self._conn.execute(
+                "UPDATE journal_files SET offset = ?, tail = ? WHERE journal = ?",
+                (self._file.tell(), line.encode("utf-8")[-self._TAIL_BYTES:], self._name),
+            )
+            self._conn.commit()
+
+    def record(self, url: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM journal_states WHERE journal = ? AND url = ?", (self._name, url)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def state(self, url: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM journal_states WHERE journal = ? AND url = ?", (self._name, url)
+            ).fetchone()
+        return row[0] if row else None
+
+    def reset(self):
+        """丢弃全部历史记录，从头开始。"""
+        with self._lock:
+            self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8", buffering=1)
+            self._clear()
+
+    def summary(self) -> Counter:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM journal_states WHERE journal = ? GROUP BY state", (self._name,)
+            ).fetchall()
+        return Counter(dict(rows))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._conn.close()
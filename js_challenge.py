@@ -0,0 +1,535 @@
+"""
+YouTube JS 挑战（n 参数 / 签名）求解缓存 —— 同一播放器版本只预处理一次，可选常驻 JS 运行时进程。
+
+yt-dlp 默认每个 YouTube 链接都会新起一个 node/deno/bun 进程，重新解析并预处理同一版本的播放器 JS，
+批量下载时每条要多花几百毫秒。这里注册一组优先级更高的求解器（包装 yt-dlp 内置的 EJS 求解器）：
+
+- 预处理后的播放器按 播放器 ID + 求解脚本版本 缓存：内存里保留最近用过的几个，磁盘上保留最近的若干个（LRU 淘汰）；
+- 每个挑战的求解结果按 (类型, 播放器 ID, 挑战值) 缓存在内存，LRU 淘汰，进程退出时写回磁盘；
+- persistent_worker=True 时，每个进程只启动一个常驻 node 进程，求解脚本只加载一次，
+  播放器也留在进程里，之后每次只发送挑战值（deno/bun 仍按需启动进程，但同样使用上面的缓存）。
+
+求解器出错时 yt-dlp 会自动换用内置求解器，不影响下载。
+"""
+
+import atexit
+import collections
+import json
+import os
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+# yt-dlp 的求解器接口由 register_providers() 按需导入（第一次创建 YoutubeDL 之前），
+# 只看帮助、或全部条目都已存在时不必加载 yt-dlp
+JsChallengeProviderError = JsChallengeProviderResponse = JsChallengeResponse = None
+JsChallengeType = NChallengeOutput = SigChallengeOutput = None
+
+CACHE_DIRNAME = ".jsc_cache"
+
+# 磁盘上保留的预处理播放器个数（每个约 1~2 MB），内存中保留的个数
+MAX_DISK_PLAYERS = 8
+MAX_MEMORY_PLAYERS = 2
+# 内存中保留的挑战结果条数
+MAX_RESULTS = 50000
+# 常驻进程单次求解的超时秒数
+WORKER_TIMEOUT = 60
+
+_PLAYER_NOT_LOADED = "__player_not_loaded__"
+
+# 常驻 JS 进程的主循环：每行一个 JSON 请求，每行一个 JSON 响应；按 player_ref 保留最近的预处理播放器
+_WORKER_LOOP = """
+const __players = new Map();
+function __handle(msg) {
+  const input = msg.input;
+  const ref = msg.player_ref;
+  if (input.type === 'preprocessed' && input.preprocessed_player === undefined) {
+    if (!__players.has(ref)) return {type: 'error', error: '%(not_loaded)s'};
+    input.preprocessed_player = __players.get(ref);
+  }
+  const output = jsc(input);
+  const player = input.type === 'preprocessed' ? input.preprocessed_player : output.preprocessed_player;
+  if (player) {
+    __players.delete(ref);
+    __players.set(ref, player);
+    while (__players.size > %(max_players)d) __players.delete(__players.keys().next().value);
+  }
+  return output;
+}
+const __chunks = [];
+process.stdin.setEncoding('utf8');
+process.stdin.on('data', (chunk) => {
+  let start = 0, i;
+  while ((i = chunk.indexOf('\\n', start)) >= 0) {
+    __chunks.push(chunk.slice(start, i));
+    start = i + 1;
+    const line = __chunks.splice(0).join('');
+    if (!line.trim()) continue;
+    let output;
+    try {
+      output = __handle(JSON.parse(line));
+    } catch (e) {
+      output = {type: 'error', error: String(e && e.stack || e)};
+    }
+    process.stdout.write(JSON.stringify(output) + '\\n');
+  }
+  if (start < chunk.length) __chunks.push(chunk.slice(start));
+});
+"""
+
+
+class ResultCache:
+    """挑战结果的 LRU 缓存，可从 JSON 文件加载、写回。"""
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = MAX_RESULTS):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def _key(kind: str, player_id: str, challenge: str) -> str:
+        return f"{kind}:{player_id}:{challenge}"
+
+    def get(self, kind: str, player_id: str, challenge: str) -> Optional[str]:
+        key = self._key(kind, player_id, challenge)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, kind: str, player_id: str, challenge: str, value: str):
+        with self._lock:
+            self._entries[self._key(kind, player_id, challenge)] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = dict(self._entries)
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class PlayerCache:
+    """预处理后的播放器 JS：内存 LRU + 磁盘目录（按修改时间淘汰最旧的文件）。"""
+
+    def __init__(self, directory: Optional[str] = None, max_disk: int = MAX_DISK_PLAYERS,
+                 max_memory: int = MAX_MEMORY_PLAYERS):
+        self.directory = directory
+        self.max_disk = max_disk
+        self.max_memory = max_memory
+        self._lock = threading.Lock()
+        self._memory: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.js")
+
+    def _remember(self, key: str, code: str):
+        self._memory[key] = code
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            code = self._memory.get(key)
+            if code is None and self.directory:
+                path = self._path(key)
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        code = f.read()
+                    os.utime(path)
+                except OSError:
+                    code = None
+            if code is None:
+                self.misses += 1
+                return None
+            self._remember(key, code)
+            self.hits += 1
+            return code
+
+    def put(self, key: str, code: str):
+        with self._lock:
+            self._remember(key, code)
+            if not self.directory:
+                return
+            tmp_path = f"{self._path(key)}.tmp"
+            try:
+                # 目录在第一次写入时才创建：没有遇到 YouTube 挑战的运行不留下空目录
+                os.makedirs(self.directory, exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(code)
+                os.replace(tmp_path, self._path(key))
+                files = sorted(
+                    (entry for entry in os.scandir(self.directory) if entry.name.endswith(".js")),
+                    key=lambda entry: entry.stat().st_mtime,
+                )
+                for entry in files[:-self.max_disk]:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class JsWorker:
+    """常驻的 node 进程：启动时加载一次求解脚本，之后逐行收发 JSON。"""
+
+    def __init__(self, cmd: List[str], script_path: str, max_players: int = MAX_MEMORY_PLAYERS):
+        self.cmd = cmd
+        self.script_path = script_path
+        self.max_players = max_players
+        self._lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._loaded: "collections.OrderedDict[str, None]" = collections.OrderedDict()
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8",
+        )
+        self._loaded.clear()
+
+    def _roundtrip(self, message: dict) -> dict:
+        if self._proc is None or self._proc.poll() is not None:
+            self._start()
+        proc = self._proc
+        watchdog = threading.Timer(WORKER_TIMEOUT, proc.kill)
+        watchdog.start()
+        try:
+            proc.stdin.write(json.dumps(message) + "\n")
+            proc.stdin.flush()
+            line = proc.stdout.readline()
+        except OSError:
+            line = ""
+        finally:
+            watchdog.cancel()
+        if not line:
+            self.close()
+            raise JsChallengeProviderError("常驻 JS 进程意外退出或超时")
+        return json.loads(line)
+
+    def solve(self, data: dict, player_ref: str) -> dict:
+        """data 与 yt-dlp 求解脚本的输入格式相同；播放器已在进程内时不再重复发送。"""
+        with self._lock:
+            if data["type"] == "preprocessed" and player_ref in self._loaded:
+                slim = {k: v for k, v in data.items() if k != "preprocessed_player"}
+                output = self._roundtrip({"player_ref": player_ref, "input": slim})
+                if output.get("error") != _PLAYER_NOT_LOADED:
+                    self._loaded.move_to_end(player_ref)
+                    return output
+            output = self._roundtrip({"player_ref": player_ref, "input": data})
+            if output.get("type") != "error":
+                self._loaded[player_ref] = None
+                while len(self._loaded) > self.max_players:
+                    self._loaded.popitem(last=False)
+            return output
+
+    def close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+
+
+class _CacheState:
+    def __init__(self, cache_dir: str, persistent_worker: bool):
+        self.cache_dir = cache_dir
+        self.persistent_worker = persistent_worker
+        self.results = ResultCache(os.path.join(cache_dir, "results.json"))
+        self.players = PlayerCache(os.path.join(cache_dir, "players"))
+        self.workers: Dict[str, JsWorker] = {}
+        self.lock = threading.Lock()
+
+    def close(self):
+        try:
+            self.results.save()
+        except OSError:
+            pass
+        with self.lock:
+            workers, self.workers = list(self.workers.values()), {}
+        for worker in workers:
+            worker.close()
+
+
+_state: Optional[_CacheState] = None
+_state_lock = threading.Lock()
+
+
+def enable_js_challenge_cache(output_dir: str, persistent_worker: bool = False) -> bool:
+    """
+    启用 JS 挑战缓存（进程内只需调用一次），缓存放在 output_dir/.jsc_cache/ 下。
+
+    求解器本身在第一次创建 YoutubeDL 前才注册（见 register_providers），这里不导入 yt-dlp。
+
+    :param persistent_worker: 为 True 时使用常驻 node 进程求解（仅 node 运行时）。
+    """
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = _CacheState(os.path.join(output_dir, CACHE_DIRNAME), persistent_worker)
+            atexit.register(_state.close)
+        else:
+            _state.persistent_worker = _state.persistent_worker or persistent_worker
+
+
+def js_cache_stats_line() -> Optional[str]:
+    """缓存命中统计；未启用或没有 YouTube 挑战时返回 None。"""
+    if _state is None or not (_state.results.hits or _state.results.misses):
+        return None
+    return (f"JS 挑战缓存: 结果命中 {_state.results.hits} / 未命中 {_state.results.misses}, "
+            f"播放器命中 {_state.players.hits} / 预处理 {_state.players.misses}")
+
+
+class _CachedEJSMixin:
+    """包装 yt-dlp 的 EJS 求解器：先查结果缓存，未命中的挑战才交给 JS 运行时，播放器使用预处理缓存。"""
+
+    BUG_REPORT_MESSAGE = "（可先去掉 --js-worker 或删除输出目录下的 .jsc_cache 再试）"
+
+    def is_available(self) -> bool:
+        return _state is not None and super().is_available()
+
+    def _player_id(self, player_url: str) -> str:
+        try:
+            player_id = self.ie._player_js_cache_key(player_url)
+        except Exception:
+            player_id = player_url
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in player_id)
+
+    def _player_ref(self, player_id: str) -> str:
+        # 预处理结果依赖求解脚本版本，脚本升级后旧缓存自动失效
+        return f"{player_id}-{self._core_script.hash[:8]}"
+
+    @staticmethod
+    def _response(request, results: Dict[str, str]):
+        output = (NChallengeOutput(results) if request.type is JsChallengeType.N
+                  else SigChallengeOutput(results))
+        return JsChallengeProviderResponse(request, JsChallengeResponse(request.type, output))
+
+    def _real_bulk_solve(self, requests):
+        pending = collections.defaultdict(list)
+        for request in requests:
+            player_id = self._player_id(request.input.player_url)
+            results, missing = {}, []
+            for challenge in request.input.challenges:
+                cached = _state.results.get(request.type.value, player_id, challenge)
+                if cached is None:
+                    missing.append(challenge)
+                else:
+                    results[challenge] = cached
+            if missing:
+                import dataclasses
+
+                reduced = dataclasses.replace(
+                    request, input=dataclasses.replace(request.input, challenges=missing))
+                pending[request.input.player_url].append((request, reduced, results))
+            else:
+                yield self._response(request, results)
+
+        for player_url, items in pending.items():
+            player_id = self._player_id(player_url)
+            try:
+                responses = self._solve(player_url, player_id, [reduced for _, reduced, _ in items])
+            except JsChallengeProviderError as e:
+                for request, _, _ in items:
+                    yield JsChallengeProviderResponse(request, error=e)
+                continue
+            for (request, _, results), data in zip(items, responses):
+                if data["type"] == "error":
+                    yield JsChallengeProviderResponse(request, error=JsChallengeProviderError(data["error"]))
+                    continue
+                for challenge, value in data["data"].items():
+                    _state.results.put(request.type.value, player_id, challenge, value)
+                results.update(data["data"])
+                yield self._response(request, results)
+
+    def _solve(self, player_url: str, player_id: str, requests) -> list:
+        player_ref = self._player_ref(player_id)
+        preprocessed = _state.players.get(player_ref)
+        if preprocessed is None:
+            video_id = next((request.video_id for request in requests), None)
+            player = self._get_player(video_id, player_url)
+        self.logger.info(f"Solving JS challenges using {self.JS_RUNTIME_NAME}")
+
+        json_requests = [{"type": r.type.value, "challenges": r.input.challenges} for r in requests]
+        if preprocessed is not None:
+            data = {"type": "preprocessed", "preprocessed_player": preprocessed, "requests": json_requests}
+        else:
+            data = {"type": "player", "player": player, "requests": json_requests, "output_preprocessed": True}
+
+        worker = self._worker() if _state.persistent_worker else None
+        if worker is not None:
+            output = worker.solve(data, player_ref)
+        else:
+            stdin = self._construct_stdin(
+                preprocessed if preprocessed is not None else player, preprocessed is not None, requests)
+            output = json.loads(self._run_js_runtime(stdin))
+        if output["type"] == "error":
+            raise JsChallengeProviderError(output["error"])
+        if output.get("preprocessed_player"):
+            _state.players.put(player_ref, output["preprocessed_player"])
+        return output["responses"]
+
+    def _worker_cmd(self, script_path: str) -> Optional[List[str]]:
+        """
+        常驻进程的启动命令（script_path 为求解脚本 + 主循环）。
+
+        默认返回 None：该运行时不使用常驻进程，每次按需启动（仍使用结果和播放器缓存）。
+        """
+        return None
+
+    def _worker(self) -> Optional[JsWorker]:
+        key = f"{self.JS_RUNTIME_NAME}-{self._lib_script.hash[:8]}-{self._core_script.hash[:8]}"
+        with _state.lock:
+            worker = _state.workers.get(key)
+            if worker is None:
+                script_path = os.path.join(_state.cache_dir, f"worker-{key}.js")
+                cmd = self._worker_cmd(script_path)
+                if cmd is None:
+                    return None
+                if not os.path.exists(script_path):
+                    os.makedirs(_state.cache_dir, exist_ok=True)
+                    with open(script_path, "w", encoding="utf-8") as f:
+                        f.write(f"{self._lib_script.code}\nObject.assign(globalThis, lib);\n"
+                                f"{self._core_script.code}\n")
+                        f.write(_WORKER_LOOP % {"not_loaded": _PLAYER_NOT_LOADED,
+                                                "max_players": MAX_MEMORY_PLAYERS})
+                worker = _state.workers[key] = JsWorker(cmd, script_path)
+        return worker
+
+
+# 缓存求解器继承 yt-dlp 内置的 EJS 求解器（yt_dlp.extractor.youtube.jsc._builtin，不属于公开接口），
+# 并用到下面这些内部属性。在 2025.11.12（首个带 EJS 求解器的版本）到 2026.08.19 上验证过；
+# 更早的版本、或之后内部实现有变化时不注册，yt-dlp 照常使用内置求解器。
+MIN_YT_DLP_VERSION = (2025, 11, 12)
+_REQUIRED_EJS_ATTRS = (
+    "JS_RUNTIME_NAME", "runtime_info", "_lib_script", "_core_script",
+    "_get_player", "_construct_stdin", "_run_js_runtime",
+)
+
+_registered: Optional[bool] = None
+_register_lock = threading.Lock()
+
+
+def _version_tuple(version: str) -> tuple:
+    parts = []
+    for part in version.split("."):
+        if not part.isdigit():
+            break
+        parts.append(int(part))
+    return tuple(parts)
+
+
+def _builtin_ejs_providers() -> dict:
+    """yt-dlp 内置的 EJS 求解器 {运行时: 类}；内部模块或属性缺失的运行时不在其中。"""
+    providers = {}
+    for runtime, module_name, class_name in (
+        ("node", "node", "NodeJCP"), ("deno", "deno", "DenoJCP"), ("bun", "bun", "BunJCP"),
+    ):
+        try:
+            module = __import__(f"yt_dlp.extractor.youtube.jsc._builtin.{module_name}", fromlist=[class_name])
+            cls = getattr(module, class_name)
+        except (ImportError, AttributeError):
+            continue
+        if all(hasattr(cls, attr) for attr in _REQUIRED_EJS_ATTRS):
+            providers[runtime] = cls
+    return providers
+
+
+def register_providers() -> bool:
+    """
+    导入 yt-dlp 的可插拔求解器接口并注册上面的缓存求解器，进程内只执行一次。
+
+    由 ydl_pool 在创建 YoutubeDL 之前调用；未启用缓存时注册的求解器不可用，yt-dlp 照常使用内置求解器。
+
+    :return: yt-dlp 版本不在支持范围内（没有可插拔的 JS 挑战求解器，或内置求解器的内部实现已变化）时
+             返回 False，此时缓存不生效。
+    """
+    global _registered, JsChallengeProviderError, JsChallengeProviderResponse, JsChallengeResponse
+    global JsChallengeType, NChallengeOutput, SigChallengeOutput
+    with _register_lock:
+        if _registered is not None:
+            return _registered
+        _registered = False
+        try:
+            from yt_dlp.extractor.youtube.jsc.provider import (
+                JsChallengeProviderError,
+                JsChallengeProviderResponse,
+                JsChallengeResponse,
+                JsChallengeType,
+                NChallengeOutput,
+                SigChallengeOutput,
+                register_preference,
+                register_provider,
+            )
+            from yt_dlp.version import __version__ as yt_dlp_version
+        except ImportError:
+            return False
+        if _version_tuple(yt_dlp_version) < MIN_YT_DLP_VERSION:
+            return False
+        builtin = _builtin_ejs_providers()
+        if not builtin:
+            return False
+
+        providers = []
+        if "node" in builtin:
+            class CachedNodeJCP(_CachedEJSMixin, builtin["node"]):
+                PROVIDER_NAME = "cached-node"
+
+                def _worker_cmd(self, script_path: str) -> List[str]:
+                    # 与内置 node 求解器一样启用权限沙箱，只允许读取脚本本身
+                    if self.runtime_info.version_tuple < (23, 5, 0):
+                        flags = ["--experimental-permission", "--no-warnings=ExperimentalWarning"]
+                    else:
+                        flags = ["--permission"]
+                    return [self.runtime_info.path, *flags, f"--allow-fs-read={script_path}", script_path]
+
+            providers.append(CachedNodeJCP)
+        if "deno" in builtin:
+            class CachedDenoJCP(_CachedEJSMixin, builtin["deno"]):
+                PROVIDER_NAME = "cached-deno"
+
+            providers.append(CachedDenoJCP)
+        if "bun" in builtin:
+            class CachedBunJCP(_CachedEJSMixin, builtin["bun"]):
+                PROVIDER_NAME = "cached-bun"
+
+            providers.append(CachedBunJCP)
+
+        for provider in providers:
+            register_provider(provider)
+
+        @register_preference(*providers)
+        def _prefer_cached(provider, requests) -> int:
+            # 叠加在内置求解器的优先级之上，保证启用时先走缓存
+            return 2000
+
+        _registered = True
+        return True
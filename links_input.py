@@ -0,0 +1,137 @@
+"""
+链接输入 —— 流式读取链接列表，边读边交给下载流程，第一条链接不用等整个文件读完就能开始下载。
+
+支持的输入：
+- 普通文本（每行一个链接，# 开头为注释）；
+- '-' 表示从标准输入读取；
+- .gz 压缩文件（按扩展名或 gzip 魔数识别）；
+- JSONL（每行一个 JSON 对象，取 url / webpage_url / link 字段），可与纯文本行混排。
+
+去重用紧凑结构：HashedKeySet 只保存键的 64 位哈希；超大输入可改用 BloomFilter，
+内存固定，代价是极小概率把一条新链接误判为重复。
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import math
+import sys
+from typing import Iterator, Optional, TextIO
+
+STDIN_PATH = "-"
+
+# JSONL 记录中依次尝试的链接字段
+JSONL_URL_FIELDS = ("url", "webpage_url", "link")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_links_source(path: str) -> TextIO:
+    """打开链接来源：'-' 为标准输入，gzip 文件自动解压，均按 UTF-8 文本读取。"""
+    if path == STDIN_PATH:
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")
+    f = open(path, "rb")
+    if f.peek(2)[:2] == _GZIP_MAGIC:
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding="utf-8", errors="replace")
+    return io.TextIOWrapper(f, encoding="utf-8-sig", errors="replace")
+
+
+def parse_link_line(line: str) -> Optional[str]:
+    """从一行输入中取出链接；空行、注释和不含链接的 JSON 行返回 None。"""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        for field in JSONL_URL_FIELDS:
+            value = record.get(field)
+            if isinstance(value, str) and value.strip():
+                return value.strip()
+        return None
+    return line
+
+
+def iter_links(path: str) -> Iterator[str]:
+    """逐行产出链接文件中的链接（生成器，不会把整个文件读入内存）。"""
+    f = open_links_source(path)
+    try:
+        for line in f:
+            url = parse_link_line(line)
+            if url:
+                yield url
+    finally:
+        if path != STDIN_PATH:
+            f.close()
+
+
+def _key_hash(key) -> bytes:
+    return hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).digest()
+
+
+class HashedKeySet:
+    """只保存键的 64 位哈希的去重集合；add() 在键第一次出现时返回 True。"""
+
+    def __init__(self):
+        self._hashes = set()
+        self.duplicates = 0
+
+    def add(self, key) -> bool:
+        h = int.from_bytes(_key_hash(key)[:8], "little")
+        if h in self._hashes:
+            self.duplicates += 1
+            return False
+        self._hashes.add(h)
+        return True
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+class BloomFilter:
+    """
+    固定内存的布隆过滤器；add() 在键（大概率）第一次出现时返回 True。
+
+    :param capacity: 预计的不同链接数。
+    :param error_rate: 超出容量前的误判率（把新链接当成重复）。
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-4):
+        capacity = max(int(capacity), 1)
+        self.num_bits = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 64)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.duplicates = 0
+
+    def add(self, key) -> bool:
+        digest = _key_hash(key)
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        is_new = False
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % self.num_bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                is_new = True
+        if is_new:
+            self.count += 1
+        else:
+            self.duplicates += 1
+        return is_new
+
+    def __len__(self):
+        return self.count
+
+
+def make_seen_filter(bloom_capacity: Optional[int] = None):
+    """默认使用 HashedKeySet；给出 bloom_capacity 时改用固定内存的 BloomFilter。"""
+    if bloom_capacity:
+        return BloomFilter(bloom_capacity)
+    return HashedKeySet()
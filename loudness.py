@@ -0,0 +1,80 @@
+"""
+EBU R128 响度测量 —— 每个音频只测一次，按 (站点, 视频 ID) 缓存在下载索引里。
+
+转码时根据测量结果算出一个精确的增益（目标响度 - 实测响度，且保证真峰值不超过上限），
+在同一次编码里用 volume 滤镜施加，不再用固定倍数放大（响的曲目会削波，轻的曲目仍然偏轻）。
+之后换输出格式、码率或重新转码都直接复用缓存的测量结果，不必再完整解码一遍。
+"""
+
+import json
+import math
+import shutil
+import sqlite3
+import subprocess
+from typing import NamedTuple, Optional
+
+from download_index import open_index
+from metrics import default_metrics
+
+# 默认目标响度（LUFS，与主流流媒体平台一致）与真峰值上限（dBTP）
+DEFAULT_TARGET_LUFS = -14.0
+TRUE_PEAK_LIMIT = -1.0
+
+
+class Loudness(NamedTuple):
+    integrated: float   # 综合响度 LUFS
+    true_peak: float    # 真峰值 dBTP
+    lra: float          # 响度范围 LU
+
+
+def measure_loudness(path: str) -> Optional[Loudness]:
+    """用 ffmpeg 的 loudnorm 滤镜测量第一条音轨；没有 ffmpeg、读取失败或全静音时返回 None。"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-nostats", "-i", path, "-map", "0:a:0", "-vn",
+         "-af", "loudnorm=print_format=json", "-f", "null", "-"],
+        capture_output=True, text=True, encoding="utf-8", errors="replace",
+    )
+    if result.returncode != 0:
+        return None
+    # 测量结果是 stderr 末尾的一段 JSON
+    start, end = result.stderr.rfind("{"), result.stderr.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(result.stderr[start:end + 1])
+        loudness = Loudness(float(data["input_i"]), float(data["input_tp"]), float(data["input_lra"]))
+    except (ValueError, KeyError):
+        return None
+    if not all(math.isfinite(value) for value in loudness):
+        return None
+    return loudness
+
+
+def normalization_gain(loudness: Loudness, target_lufs: float = DEFAULT_TARGET_LUFS,
+                       true_peak_limit: float = TRUE_PEAK_LIMIT) -> float:
+    """达到目标响度所需的增益 (dB)；提升后真峰值会超过上限时只提升到上限为止，避免削波。"""
+    gain = target_lufs - loudness.integrated
+    return round(min(gain, true_peak_limit - loudness.true_peak), 2)
+
+
+def cached_loudness(output_dir: str, extractor: str, video_id: Optional[str], path: str) -> Optional[Loudness]:
+    """先查下载索引里的测量结果，没有时测量并写回；没有视频 ID 时只测量不缓存。"""
+    if not video_id:
+        with default_metrics.stage("loudness"):
+            return measure_loudness(path)
+    index = open_index(output_dir)
+    cached = index.lookup_loudness(extractor, video_id)
+    if cached is not None:
+        return Loudness(*cached)
+    with default_metrics.stage("loudness", video_id=video_id):
+        loudness = measure_loudness(path)
+    if loudness is not None:
+        try:
+            index.record_loudness(extractor, video_id, *loudness)
+        except sqlite3.Error:
+            # 缓存只是加速手段，写入失败不影响转码
+            pass
+    return loudness
@@ -1,22 +1,45 @@
 import argparse
+import copy
+import functools
 import os
 import shutil
+import subprocess
 import sys
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
 
-try:
-    import yt_dlp
-except ImportError:
-    print("错误：yt-dlp 未安装。请在 conda 环境中运行 'conda install -c conda-forge yt-dlp' 来安装。")
-    sys.exit(1)
+from audio_dedup import add_dedup_arguments, configure_dedup_from_args, default_dedup, make_dedup_hook
+from audio_profile import (
+    FFMPEG_MISSING, AudioProfile, add_profile_arguments, probe_audio_codec, profile_from_args, require_ffmpeg,
+)
+from download_index import make_index_hook, normalize_extractor, open_index
+from js_challenge import enable_js_challenge_cache
+from links_input import STDIN_PATH, iter_links
+from loudness import Loudness, cached_loudness, normalization_gain
+from metrics import default_metrics
+from progress import default_progress
+from retry import ERROR_CLASS_LABELS, call_with_retry
+from segmented import add_segmented_arguments, configure_segmented_from_args
+from url_canon import unique_canonical_urls
+from ydl_pool import default_pool, require_yt_dlp
 
 
-def preferred_js_runtimes() -> Dict[str, dict]:
-    """为 YouTube EJS 等选第一个在 PATH 中可用的 JS 运行时（优先级 node > deno > bun）。"""
+@functools.lru_cache(maxsize=None)
+def _find_js_runtime() -> Optional[str]:
     for name in ('node', 'deno', 'bun'):
         if shutil.which(name):
-            return {name: {}}
-    return {}
+            return name
+    return None
+
+
+def preferred_js_runtimes() -> Dict[str, dict]:
+    """
+    为 YouTube EJS 等选第一个在 PATH 中可用的 JS 运行时（优先级 node > deno > bun）。
+
+    PATH 只在进程内扫描一次；每次返回新的 dict，调用方可以放心修改。
+    """
+    name = _find_js_runtime()
+    return {name: {}} if name else {}
 
 
 def extra_ydl_opts_for_url(url: str) -> dict:
@@ -36,6 +59,262 @@ def extra_ydl_opts_for_url(url: str) -> dict:
     return {}
 
 
+# 已知站点按域名只加载对应的 extractor：新建 YoutubeDL 时不再实例化全部一千多个 extractor
+# （YouTube 链接约省 60 ms/实例），匹配链接时也不用逐个试正则。generic 放在最后兜底短链跳转，
+# 跳转后的链接仍按同一列表匹配；站外嵌入的其他站点视频此时会报 No suitable extractor。
+SITE_EXTRACTORS = (
+    (("youtube.com", "youtu.be", "youtube-nocookie.com"), ["youtube(:.*)?", "generic"]),
+    (("bilibili.com", "b23.tv"), ["bilibili.*", "bililive", "generic"]),
+    (("douyin.com", "iesdouyin.com"), ["douyin", "generic"]),
+    (("music.163.com",), ["netease:.*", "generic"]),
+)
+
+
+def allowed_extractors_for_url(url: str) -> Optional[List[str]]:
+    """按链接域名返回 yt-dlp 的 allowed_extractors；其他站点返回 None（加载全部 extractor）。"""
+    try:
+        host = (urlparse(url.strip()).hostname or "").lower()
+    except ValueError:
+        return None
+    for domains, extractors in SITE_EXTRACTORS:
+        if any(host == d or host.endswith("." + d) for d in domains):
+            return list(extractors)
+    return None
+
+
+# 流水线模式下原始音频流的暂存子目录（位于 audios/ 之下）
+RAW_AUDIO_SUBDIR = '.raw'
+
+
+class YtdlpErrorCollector:
+    """
+    yt-dlp 的 logger：保持 quiet 模式下的输出（只打印警告和错误），同时记下错误信息。
+
+    ignoreerrors 模式下 yt-dlp 不会抛出异常，调用方通过 errors 判断失败原因（例如 HTTP 412/429 限流）。
+    """
+
+    def __init__(self):
+        self.errors: List[str] = []
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        default_progress.log(f"WARNING: {msg}", file=sys.stderr)
+
+    def error(self, msg):
+        self.errors.append(msg)
+        default_progress.log(msg, file=sys.stderr)
+
+    @property
+    def last_error(self) -> Optional[str]:
+        return self.errors[-1] if self.errors else None
+
+
+def build_base_ydl_opts(url, browser_cookies=None, cookie_file=None, force_overwrites=False, logger=None) -> dict:
+    """构造视频/音频/预检查共用的 yt-dlp 基础参数（JS 运行时、B 站请求头、按站点限定的 extractor、Cookie）。"""
+    base_ydl_opts = {
+        'quiet': True,
+        'progress_hooks': [progress_hook, default_metrics.progress_hook],
+        'force_overwrites': force_overwrites,
+        # --ignore-errors: 继续处理播放列表中的其他视频，即使某个视频下载失败
+        'ignoreerrors': True,
+    }
+    js_rt = preferred_js_runtimes()
+    if js_rt:
+        base_ydl_opts['js_runtimes'] = js_rt
+    bili = extra_ydl_opts_for_url(url)
+    if bili:
+        # 若日后 base 也带 http_headers，此处需合并子 dict
+        base_ydl_opts.update(bili)
+    allowed = allowed_extractors_for_url(url)
+    if allowed:
+        base_ydl_opts['allowed_extractors'] = allowed
+
+    if cookie_file:
+        base_ydl_opts['cookiefile'] = cookie_file
+    elif browser_cookies:
+        base_ydl_opts['cookiesfrombrowser'] = (browser_cookies,)
+    if logger is not None:
+        base_ydl_opts['logger'] = logger
+    return base_ydl_opts
+
+
+def extract_media_info(url, browser_cookies=None, cookie_file=None, logger=None) -> Optional[dict]:
+    """
+    只做一次元数据提取（不做格式选择、不下载），返回原始 info_dict。
+
+    结果可同时用于“文件是否已存在”的预检查，以及 download_media 的视频/音频两个阶段，
+    避免对同一 URL 重复请求网页与播放器 JS。提取失败时返回 None。
+    """
+    opts = build_base_ydl_opts(url, browser_cookies, cookie_file, logger=logger)
+    opts['extract_flat'] = 'in_playlist'
+    with default_metrics.stage('extract'), default_pool.borrow(opts) as ydl:
+        return ydl.extract_info(url, download=False, process=False)
+
+
+def is_single_video(info: Optional[dict]) -> bool:
+    """info_dict 是否为可直接复用的单个视频（播放列表/跳转链接仍按 URL 交给 yt-dlp 处理）。"""
+    return bool(info) and info.get('_type', 'video') == 'video'
+
+
+def playlist_entry_urls(info: Optional[dict]) -> List[str]:
+    """
+    取出播放列表（extract_flat 得到的）每个条目的链接，用于把列表展开成独立任务。
+
+    不是播放列表、列表为空，或有条目缺少链接（无法单独下载）时返回空列表，调用方应按原样整体下载。
+    """
+    if not info or info.get('_type') not in ('playlist', 'multi_video'):
+        return []
+    entries = info.get('entries') or []
+    if hasattr(entries, 'getslice'):
+        # OnDemandPagedList 等分页列表
+        entries = entries.getslice()
+    urls: List[str] = []
+    for entry in entries:
+        if not entry:
+            continue
+        url = entry.get('url') or entry.get('webpage_url')
+        if not url:
+            return []
+        urls.append(url)
+    return urls
+
+
+def expected_audio_path(info: dict, output_dir: str, ext: str = 'mp3') -> str:
+    """根据 info_dict 计算 audios/ 下预期的音频路径（与 download_media 的文件名模板一致）。"""
+    audio_info = dict(info)
+    audio_info['ext'] = ext
+    audio_path_template = os.path.join(output_dir, 'audios', '%(title)s [%(id)s].%(ext)s')
+    # 只用来套文件名模板，不需要加载站点 extractor
+    with default_pool.borrow({'quiet': True, 'allowed_extractors': ['generic']}) as ydl:
+        return ydl.prepare_filename(audio_info, outtmpl=audio_path_template)
+
+
+def _run_ydl_stage(opts: dict, url: str, info: Optional[dict]) -> None:
+    """
+    执行一个下载阶段：有可复用的 info_dict 时直接 process_ie_result，否则按 URL 重新提取。
+
+    YoutubeDL 从 ydl_pool 借用，同一线程内相同配置的阶段复用同一个实例（Cookie、请求处理器不再重复初始化）。
+    """
+    opts = {**opts, 'postprocessor_hooks': [*opts.get('postprocessor_hooks', []), default_metrics.postprocessor_hook]}
+    with default_pool.borrow(opts) as ydl:
+        if is_single_video(info):
+            try:
+                # process_video_result 会原地修改 info（格式选择、弹出内部字段），每个阶段用独立副本
+                info_copy = copy.deepcopy(info)
+            except Exception:
+                info_copy = None
+            if info_copy is not None:
+                ydl.process_ie_result(info_copy, download=True)
+                return
+        ydl.download([url])
+
+
+def _run_ydl_stage_with_retry(opts: dict, url: str, info: Optional[dict]) -> Optional[str]:
+    """
+    执行一个下载阶段，按错误类型重试（见 retry.py）：临时错误和限流退避后重试，永久错误直接放弃；
+    ffmpeg 失败时已下载的文件还在，yt-dlp 重跑时会跳过下载只重做后处理。
+
+    :return: 最终仍失败时的错误信息，成功返回 None。
+    """
+    def attempt():
+        logger = YtdlpErrorCollector()
+        try:
+            _run_ydl_stage({**opts, 'logger': logger}, url, info)
+        except Exception as e:
+            return str(e)
+        return logger.last_error
+
+    def on_retry(n, error_class, error, delay):
+        default_progress.log(f"{ERROR_CLASS_LABELS[error_class]}，{delay:.1f} 秒后第 {n} 次重试: {url}")
+
+    return call_with_retry(attempt, lambda error: error, on_retry=on_retry)
+
+
+def extract_audio_from_file(src_path, dst_path, audio_volume_multiplier=1.0, force_overwrites=False,
+                            remove_source=False, profile: Optional[AudioProfile] = None,
+                            src_codec: Optional[str] = None, loudness: Optional[Loudness] = None) -> bool:
+    """
+    用 ffmpeg 从本地媒体文件（已下载的视频或原始音频流）中抽出音轨（-map 0:a:0），不再经过网络。
+
+    输出格式由 profile 决定（默认 MP3 192k，音量为 audio_volume_multiplier）；源编码与输出格式一致且不调音量时
+    直接 -c:a copy 封装。src_codec 为 yt-dlp 报告的源音频编码，未知时用 ffprobe 探测。
+    profile 启用响度标准化时按 loudness（调用方缓存的测量结果，见 loudness.cached_loudness）算出增益，
+    在这一次编码中施加；没有测量结果时按原音量编码。
+
+    先写入临时文件再改名，避免中断时留下半截的文件被当成已完成。成功返回 True。
+    remove_source 为 True 时，转码成功后删除源文件（用于流水线下载的原始音频流）。
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg or not os.path.exists(src_path):
+        return False
+    if os.path.exists(dst_path) and not force_overwrites:
+        if remove_source:
+            os.remove(src_path)
+        return True
+
+    if profile is None:
+        profile = AudioProfile(volume=audio_volume_multiplier or 1.0)
+    if src_codec is None and profile.stream_copy and not profile.needs_filter:
+        src_codec = probe_audio_codec(src_path)
+    gain_db = None
+    if profile.loudnorm is not None and loudness is not None:
+        gain_db = normalization_gain(loudness, profile.loudnorm)
+
+    tmp_path = dst_path + '.part'
+    cmd = [
+        ffmpeg, '-y', '-hide_banner', '-loglevel', 'error',
+        '-i', src_path,
+        '-map', '0:a:0', '-vn',
+        *profile.ffmpeg_args(src_codec, gain_db),
+        tmp_path,
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        err = result.stderr.strip().splitlines()
+        default_progress.log(f"从视频抽取音频失败: {err[-1] if err else result.returncode}")
+        return False
+    os.replace(tmp_path, dst_path)
+    if remove_source:
+        os.remove(src_path)
+    return True
+
+
+def fetch_audio(url, output_dir='downloads', browser_cookies=None, cookie_file=None,
+                force_overwrites=False, info=None, logger=None) -> List[tuple]:
+    """
+    只下载原始音频流（不做任何后处理），返回 [(info_dict, 原始文件路径), ...]。
+
+    原始文件放在 audios/.raw/ 下，由调用方稍后交给 extract_audio_from_file 转码，
+    这样网络下载与 ffmpeg 转码可以在不同的 worker 中并行进行。
+    """
+    raw_dir = os.path.join(output_dir, 'audios', RAW_AUDIO_SUBDIR)
+    os.makedirs(raw_dir, exist_ok=True)
+
+    files: list = []
+    opts = build_base_ydl_opts(url, browser_cookies, cookie_file, force_overwrites, logger=logger)
+    opts.update({
+        'format': 'bestaudio/best',
+        'outtmpl': os.path.join(raw_dir, '%(title)s [%(id)s].%(ext)s'),
+        'postprocessor_hooks': [_final_file_collector(files)],
+    })
+    _run_ydl_stage(opts, url, info)
+    return files
+
+
+def audio_path_for(media_path: str, output_dir: str, ext: str = 'mp3') -> str:
+    """本地媒体文件对应的 audios/ 下音频路径（沿用 '标题 [ID]' 文件名）。"""
+    stem = os.path.splitext(os.path.basename(media_path))[0]
+    return os.path.join(output_dir, 'audios', f'{stem}.{ext}')
+
+
 def download_media(
     url,
     output_dir='downloads',
@@ -44,7 +323,10 @@ def download_media(
     browser_cookies=None,
     cookie_file=None,
     force_overwrites=False,
-    audio_volume_multiplier=1.0
+    audio_volume_multiplier=1.0,
+    info=None,
+    audio_from_video=True,
+    audio_profile: Optional[AudioProfile] = None,
 ):
     """
     使用 yt-dlp 从给定的 URL 下载媒体文件。
@@ -57,26 +339,23 @@ def download_media(
     :param cookie_file: Cookie 文件的路径。
     :param force_overwrites: 是否强制覆盖已存在的文件。
     :param audio_volume_multiplier: 音频音量乘数 (例如 1.5 代表音量增加50%)。
+    :param info: 预先提取好的 info_dict（见 extract_media_info）；为 None 且需要两个阶段时会先提取一次。
+    :param audio_from_video: 同时下载视频和音频时，直接从已下载的视频文件抽取音轨，不再联网下载音频。
+    :param audio_profile: 音频输出格式/码率（见 audio_profile.py）；给出时其中的音量覆盖 audio_volume_multiplier。
     """
-    base_ydl_opts = {
-        'quiet': True,
-        'progress_hooks': [progress_hook],
-        'force_overwrites': force_overwrites,
-        # --ignore-errors: 继续处理播放列表中的其他视频，即使某个视频下载失败
-        'ignoreerrors': True,
-    }
-    js_rt = preferred_js_runtimes()
-    if js_rt:
-        base_ydl_opts['js_runtimes'] = js_rt
-    bili = extra_ydl_opts_for_url(url)
-    if bili:
-        # 若日后 base 也带 http_headers，此处需合并子 dict
-        base_ydl_opts.update(bili)
+    if audio_profile is None:
+        audio_profile = AudioProfile(volume=audio_volume_multiplier or 1.0)
+    base_ydl_opts = build_base_ydl_opts(url, browser_cookies, cookie_file, force_overwrites)
 
-    if cookie_file:
-        base_ydl_opts['cookiefile'] = cookie_file
-    elif browser_cookies:
-        base_ydl_opts['cookiesfrombrowser'] = (browser_cookies,)
+    # 视频和音频都要时，先提取一次元数据，两个阶段共用
+    if info is None and download_video and download_audio:
+        try:
+            info = extract_media_info(url, browser_cookies, cookie_file)
+        except Exception:
+            info = None
+
+    # 视频阶段最终落盘的文件 (info_dict, 路径)，供音频阶段直接复用
+    video_files = []
 
     # 1. 下载视频
     if download_video:
@@ -92,97 +371,171 @@ def download_media(
                 'key': 'FFmpegVideoConvertor',
                 'preferedformat': 'mp4',
             }],
+            # 文件落盘后登记到本地下载索引，供批量脚本零网络跳过
+            'postprocessor_hooks': [make_index_hook(output_dir, 'video'), _final_file_collector(video_files)],
         })
         
-        try:
-            print(f"开始从 {url} 下载视频...")
-            with yt_dlp.YoutubeDL(video_opts) as ydl:
-                ydl.download([url])
-        except yt_dlp.utils.DownloadError as e:
-            print(f"\n下载视频时出错: {e}")
-        except Exception as e:
-            print(f"发生未知错误: {e}")
+        default_progress.log(f"开始从 {url} 下载视频...")
+        error = _run_ydl_stage_with_retry(video_opts, url, info)
+        if error:
+            default_progress.log(f"\n下载视频时出错: {error}")
 
     # 2. 下载音频
     if download_audio:
         audio_dir = os.path.join(output_dir, 'audios')
         os.makedirs(audio_dir, exist_ok=True)
-        
+
+        # 同一首歌已从其他来源下载过（标题与时长相同）时不再下载；提取的元数据直接给下载阶段复用
+        if default_dedup.enabled and not force_overwrites:
+            if info is None:
+                try:
+                    info = extract_media_info(url, browser_cookies, cookie_file)
+                except Exception:
+                    info = None
+            if is_single_video(info):
+                duplicate = default_dedup.check_metadata(
+                    output_dir, normalize_extractor(info.get('extractor_key')), info['id'], info.get('title'),
+                    info.get('duration'), expected_audio_path(info, output_dir, audio_profile.ext),
+                )
+                if duplicate:
+                    default_progress.log(f"音频与已下载的文件相同，跳过下载: {os.path.basename(duplicate)}")
+                    return
+
+        # 视频已在本地：直接从视频抽取音轨，同一份音频数据只经过网络一次
+        if audio_from_video and video_files:
+            if _audio_from_local_files(video_files, output_dir, audio_profile, force_overwrites):
+                return
+            default_progress.log("从视频抽取音频未全部成功，改为联网下载音频...")
+
+        # 响度标准化需要先测量整段音频；调音量、或禁止直接封装时，yt-dlp 的 FFmpegExtractAudio
+        # 遇到源编码与目标一致会改用 -c:a copy（与滤镜冲突）甚至跳过转换。这些情况只下载原始音频流，
+        # 再由 extract_audio_from_file 按音频配置一次编码
+        if audio_profile.needs_filter or not audio_profile.stream_copy:
+            default_progress.log(f"开始从 {url} 下载音频...")
+            error = _fetch_audio_with_retry(url, output_dir, browser_cookies, cookie_file, force_overwrites, info,
+                                            audio_profile)
+            if error:
+                default_progress.log(f"\n提取音频时出错: {error}")
+            return
+
         audio_opts = base_ydl_opts.copy()
         audio_opts.update({
             'format': 'bestaudio/best',
             # 使用包含唯一ID的文件名模板，防止冲突
             'outtmpl': os.path.join(audio_dir, '%(title)s [%(id)s].%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
+            'postprocessors': [audio_profile.ytdlp_postprocessor()],
+            'postprocessor_hooks': [make_index_hook(output_dir, 'audio'), make_dedup_hook(output_dir)],
         })
-        
-        # 如果指定了音量调节，添加 ffmpeg 参数
-        if audio_volume_multiplier and audio_volume_multiplier != 1.0:
-            audio_opts['postprocessor_args'] = ['-af', f'volume={audio_volume_multiplier}']
 
+        default_progress.log(f"开始从 {url} 提取音频...")
+        error = _run_ydl_stage_with_retry(audio_opts, url, info)
+        if error:
+            default_progress.log(f"\n提取音频时出错: {error}")
+
+
+def _final_file_collector(files: list):
+    """生成 postprocessor_hooks 回调：收集每个条目移动到最终位置后的 (info_dict, 文件路径)。"""
+    def hook(d):
+        if d.get('status') == 'finished' and d.get('postprocessor') == 'MoveFiles':
+            info_dict = d.get('info_dict') or {}
+            if info_dict.get('filepath'):
+                files.append((info_dict, info_dict['filepath']))
+    return hook
+
+
+def _fetch_audio_with_retry(url, output_dir, browser_cookies, cookie_file, force_overwrites, info,
+                            profile: AudioProfile) -> Optional[str]:
+    """下载原始音频流（按错误类型重试）后交给 _audio_from_local_files 转码，返回错误信息。"""
+    raw_files: list = []
+
+    def attempt():
+        logger = YtdlpErrorCollector()
         try:
-            print(f"开始从 {url} 提取音频...")
-            with yt_dlp.YoutubeDL(audio_opts) as ydl:
-                ydl.download([url])
-        except yt_dlp.utils.DownloadError as e:
-            print(f"\n提取音频时出错: {e}")
+            raw_files[:] = fetch_audio(url, output_dir, browser_cookies, cookie_file, force_overwrites,
+                                       info=info, logger=logger)
         except Exception as e:
-            print(f"发生未知错误: {e}")
+            return str(e)
+        return None if raw_files else (logger.last_error or "未下载到任何音频流")
+
+    def on_retry(n, error_class, error, delay):
+        default_progress.log(f"{ERROR_CLASS_LABELS[error_class]}，{delay:.1f} 秒后第 {n} 次重试: {url}")
+
+    error = call_with_retry(attempt, lambda error: error, on_retry=on_retry)
+    if error:
+        return error
+    if not _audio_from_local_files(raw_files, output_dir, profile, force_overwrites, from_raw_stream=True):
+        return FFMPEG_MISSING if shutil.which('ffmpeg') is None else "转码失败"
+    return None
+
+
+def _audio_from_local_files(media_files, output_dir, profile: AudioProfile, force_overwrites,
+                            from_raw_stream=False) -> bool:
+    """
+    对本地的 (info_dict, 文件路径) 逐个抽取音频（文件名与音频模板一致），全部成功返回 True。
+
+    :param from_raw_stream: 文件是 fetch_audio 下载的原始音频流：使用 yt-dlp 报告的编码，转码成功后删除。
+    """
+    all_ok = True
+    # 视频阶段重试时同一文件可能被收集多次
+    for media_path, info_dict in dict((path, info) for info, path in media_files).items():
+        audio_path = audio_path_for(media_path, output_dir, profile.ext)
+        default_progress.log(f"{'转码音频' if from_raw_stream else '从本地视频抽取音频'}: {os.path.basename(audio_path)}")
+        extractor = normalize_extractor(info_dict.get('extractor_key'))
+        loudness = None
+        if profile.loudnorm is not None:
+            loudness = cached_loudness(output_dir, extractor, info_dict.get('id'), media_path)
+        # 视频可能在 FFmpegVideoConvertor 中被重新编码过，info_dict 里的 acodec 不可靠，交给 ffprobe 探测
+        src_codec = info_dict.get('acodec') if from_raw_stream else None
+        if not extract_audio_from_file(media_path, audio_path, force_overwrites=force_overwrites,
+                                       remove_source=from_raw_stream, profile=profile, src_codec=src_codec,
+                                       loudness=loudness):
+            all_ok = False
+            continue
+        default_progress.log(f"处理完成: {os.path.basename(audio_path)}")
+        if info_dict.get('id'):
+            open_index(output_dir).record(extractor, info_dict['id'], 'audio', audio_path)
+            default_dedup.dedup_file(output_dir, extractor, info_dict['id'], audio_path)
+    return all_ok
 
 
 def progress_hook(d):
+    """yt-dlp progress_hooks：字节进度交给 progress.default_progress 汇总，worker 线程不直接写终端。"""
+    default_progress.hook(d)
     if d['status'] == 'finished':
         # 文件名可能包含路径，我们只取文件名部分
         filename = os.path.basename(d['filename'])
-        print(f"处理完成: {filename}")
+        default_progress.log(f"处理完成: {filename}")
     elif d['status'] == 'error':
-        print(f"处理 {d.get('filename', '未知文件')} 时出错")
+        default_progress.log(f"处理 {d.get('filename', '未知文件')} 时出错")
 
 
-def read_links_file(path: str) -> List[str]:
-    urls: List[str] = []
-    with open(path, "r", encoding="utf-8") as f:
-        for raw_line in f:
-            line = raw_line.strip()
-            if not line or line.startswith("#"):
-                continue
-            urls.append(line)
-    return urls
+def read_links_file(path: str) -> Iterator[str]:
+    """逐行读取链接文件（支持 '-' 标准输入、.gz 和 JSONL），见 links_input.iter_links。"""
+    return iter_links(path)
 
 
-def iter_inputs_as_urls(inputs: Iterable[str]) -> List[str]:
-    urls: List[str] = []
-    for item in inputs:
-        item = item.strip()
-        if not item:
-            continue
+def iter_inputs_as_urls(inputs: Iterable[str]) -> Iterator[str]:
+    def expand():
+        for item in inputs:
+            item = item.strip()
+            if not item:
+                continue
 
-        # 优先把 http(s) 开头的当作 URL（避免与本地同名文件冲突）
-        if item.startswith(("http://", "https://")):
-            urls.append(item)
-            continue
+            # 优先把 http(s) 开头的当作 URL（避免与本地同名文件冲突）
+            if item.startswith(("http://", "https://")):
+                yield item
+                continue
 
-        # 其次：如果是文件，则按 links.txt 形式读取
-        if os.path.isfile(item):
-            urls.extend(read_links_file(item))
-            continue
+            # 其次：'-' 或文件，按 links.txt 形式流式读取
+            if item == STDIN_PATH or os.path.isfile(item):
+                yield from read_links_file(item)
+                continue
 
-        # 否则按 URL/平台短链等原样处理（例如 bilibili/抖音可能不是 http 开头）
-        urls.append(item)
+            # 否则按 URL/平台短链等原样处理（例如 bilibili/抖音可能不是 http 开头）
+            yield item
 
-    # 去重但保持顺序
-    seen = set()
-    deduped: List[str] = []
-    for u in urls:
-        if u in seen:
-            continue
-        seen.add(u)
-        deduped.append(u)
-    return deduped
+    # 按 (站点, 视频ID) 去重但保持顺序：追踪参数、http/https、短链等不同写法只保留一个
+    return unique_canonical_urls(expand())
 
 
 if __name__ == '__main__':
@@ -194,7 +547,8 @@ if __name__ == '__main__':
             "  python main.py links.txt --no-video        (从 links.txt 批量下载音频)\n"
             "  python main.py url1 url2 links.txt         (混合多个链接/文件)\n"
             "\n"
-            "说明: 传入的本地文件会按 links.txt 规则读取（每行一个链接，支持 # 注释）。"
+            "说明: 传入的本地文件会按 links.txt 规则读取（每行一个链接，支持 # 注释）；\n"
+            "      也可以是 .gz 压缩文件、JSONL（取 url 字段），或用 '-' 从标准输入读取。"
         ),
         formatter_class=argparse.RawTextHelpFormatter,
     )
@@ -202,6 +556,11 @@ if __name__ == '__main__':
     parser.add_argument("-o", "--output", default="downloads", help="输出文件的根目录 (默认为 'downloads')")
     parser.add_argument("--no-video", action="store_true", help="不下载视频文件")
     parser.add_argument("--no-audio", action="store_true", help="不提取音频文件")
+    parser.add_argument(
+        "--audio-from-network",
+        action="store_true",
+        help="同时下载视频和音频时，音频也单独联网下载（默认直接从已下载的视频中抽取音轨）。"
+    )
     parser.add_argument(
         "--force-overwrites",
         action="store_true",
@@ -217,6 +576,14 @@ if __name__ == '__main__':
         metavar="BROWSER",
         help="从指定浏览器加载 Cookies (例如: chrome, firefox, edge, opera)。对抖音等网站可能需要此选项。"
     )
+    add_profile_arguments(parser)
+    parser.add_argument(
+        "--js-worker",
+        action="store_true",
+        help="用常驻的 node 进程求解 YouTube JS 挑战（n 参数/签名），省去每个视频启动 JS 运行时的开销。"
+    )
+    add_segmented_arguments(parser)
+    add_dedup_arguments(parser)
 
     args = parser.parse_args()
 
@@ -226,13 +593,16 @@ if __name__ == '__main__':
     if not should_download_video and not should_download_audio:
         print("错误: 您必须选择下载视频或音频中的至少一项。")
         sys.exit(1)
+    require_yt_dlp()
+    if should_download_audio:
+        require_ffmpeg()
 
-    urls = iter_inputs_as_urls(args.inputs)
-    if not urls:
-        print("错误: 未解析到任何可下载的链接。")
-        sys.exit(1)
-
-    for url in urls:
+    enable_js_challenge_cache(args.output, persistent_worker=args.js_worker)
+    configure_segmented_from_args(args)
+    configure_dedup_from_args(args)
+    processed = 0
+    for url in iter_inputs_as_urls(args.inputs):
+        processed += 1
         download_media(
             url,
             args.output,
@@ -241,4 +611,9 @@ if __name__ == '__main__':
             args.cookies_from_browser,
             args.cookies,
             args.force_overwrites,
+            audio_from_video=not args.audio_from_network,
+            audio_profile=profile_from_args(args),
         )
+    if not processed:
+        print("错误: 未解析到任何可下载的链接。")
+        sys.exit(1)
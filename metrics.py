@@ -0,0 +1,288 @@
+"""
+结构化指标 —— 按条目、按阶段记录耗时、传输字节数、吞吐和重试次数，用来判断瓶颈在哪一级。
+
+阶段（stage）：
+- schedule   ：条目在站点调度器中排队/等待名额的时间
+- extract    ：元数据提取（网页、播放器 JS、API）
+- download   ：网络传输（来自 yt-dlp 的 progress_hooks，附带字节数）
+- postprocess：yt-dlp 后处理（FFmpegExtractAudio 等，来自 postprocessor_hooks）
+- disk       ：文件移动到最终位置（postprocessor_hooks 中的 MoveFiles）
+- queue      ：原始音频在待转码队列中等待的时间
+- loudness   ：响度测量（缓存未命中时才有）
+- transcode  ：ffmpeg 转码（含响度测量）
+
+数据始终在内存中汇总（批量脚本结束时打印各阶段耗时）；另外可以：
+- --metrics-jsonl FILE：每个事件一行 JSON（stage / retry / item 三种）；
+- --metrics-prom FILE ：Prometheus 文本格式的汇总，运行中定期覆盖写入；
+- --metrics-port PORT ：在 127.0.0.1:PORT/metrics 提供同样的文本，供 Prometheus 抓取。
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+STAGE_LABELS = {
+    "schedule": "排队",
+    "extract": "元数据提取",
+    "download": "网络传输",
+    "postprocess": "yt-dlp 后处理",
+    "disk": "移动文件",
+    "queue": "等待转码",
+    "loudness": "响度测量",
+    "transcode": "转码",
+    "dedup": "去重指纹",
+}
+
+# 条目状态在指标中使用的英文标签
+ITEM_STATUS_LABELS = {"成功": "ok", "已存在": "skipped", "错误": "failed", "展开": "expanded", "已取消": "cancelled"}
+
+# Prometheus 文本文件的最短重写间隔（秒）
+PROM_WRITE_INTERVAL = 1.0
+
+
+class _StageTotals:
+    __slots__ = ("count", "seconds", "max_seconds", "bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+
+
+class Metrics:
+    """线程安全的指标收集器；当前线程正在处理的条目由 item() 设置，钩子里的事件据此归属到 URL。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages: Dict[str, _StageTotals] = {}
+        self._retries: Dict[str, int] = {}
+        self._items: Dict[str, int] = {}
+        self._pp_started: Dict[tuple, float] = {}
+        self._jsonl = None
+        self._prom_path: Optional[str] = None
+        self._prom_written = 0.0
+        self._server = None  # 本地 HTTP 端点，只在指定端口时才创建（http.server 按需导入）
+
+    def configure(self, jsonl_path: Optional[str] = None, prom_path: Optional[str] = None,
+                  port: Optional[int] = None):
+        """打开输出：JSON lines 文件（追加）、Prometheus 文本文件、本地 HTTP 端点。"""
+        if jsonl_path:
+            self._jsonl = open(jsonl_path, "a", encoding="utf-8")
+        self._prom_path = prom_path
+        if port:
+            self._serve(port)
+
+    # ---- 事件 ----
+    @contextmanager
+    def item(self, url: str):
+        """在当前线程内把之后的事件归属到 url（可嵌套）。"""
+        previous = getattr(self._local, "url", None)
+        self._local.url = url
+        try:
+            yield
+        finally:
+            self._local.url = previous
+
+    def bind(self, url: str, fn):
+        """返回在 item(url) 中调用 fn 的函数，用于提交到线程池的任务。"""
+        def wrapper(*args, **kwargs):
+            with self.item(url):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    @property
+    def current_url(self) -> Optional[str]:
+        return getattr(self._local, "url", None)
+
+    @contextmanager
+    def stage(self, name: str, url: Optional[str] = None, **fields):
+        """计时一个阶段：with metrics.stage('extract'): ..."""
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - t0, url=url, **fields)
+
+    def record(self, stage: str, seconds: float, nbytes: int = 0, url: Optional[str] = None, **fields):
+        with self._lock:
+            totals = self._stages.get(stage)
+            if totals is None:
+                totals = self._stages[stage] = _StageTotals()
+            totals.count += 1
+            totals.seconds += seconds
+            totals.max_seconds = max(totals.max_seconds, seconds)
+            totals.bytes += nbytes
+        event = {"stage": stage, "seconds": round(seconds, 4)}
+        if nbytes:
+            event["bytes"] = nbytes
+            if seconds > 0:
+                event["bytes_per_sec"] = round(nbytes / seconds)
+        self._emit("stage", url, event, fields)
+
+    def record_retry(self, error_class: str, url: Optional[str] = None, attempt: Optional[int] = None):
+        with self._lock:
+            self._retries[error_class] = self._retries.get(error_class, 0) + 1
+        self._emit("retry", url, {"error_class": error_class, "attempt": attempt}, {})
+
+    def record_item(self, url: str, status: str, seconds: float, retries: int = 0):
+        """一个条目处理结束（与批量脚本打印的 [OK]/[FAIL] 行对应）。"""
+        label = ITEM_STATUS_LABELS.get(status, status)
+        with self._lock:
+            self._items[label] = self._items.get(label, 0) + 1
+        self._emit("item", url, {"status": label, "seconds": round(seconds, 4), "retries": retries}, {})
+        if self._prom_path and time.time() - self._prom_written >= PROM_WRITE_INTERVAL:
+            self.write_prometheus()
+
+    def _emit(self, event_type: str, url: Optional[str], event: dict, fields: dict):
+        if self._jsonl is None:
+            return
+        line = {"ts": round(time.time(), 3), "event": event_type, "url": url or self.current_url}
+        line.update(event)
+        line.update({key: value for key, value in fields.items() if value is not None})
+        text = json.dumps(line, ensure_ascii=False)
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.write(text + "\n")
+                self._jsonl.flush()
+
+    # ---- yt-dlp 钩子 ----
+    def progress_hook(self, d):
+        """yt-dlp progress_hooks：每个文件下载完成时记录传输耗时与字节数。"""
+        if d.get("status") != "finished":
+            return
+        nbytes = d.get("total_bytes") or d.get("downloaded_bytes") or 0
+        info = d.get("info_dict") or {}
+        self.record("download", d.get("elapsed") or 0.0, int(nbytes),
+                    url=self.current_url or info.get("webpage_url"), video_id=info.get("id"))
+
+    def postprocessor_hook(self, d):
+        """yt-dlp postprocessor_hooks：记录每个后处理器的耗时（MoveFiles 记为 disk）。"""
+        name = d.get("postprocessor")
+        key = (threading.get_ident(), name)
+        if d.get("status") == "started":
+            self._pp_started[key] = time.time()
+            return
+        if d.get("status") != "finished":
+            return
+        t0 = self._pp_started.pop(key, None)
+        if t0 is None:
+            return
+        info = d.get("info_dict") or {}
+        self.record("disk" if name == "MoveFiles" else "postprocess", time.time() - t0,
+                    url=self.current_url or info.get("webpage_url"), postprocessor=name, video_id=info.get("id"))
+
+    # ---- 汇总 ----
+    def summary_lines(self) -> List[str]:
+        """各阶段的次数、总耗时、平均/最长耗时，网络传输附带总量与平均吞吐。"""
+        with self._lock:
+            stages = [(name, self._stages[name]) for name in STAGE_LABELS if name in self._stages]
+            retries = dict(self._retries)
+        lines = []
+        for name, totals in stages:
+            line = (
+                f"阶段 {STAGE_LABELS[name]}: {totals.count} 次, 共 {totals.seconds:.1f} 秒, "
+                f"平均 {totals.seconds / totals.count:.2f} 秒, 最长 {totals.max_seconds:.1f} 秒"
+            )
+            if totals.bytes:
+                line += f", {totals.bytes / 1e6:.1f} MB"
+                if totals.seconds > 0:
+                    line += f", {totals.bytes / totals.seconds / 1e6:.2f} MB/s"
+            lines.append(line)
+        if retries:
+            lines.append("按错误类型重试: " + ", ".join(f"{cls} {n} 次" for cls, n in sorted(retries.items())))
+        return lines
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            stages = sorted(self._stages.items())
+            retries = sorted(self._retries.items())
+            items = sorted(self._items.items())
+        out = [
+            "# HELP ytdl_stage_seconds Time spent per pipeline stage.",
+            "# TYPE ytdl_stage_seconds summary",
+        ]
+        for name, totals in stages:
+            out.append(f'ytdl_stage_seconds_sum{{stage="{name}"}} {totals.seconds:.6f}')
+            out.append(f'ytdl_stage_seconds_count{{stage="{name}"}} {totals.count}')
+        out += ["# HELP ytdl_stage_seconds_max Longest single run per stage.", "# TYPE ytdl_stage_seconds_max gauge"]
+        for name, totals in stages:
+            out.append(f'ytdl_stage_seconds_max{{stage="{name}"}} {totals.max_seconds:.6f}')
+        out += ["# HELP ytdl_stage_bytes_total Bytes transferred per stage.", "# TYPE ytdl_stage_bytes_total counter"]
+        for name, totals in stages:
+            if totals.bytes:
+                out.append(f'ytdl_stage_bytes_total{{stage="{name}"}} {totals.bytes}')
+        out += ["# HELP ytdl_retries_total Retries by error class.", "# TYPE ytdl_retries_total counter"]
+        for error_class, n in retries:
+            out.append(f'ytdl_retries_total{{error_class="{error_class}"}} {n}')
+        out += ["# HELP ytdl_items_total Finished items by status.", "# TYPE ytdl_items_total counter"]
+        for status, n in items:
+            out.append(f'ytdl_items_total{{status="{status}"}} {n}')
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self):
+        """原子地覆盖写入 Prometheus 文本文件（先写临时文件再改名，抓取方不会读到半个文件）。"""
+        if not self._prom_path:
+            return
+        self._prom_written = time.time()
+        tmp_path = f"{self._prom_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self._prom_path)
+        except OSError:
+            pass
+
+    def _serve(self, port: int):
+        import http.server
+
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.write_prometheus()
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+# 进程内共享的收集器：main.py 的 yt-dlp 钩子、流水线和重试逻辑都往这里记录
+default_metrics = Metrics()
+atexit.register(default_metrics.close)
+
+
+def add_metrics_arguments(parser):
+    """给命令行加上 --metrics-jsonl / --metrics-prom / --metrics-port。"""
+    parser.add_argument("--metrics-jsonl", metavar="FILE", help="把每个条目各阶段的耗时/字节数/重试以 JSON lines 追加写入 FILE。")
+    parser.add_argument("--metrics-prom", metavar="FILE", help="运行中定期把汇总指标以 Prometheus 文本格式写入 FILE。")
+    parser.add_argument("--metrics-port", metavar="PORT", type=int, help="在 http://127.0.0.1:PORT/metrics 提供 Prometheus 指标。")
+
+
+def configure_from_args(args):
+    default_metrics.configure(args.metrics_jsonl, args.metrics_prom, args.metrics_port)
@@ -1,7 +1,8 @@
 """
 网易云音乐下载器 —— 从 网易云_id.txt 或命令行参数读取歌单 ID 并下载。
 
-底层依赖 ncm-dl（已安装），会自动处理 weapi 加密和下载。
+默认使用进程内的原生下载器（netease_native.py）：歌单解析成歌曲 ID 后按单曲并行下载，
+多个歌单共有的歌曲按 歌曲 ID 索引只下载一次。某个歌单取不到时回退到 ncm-dl（需已安装）。
 歌单中 VIP/付费歌曲若未设置 MUSIC_U 环境变量会被跳过。
 
 用法：
@@ -14,16 +15,58 @@
   # 指定输出文件夹
   python netease_dl.py 504948603 -o downloads/audios
 
+  # 16 个线程并行下载单曲
+  python netease_dl.py --track-workers 16
+
+  # 只用 ncm-dl：同时运行 4 个进程，每首歌最多 90 秒
+  python netease_dl.py --use-ncm-dl -j 4 --timeout-per-track 90
+
+  # 已从 YouTube/B 站下载过的同一首歌不再下载，重复文件改为硬链接
+  python netease_dl.py 504948603 --dedup link
+
 设置 MUSIC_U Cookie:
   export MUSIC_U='你的MUSIC_U值'
 """
 
 import os
+import re
 import sys
 import subprocess
 import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+from audio_dedup import add_dedup_arguments, configure_dedup_from_args, default_dedup
+from download_index import open_index
+from netease_native import (
+    INDEX_EXTRACTOR,
+    HTTPPool,
+    NativeNeteaseDownloader,
+    NeteaseClient,
+    NeteaseError,
+    PlaylistResult,
+    default_index_dir,
+    safe_print,
+)
 
+# 超时 = 基础时间 + 每首歌的时间 × 曲目数；读到曲目数之前只按基础时间计
+DEFAULT_TIMEOUT_BASE = 120.0
+DEFAULT_TIMEOUT_PER_TRACK = 60.0
+
+# ncm-dl 输出中的关键行
+_PLAYLIST_RE = re.compile(r"^歌单: (?P<name>.*) \((?P<id>\d+)\)$")
+_TRACKS_RE = re.compile(r"^曲目: (?P<count>\d+)/(?P<total>\d+)")
+_TRACK_START_RE = re.compile(r"^\[(?P<index>\d+)/(?P<count>\d+)\] (?P<song_id>\d+)$")
+_OUTPUT_RE = re.compile(r"^输出: (?P<path>.+)$")
+_SKIPPED_RE = re.compile(r"^已存在(?:同 ID 文件)?，跳过下载")
+_FAILED_RE = re.compile(r"^失败: (?P<song_id>\d+): (?P<reason>.*)$")
+_MATCHED_RE = re.compile(r"^成功匹配文件: (?P<matched>\d+)/(?P<count>\d+)")
+_PROGRESS_RE = re.compile(r"^\[[#-]*\]\s+\d+%|^downloaded ")
+_M3U_HINT = "/opt/navidrome"
 
 def _ncm_dl_bin() -> str:
     """返回 ncm-dl 可执行文件的绝对路径。"""
@@ -40,8 +83,100 @@ def _ncm_dl_bin() -> str:
     return "ncm-dl"  # fallback
 
 
-def download_playlist(playlist_id: int, output_dir: str, overwrite: bool = False) -> int:
-    """调用 ncm-dl 下载歌单，返回成功下载数。"""
+@dataclass
+class NcmPlaylistResult(PlaylistResult):
+    """由 ncm-dl 的输出逐行解析得到的歌单结果。"""
+    files: List[Tuple[str, str]] = field(default_factory=list)  # 新下载的 (歌曲 ID, 文件路径)
+    _current: Optional[str] = field(default=None, repr=False)  # 当前曲目：pending / skipped / failed
+    _song_id: Optional[str] = field(default=None, repr=False)
+    _path: Optional[str] = field(default=None, repr=False)
+
+    def _finish_track(self):
+        if self._current == "pending":
+            self.downloaded += 1
+            if self._song_id and self._path:
+                self.files.append((self._song_id, self._path))
+        self._current = None
+
+    def feed(self, line: str) -> bool:
+        """解析一行输出，返回该行是否标志着一首歌处理完毕（用于刷新进度）。"""
+        m = _TRACK_START_RE.match(line)
+        if m:
+            finished = self._current is not None
+            self._finish_track()
+            self._current = "pending"
+            self._song_id, self._path = m.group("song_id"), None
+            self.track_count = self.track_count or int(m.group("count"))
+            return finished
+        m = _OUTPUT_RE.match(line)
+        if m:
+            self._path = m.group("path")
+            return False
+        if _SKIPPED_RE.match(line):
+            self.skipped += 1
+            self._current = "skipped"
+            return False
+        m = _FAILED_RE.match(line)
+        if m:
+            self.failed += 1
+            self._current = "failed"
+            self.errors.append(f"{m.group('song_id')}: {m.group('reason')}")
+            return False
+        m = _PLAYLIST_RE.match(line)
+        if m:
+            self.name = m.group("name")
+            return False
+        m = _TRACKS_RE.match(line)
+        if m:
+            self.track_count = int(m.group("count"))
+            return False
+        if _MATCHED_RE.match(line):
+            self._finish_track()
+            return True
+        if line.startswith("错误:"):
+            self.errors.append(line)
+        return False
+
+    def close(self):
+        """进程结束：超时被杀时最后一首视为未完成。"""
+        if self.timed_out:
+            self._current = None
+        self._finish_track()
+
+
+def dedup_ncm_files(result: NcmPlaylistResult, output_dir: str):
+    """
+    ncm-dl 不支持 --dedup：它结束后把新下载的文件登记到下载索引（与原生下载器相同），
+    再按 --dedup 的设置交给 default_dedup 与已有音频比较、合并。
+    """
+    if not result.files:
+        return
+    index_dir = default_index_dir(output_dir)
+    index = open_index(index_dir)
+    for song_id, path in result.files:
+        if os.path.exists(path):
+            index.record(INDEX_EXTRACTOR, song_id, "audio", path)
+            default_dedup.dedup_file(index_dir, INDEX_EXTRACTOR, song_id, path)
+
+
+def playlist_timeout(track_count: int, base: float = DEFAULT_TIMEOUT_BASE,
+                     per_track: float = DEFAULT_TIMEOUT_PER_TRACK) -> float:
+    """按曲目数计算歌单的超时时间（秒）。"""
+    return base + per_track * max(track_count, 0)
+
+
+def download_playlist(
+    playlist_id: int,
+    output_dir: str,
+    overwrite: bool = False,
+    timeout_base: float = DEFAULT_TIMEOUT_BASE,
+    timeout_per_track: float = DEFAULT_TIMEOUT_PER_TRACK,
+) -> PlaylistResult:
+    """
+    调用 ncm-dl 下载歌单，逐行读取它的输出并解析成进度，返回 PlaylistResult。
+
+    超时按曲目数计算（读到 “曲目: N/M” 之前只按基础时间），超时后结束 ncm-dl 进程。
+    """
     ncm_dl = _ncm_dl_bin()
     cmd = [
         ncm_dl, "playlist",
@@ -54,35 +189,152 @@ def download_playlist(playlist_id: int, output_dir: str, overwrite: bool = False
     if overwrite:
         cmd.append("--overwrite")
 
-    # 捕获 stderr 中可能提取的计数
-    print(f"执行: {' '.join(cmd)}")
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+    tag = f"[歌单 {playlist_id}]"
+    result = NcmPlaylistResult(playlist_id)
+    safe_print(f"{tag} 执行: {' '.join(cmd)}")
+    start = time.monotonic()
+
+    # ncm-dl 是 Python 程序：关闭输出缓冲才能逐行拿到进度；stderr 合并进 stdout 一起解析。
+    # 文本模式的通用换行会把进度条的 \r 也当作换行，一行一行地读
+    env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8")
+    try:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, encoding="utf-8", errors="replace", bufsize=1, env=env,
+        )
+    except OSError as e:
+        result.errors.append(f"无法启动 ncm-dl: {e}")
+        result.returncode = -1
+        return result
 
-    # 始终打印 stdout （包含歌单信息和进度）
-    if result.stdout:
-        print(result.stdout)
+    done = threading.Event()
 
-    # 如果返回非 0 且输出中有错误信息，打印 stderr
+    def watchdog():
+        while not done.wait(1.0):
+            limit = playlist_timeout(result.track_count, timeout_base, timeout_per_track)
+            if time.monotonic() - start > limit:
+                result.timed_out = True
+                proc.kill()
+                return
+
+    threading.Thread(target=watchdog, daemon=True).start()
+    try:
+        for raw_line in proc.stdout:
+            line = raw_line.strip()
+            if not line or _PROGRESS_RE.match(line):
+                continue
+            if result.feed(line):
+                safe_print(f"{tag} {result.name} {result.progress_text()}")
+        result.returncode = proc.wait()
+    finally:
+        done.set()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    result.close()
+    dedup_ncm_files(result, output_dir)
+    result.elapsed = time.monotonic() - start
+
+    if result.timed_out:
+        limit = playlist_timeout(result.track_count, timeout_base, timeout_per_track)
+        safe_print(f"{tag} 超时（{limit:.0f}s），已结束 ncm-dl：{result.progress_text()}")
+        return result
     if result.returncode != 0:
-        err_msg = result.stderr.strip()
-        if err_msg:
-            print(f"警告（ncm-dl 返回码 {result.returncode}）: {err_msg}")
-            print("（这是 ncm-dl 尝试写 M3U 到 /opt/navidrome 权限不足，不影响歌曲下载）")
+        safe_print(f"{tag} 警告（ncm-dl 返回码 {result.returncode}）: {'; '.join(result.errors[-3:])}")
+        if any(_M3U_HINT in error for error in result.errors):
+            safe_print("（这是 ncm-dl 尝试写 M3U 到 /opt/navidrome 权限不足，不影响歌曲下载）")
+    safe_print(f"{tag} {result.name} 完成 {result.progress_text()}，用时 {result.elapsed:.1f}s")
+    return result
+
 
-    return result.returncode
+def download_playlists(
+    playlist_ids: List[int],
+    output_dir: str,
+    overwrite: bool = False,
+    jobs: int = 3,
+    timeout_base: float = DEFAULT_TIMEOUT_BASE,
+    timeout_per_track: float = DEFAULT_TIMEOUT_PER_TRACK,
+    native: bool = True,
+    track_workers: int = 8,
+    api_base: Optional[str] = None,
+) -> List[PlaylistResult]:
+    """
+    并行下载多个歌单，按输入顺序返回结果。
+
+    :param jobs: 同时处理的歌单数（ncm-dl 模式下即并行的 ncm-dl 进程数）。
+    :param native: 使用进程内的单曲级下载器；某个歌单取不到时只对该歌单回退到 ncm-dl。
+    :param track_workers: 原生模式下所有歌单共享的单曲下载线程数。
+    :param api_base: 原生模式的接口地址（测试时可指向本地 mock 服务）。
+    """
+    downloader = None
+    if native:
+        downloader = NativeNeteaseDownloader(
+            output_dir,
+            NeteaseClient(api_base=api_base, pool=HTTPPool(max_idle_per_host=track_workers)),
+            workers=track_workers,
+            overwrite=overwrite,
+        )
+
+    def run_one(pid: int) -> PlaylistResult:
+        if downloader is not None:
+            try:
+                return downloader.download_playlist(pid)
+            except NeteaseError as e:
+                safe_print(f"[歌单 {pid}] 原生下载失败（{e}），回退到 ncm-dl")
+        return download_playlist(pid, output_dir, overwrite, timeout_base, timeout_per_track)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            futures = [pool.submit(run_one, pid) for pid in playlist_ids]
+            return [future.result() for future in futures]
+    finally:
+        if downloader is not None:
+            downloader.close()
+
+
+def print_summary(results: List[PlaylistResult]):
+    print("\n" + "=" * 60)
+    for r in results:
+        status = "超时" if r.timed_out else ("完成" if r.ok else "有失败")
+        print(f"{r.playlist_id} {r.name}: {status}，{r.progress_text()}，{r.elapsed:.1f}s")
+        for error in r.errors[:5]:
+            print(f"  - {error}")
+    print("-" * 60)
+    print(f"共处理 {len(results)} 个歌单："
+          f"完成 {sum(r.ok for r in results)}，超时 {sum(r.timed_out for r in results)}，"
+          f"有失败 {sum(not r.ok and not r.timed_out for r in results)}")
+    print(f"歌曲：下载 {sum(r.downloaded for r in results)}，跳过（已存在）{sum(r.skipped for r in results)}，"
+          f"失败 {sum(r.failed for r in results)}，歌单总曲目 {sum(r.track_count for r in results)}")
+    if default_dedup.enabled:
+        print(default_dedup.summary_line())
 
 
 def main():
     parser = argparse.ArgumentParser(
-        description="网易云音乐歌单下载器（基于 ncm-dl）",
+        description="网易云音乐歌单下载器（原生单曲并行下载，失败时回退到 ncm-dl）",
     )
     parser.add_argument("input", nargs="?", help="歌单 ID（数字）；留空则从 网易云_id.txt 读取")
     parser.add_argument("-o", "--output", default="downloads/audios",
                         help="输出目录 (默认 downloads/audios)")
     parser.add_argument("--overwrite", action="store_true",
                         help="覆盖已存在的文件")
+    parser.add_argument("-j", "--jobs", type=int, default=3,
+                        help="同时处理的歌单数 (默认 3)；ncm-dl 模式下即并行的 ncm-dl 进程数")
+    parser.add_argument("--track-workers", type=int, default=8,
+                        help="原生下载器中所有歌单共享的单曲下载线程数 (默认 8)")
+    parser.add_argument("--use-ncm-dl", action="store_true",
+                        help="不使用原生下载器，整个歌单交给外部 ncm-dl")
+    parser.add_argument("--api-base", default=None,
+                        help="原生下载器的接口地址 (默认 https://music.163.com，也可用环境变量 NCM_API_BASE)")
+    parser.add_argument("--timeout-base", type=float, default=DEFAULT_TIMEOUT_BASE,
+                        help=f"每个歌单的基础超时秒数 (默认 {DEFAULT_TIMEOUT_BASE:.0f})")
+    parser.add_argument("--timeout-per-track", type=float, default=DEFAULT_TIMEOUT_PER_TRACK,
+                        help=f"每首歌追加的超时秒数 (默认 {DEFAULT_TIMEOUT_PER_TRACK:.0f})；"
+                             "歌单超时 = 基础 + 每首 × 曲目数")
+    add_dedup_arguments(parser)
 
     args = parser.parse_args()
+    configure_dedup_from_args(args)
 
     ids: list[str] = []
     if args.input:
@@ -101,18 +353,18 @@ def main():
         sys.exit(1)
 
     print(f"从 网易云_id.txt 读取到 {len(ids)} 个 ID")
-    total = 0
+    playlist_ids: list[int] = []
     for item in ids:
-        print(f"\n========== 处理歌单: {item} ==========")
         try:
-            pid = int(item)
+            playlist_ids.append(int(item))
         except ValueError:
             print(f"跳过无效 ID: {item}")
-            continue
-        download_playlist(pid, args.output, args.overwrite)
-        total += 1
 
-    print(f"\n共处理 {total} 个歌单")
+    results = download_playlists(
+        playlist_ids, args.output, args.overwrite, args.jobs, args.timeout_base, args.timeout_per_track,
+        native=not args.use_ncm_dl, track_workers=args.track_workers, api_base=args.api_base,
+    )
+    print_summary(results)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,298 @@
+"""
+网易云接口的本地替身与原生下载器的端到端检查 —— 不访问 music.163.com。
+
+MockNeteaseServer 实现 netease_native.NeteaseClient 用到的全部明文接口：
+- /api/v6/playlist/detail          歌单详情（trackIds）
+- /api/song/detail/                歌曲名、歌手、时长
+- /api/song/enhance/player/url/v1  新版播放地址接口
+- /api/song/enhance/player/url     旧版播放地址接口（新版拿不到地址时回退）
+- /media/<歌曲ID>.mp3              音频内容（每首歌内容不同，便于核对）
+和 benchmark.py 的替身服务一样支持 HTTP/1.1 keep-alive，并统计每个接口的请求数和 TCP 连接数。
+
+默认运行一组检查，用 NativeNeteaseDownloader 走完真实代码路径并核对结果，任一项不符时退出码为 1：
+- 首次下载歌单：普通歌曲下载成功、新版接口拿不到地址的歌曲回退到旧版接口、VIP 歌曲记为失败；
+- 与之前歌单共有的歌曲按索引零网络跳过（不请求详情、播放地址和音频）；
+- 同时下载两个共有歌曲的歌单时，共有歌曲只下载一次；
+- 重新运行时全部跳过，不再请求播放地址；不存在的歌单抛出 NeteaseError（netease_dl.py 据此回退到 ncm-dl）；
+- 所有请求复用少量 keep-alive 连接。
+
+用法：
+  # 运行端到端检查
+  python netease_mock.py
+
+  # 只启动替身服务，配合 netease_dl.py 手动测试（Ctrl+C 结束）
+  python netease_mock.py --serve --port 8766
+  python netease_dl.py 1001 --api-base http://127.0.0.1:8766 -o mock_downloads/audios
+"""
+
+import argparse
+import http.server
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import Counter
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# 替身歌曲：(歌曲ID, 歌名, 歌手, 时长毫秒)
+SONGS = (
+    (2001, "晴天", "周杰伦", 269000),
+    (2002, "稻香", "周杰伦", 223000),
+    (2003, "后来", "刘若英", 341000),
+    (2004, "平凡之路", "朴树", 301000),
+    (2005, "光年之外", "G.E.M.邓紫棋", 235000),
+    (2006, "起风了", "买辣椒也用券", 325000),
+)
+# 歌单：歌单ID -> (歌单名, 歌曲ID)；1001 与 1002 共有 2003、2004
+PLAYLISTS = {
+    1001: ("替身歌单 A", (2001, 2002, 2003, 2004, 2006)),
+    1002: ("替身歌单 B", (2003, 2004, 2005)),
+    1003: ("替身歌单 C", (2004, 2005)),
+}
+# 新版接口不给地址、只能从旧版接口拿到的歌曲
+LEGACY_ONLY = (2002,)
+# 两个接口都不给地址的 VIP 歌曲
+VIP_ONLY = (2006,)
+# 检查时下载器的线程数（也是连接池每个主机的空闲连接数）
+WORKERS = 4
+
+
+def song_body(song_id: int) -> bytes:
+    """每首歌不同的合成“音频”内容（带 ID3 头，大小随歌曲 ID 变化）。"""
+    return b"ID3\x04\x00\x00\x00\x00\x00\x00" + str(song_id).encode("ascii") * (2000 + song_id % 97)
+
+
+class MockNeteaseServer:
+    """网易云明文接口的替身：按 SONGS / PLAYLISTS 返回 JSON，统计每个接口的请求数与连接数。"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.songs = {song_id: (name, artist, duration) for song_id, name, artist, duration in SONGS}
+        self.requests: Counter = Counter()
+        self.media_requests: Counter = Counter()
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._httpd: Optional[http.server.ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests.clear()
+            self.media_requests.clear()
+            self.connections = 0
+
+    def _playlist(self, query: dict) -> dict:
+        playlist_id = int((query.get("id") or ["0"])[0])
+        if playlist_id not in PLAYLISTS:
+            return {"code": 404, "playlist": None}
+        name, track_ids = PLAYLISTS[playlist_id]
+        return {"code": 200, "playlist": {"id": playlist_id, "name": name,
+                                          "trackIds": [{"id": song_id} for song_id in track_ids]}}
+
+    def _song_detail(self, query: dict) -> dict:
+        ids = json.loads((query.get("ids") or ["[]"])[0])
+        songs = []
+        for song_id in ids:
+            if song_id in self.songs:
+                name, artist, duration = self.songs[song_id]
+                songs.append({"id": song_id, "name": name, "artists": [{"name": artist}], "duration": duration})
+        return {"code": 200, "songs": songs}
+
+    def _song_url(self, query: dict, legacy: bool) -> dict:
+        song_id = json.loads((query.get("ids") or ["[]"])[0])[0]
+        playable = song_id in self.songs and song_id not in VIP_ONLY and (legacy or song_id not in LEGACY_ONLY)
+        if not playable:
+            return {"code": 200, "data": [{"id": song_id, "url": None, "size": 0, "type": None}]}
+        return {"code": 200, "data": [{"id": song_id, "url": f"{self.base_url}/media/{song_id}.mp3",
+                                       "size": len(song_body(song_id)), "type": "mp3"}]}
+
+    def start(self):
+        server = self
+        routes = {
+            "/api/v6/playlist/detail": self._playlist,
+            "/api/song/detail/": self._song_detail,
+            "/api/song/enhance/player/url/v1": lambda query: self._song_url(query, legacy=False),
+            "/api/song/enhance/player/url": lambda query: self._song_url(query, legacy=True),
+        }
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                with server._lock:
+                    server.requests[parts.path if parts.path in routes else "/media/"] += 1
+                if parts.path in routes:
+                    payload = routes[parts.path](parse_qs(parts.query))
+                    self._send(200, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+                    return
+                name = parts.path.rsplit("/", 1)[-1]
+                song_id = int(name[:-4]) if parts.path.startswith("/media/") and name[:-4].isdigit() else 0
+                if song_id not in server.songs:
+                    self._send(404, b"not found", "text/plain")
+                    return
+                with server._lock:
+                    server.media_requests[song_id] += 1
+                self._send(200, song_body(song_id), "audio/mpeg")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+class CheckResult(NamedTuple):
+    name: str
+    ok: bool
+    detail: str
+
+
+def _check(results: List[CheckResult], name: str, ok: bool, detail: str):
+    results.append(CheckResult(name, ok, detail))
+    print(f"{'[OK]  ' if ok else '[FAIL]'} {name}: {detail}")
+
+
+def _counts(result) -> Tuple[int, int, int]:
+    return result.downloaded, result.skipped, result.failed
+
+
+def run_checks(work_dir: str) -> List[CheckResult]:
+    """在 work_dir 下用替身服务跑一遍原生下载器，返回各项检查结果。"""
+    from netease_native import HTTPPool, NativeNeteaseDownloader, NeteaseClient, NeteaseError, Song, song_filename
+
+    server = MockNeteaseServer()
+    server.start()
+    audio_dir = os.path.join(work_dir, "audios")
+    results: List[CheckResult] = []
+
+    def downloader(output_dir: str = audio_dir) -> NativeNeteaseDownloader:
+        client = NeteaseClient(api_base=server.base_url, music_u="", pool=HTTPPool(max_idle_per_host=WORKERS))
+        return NativeNeteaseDownloader(output_dir, client, workers=WORKERS)
+
+    try:
+        dl = downloader()
+        first = dl.download_playlist(1001)
+        dl.close()
+        files_ok = all(
+            open(os.path.join(audio_dir, song_filename(Song(song_id, name, artist), "mp3")), "rb").read()
+            == song_body(song_id)
+            for song_id, name, artist, _ in SONGS if song_id in (2001, 2002, 2003, 2004)
+        )
+        _check(results, "首次下载歌单", _counts(first) == (4, 0, 1) and files_ok,
+               f"下载/跳过/失败 = {_counts(first)}，期望 (4, 0, 1)；文件内容{'一致' if files_ok else '不一致'}")
+        _check(results, "旧版接口回退", server.requests["/api/song/enhance/player/url"] == 2,
+               f"旧版接口请求 {server.requests['/api/song/enhance/player/url']} 次（{LEGACY_ONLY} 回退、{VIP_ONLY} 也试过），期望 2")
+        _check(results, "VIP 歌曲记为失败", any(e.startswith(f"{VIP_ONLY[0]}:") for e in first.errors),
+               "; ".join(first.errors) or "没有错误记录")
+        _check(results, "连接复用", server.connections <= WORKERS + 1 < sum(server.requests.values()),
+               f"{sum(server.requests.values())} 个请求用了 {server.connections} 个连接")
+
+        server.reset_counts()
+        dl = downloader()
+        second = dl.download_playlist(1002)
+        dl.close()
+        _check(results, "共有歌曲零网络跳过",
+               _counts(second) == (1, 2, 0) and set(server.media_requests) == {2005},
+               f"下载/跳过/失败 = {_counts(second)}，期望 (1, 2, 0)；下载了音频 {sorted(server.media_requests)}")
+
+        # 换一个空的输出目录（和索引），两个共有歌曲的歌单同时下载
+        server.reset_counts()
+        dl = downloader(os.path.join(work_dir, "concurrent", "audios"))
+        threads = [threading.Thread(target=dl.download_playlist, args=(pid,)) for pid in (1002, 1003)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        dl.close()
+        duplicated = sorted(song_id for song_id, n in server.media_requests.items() if n > 1)
+        _check(results, "并发歌单共有歌曲只下载一次", not duplicated and set(server.media_requests) == {2003, 2004, 2005},
+               f"音频请求 {dict(server.media_requests)}")
+
+        server.reset_counts()
+        dl = downloader(os.path.join(work_dir, "concurrent", "audios"))
+        rerun = dl.download_playlist(1002)
+        dl.close()
+        url_requests = server.requests["/api/song/enhance/player/url/v1"] + server.media_requests.total()
+        _check(results, "重新运行全部跳过", _counts(rerun) == (0, 3, 0) and url_requests == 0,
+               f"下载/跳过/失败 = {_counts(rerun)}，播放地址与音频请求 {url_requests} 次")
+
+        dl = downloader()
+        try:
+            dl.download_playlist(9999)
+            missing_ok, detail = False, "没有抛出 NeteaseError"
+        except NeteaseError as e:
+            missing_ok, detail = True, str(e)
+        finally:
+            dl.close()
+        _check(results, "不存在的歌单", missing_ok, detail)
+    finally:
+        server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="网易云接口的本地替身服务，以及原生下载器（netease_native.py）的端到端检查。",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog=__doc__.split("用法：", 1)[1],
+    )
+    parser.add_argument("--serve", action="store_true", help="只启动替身服务，不运行检查。")
+    parser.add_argument("--port", type=int, default=0, help="--serve 时监听的端口 (默认随机)。")
+    parser.add_argument("--keep", action="store_true", help="检查结束后保留临时输出目录。")
+    args = parser.parse_args()
+
+    if args.serve:
+        server = MockNeteaseServer(port=args.port)
+        server.start()
+        print(f"替身服务: {server.base_url}（歌单 {', '.join(map(str, PLAYLISTS))}）")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="netease_mock_")
+    try:
+        results = run_checks(work_dir)
+    finally:
+        if args.keep:
+            print(f"输出目录: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    failed = [r.name for r in results if not r.ok]
+    print()
+    if failed:
+        print(f"检查失败 {len(failed)}/{len(results)} 项: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"全部 {len(results)} 项检查通过。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+网易云音乐原生下载器 —— 在进程内把歌单解析成歌曲 ID，按单曲并行下载。
+
+与调用外部 ncm-dl 相比：
+- 每首歌是独立任务，多个歌单的歌曲共享同一个下载线程池；
+- 全局的 歌曲 ID → 文件 索引（复用 download_index，extractor 为 'netease'）：
+  多个歌单共有的歌曲只下载一次，之后的运行零网络跳过；同一次运行中同时出现的同一首歌也只下载一次；
+- 所有请求走同一个保持连接的 HTTP 连接池，不再每首歌重新握手；
+- 开启音频去重（audio_dedup.default_dedup）时，已从 YouTube/B 站下载过的同一首歌（歌手 - 歌名与时长相同）
+  不再请求播放地址，下载完的歌曲也登记指纹；
+- 接口地址可通过 api_base（或环境变量 NCM_API_BASE）指向本地 mock 服务，便于离线测试。
+
+使用与 ncm-dl 相同的明文 /api/ 接口；VIP/付费歌曲需要设置 MUSIC_U 环境变量。
+由 netease_dl.py 调用，歌单级别失败时回退到 ncm-dl。
+"""
+
+import http.client
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from audio_dedup import default_dedup
+from download_index import open_index
+
+API_BASE = "https://music.163.com"
+DEFAULT_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+# 音质等级与旧版接口的码率
+LEVEL_TO_BR = {
+    "standard": 128000,
+    "higher": 192000,
+    "exhigh": 320000,
+    "lossless": 999000,
+    "hires": 1999000,
+}
+
+# 歌曲详情接口单次查询的 ID 数上限
+DETAIL_BATCH = 500
+
+INDEX_EXTRACTOR = "netease"
+
+print_lock = threading.Lock()
+
+
+def safe_print(*args, **kwargs):
+    """线程安全的打印函数"""
+    with print_lock:
+        print(*args, **kwargs, flush=True)
+
+
+class NeteaseError(Exception):
+    """网易云接口或下载出错。"""
+
+
+def default_index_dir(output_dir: str) -> str:
+    """歌曲输出目录对应的下载索引根目录：output_dir 为 audios 时取其上级目录，与批量脚本共用。"""
+    if os.path.basename(os.path.normpath(output_dir)) == "audios":
+        return os.path.dirname(os.path.abspath(output_dir))
+    return output_dir
+
+
+@dataclass
+class PlaylistResult:
+    """单个歌单的处理结果（原生下载器与 ncm-dl 共用）。"""
+    playlist_id: int
+    name: str = ""
+    track_count: int = 0
+    downloaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    returncode: Optional[int] = None
+    timed_out: bool = False
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.downloaded + self.skipped + self.failed
+
+    @property
+    def ok(self) -> bool:
+        # ncm-dl 写 M3U 到 /opt/navidrome 没有权限时返回非 0，但歌曲已全部下载
+        return not self.timed_out and self.failed == 0 and (
+            self.returncode == 0 or (self.track_count > 0 and self.processed >= self.track_count)
+        )
+
+    def progress_text(self) -> str:
+        total = self.track_count or "?"
+        return f"{self.processed}/{total}（下载 {self.downloaded}，跳过 {self.skipped}，失败 {self.failed}）"
+
+
+class HTTPPool:
+    """
+    线程安全的 keep-alive 连接池：按 (scheme, host:port) 复用 http.client 连接，
+    每个主机最多缓存 max_idle_per_host 个空闲连接。跟随重定向。
+    """
+
+    def __init__(self, max_idle_per_host: int = 8, timeout: float = 30.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, key: Tuple[str, str]) -> http.client.HTTPConnection:
+        scheme, netloc = key
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return conn_cls(netloc, timeout=self.timeout)
+
+    def _acquire(self, key: Tuple[str, str]) -> Tuple[http.client.HTTPConnection, bool]:
+        """取一个连接，返回 (连接, 是否为复用的空闲连接)。"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key: Tuple[str, str], conn: http.client.HTTPConnection, resp):
+        if resp.will_close:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _open(self, method: str, url: str, headers: dict, body: Optional[bytes]):
+        """发出请求并返回 (key, conn, response)；复用的连接已被服务端关闭时换新连接重试一次。"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        conn, reused = self._acquire(key)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return key, conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            conn = self._connect(key)
+            conn.request(method, path, body=body, headers=headers)
+            return key, conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def open(self, method: str, url: str, headers: Optional[dict] = None, body: Optional[bytes] = None,
+             max_redirects: int = 5):
+        """返回 (release 回调, response)；调用方读完响应后必须调用 release()。"""
+        headers = dict(headers or {})
+        for _ in range(max_redirects + 1):
+            key, conn, resp = self._open(method, url, headers, body)
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+                location = urljoin(url, resp.getheader("Location"))
+                resp.read()
+                self._release(key, conn, resp)
+                if resp.status == 303:
+                    method, body = "GET", None
+                url = location
+                continue
+            return (lambda: self._release(key, conn, resp)), resp
+        raise NeteaseError(f"重定向次数过多: {url}")
+
+    def request(self, method: str, url: str, headers: Optional[dict] = None,
+                body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        release, resp = self.open(method, url, headers, body)
+        try:
+            data = resp.read()
+        finally:
+            release()
+        return resp.status, data
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+class Song(NamedTuple):
+    id: int
+    name: str
+    artists: str
+    duration: Optional[float] = None  # 秒
+
+
+class SongURL(NamedTuple):
+    url: str
+    ext: str
+    size: int
+
+
+def clean_filename(value: str) -> str:
+    value = re.sub(r'[\\/:*?"<>|]+', " ", value)
+    value = re.sub(r"\s+", " ", value).strip(" .")
+    return value or "Unknown"
+
+
+def song_filename(song: Song, ext: str) -> str:
+    """与 ncm-dl 歌单模式相同的文件名（末尾带 [歌曲ID]，rebuild-index 可据此重建索引）。"""
+    return f"{clean_filename(song.artists)} - {clean_filename(song.name)} [{song.id}].{ext}"
+
+
+def _chunks(items: List[int], size: int) -> Iterable[List[int]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class NeteaseClient:
+    """网易云明文 /api/ 接口的客户端；所有请求共用一个 HTTPPool。"""
+
+    def __init__(self, api_base: Optional[str] = None, music_u: Optional[str] = None,
+                 level: str = "standard", pool: Optional[HTTPPool] = None):
+        self.api_base = (api_base or os.environ.get("NCM_API_BASE") or API_BASE).rstrip("/")
+        self.music_u = music_u if music_u is not None else os.environ.get("MUSIC_U")
+        if level not in LEVEL_TO_BR:
+            raise ValueError(f"未知的音质等级 '{level}'，可选: {', '.join(LEVEL_TO_BR)}")
+        self.level = level
+        self.pool = pool or HTTPPool()
+
+    def headers(self) -> dict:
+        headers = {
+            "Accept": "application/json,text/plain,*/*",
+            "Referer": "https://music.163.com/",
+            "User-Agent": os.environ.get("NCM_USER_AGENT") or DEFAULT_UA,
+        }
+        if self.music_u:
+            headers["Cookie"] = f"MUSIC_U={self.music_u}"
+        return headers
+
+    def _get_json(self, endpoint: str, query: dict) -> dict:
+        url = f"{self.api_base}{endpoint}?{urlencode(query)}"
+        try:
+            status, data = self.pool.request("GET", url, self.headers())
+        except (OSError, http.client.HTTPException) as e:
+            raise NeteaseError(f"请求失败: {endpoint}: {e}")
+        if status != 200:
+            raise NeteaseError(f"HTTP {status}: {endpoint}")
+        try:
+            parsed = json.loads(data.decode("utf-8"))
+        except ValueError:
+            raise NeteaseError(f"{endpoint} 返回的不是 JSON: {data[:120]!r}")
+        if not isinstance(parsed, dict):
+            raise NeteaseError(f"{endpoint} 返回格式异常")
+        return parsed
+
+    def playlist(self, playlist_id: int) -> Tuple[str, List[int]]:
+        """返回 (歌单名, 歌曲 ID 列表)。"""
+        data = self._get_json("/api/v6/playlist/detail", {"id": playlist_id, "n": 100000, "s": 8})
+        playlist = data.get("playlist") or {}
+        if not playlist:
+            raise NeteaseError(f"歌单不存在: {playlist_id}")
+        track_ids = []
+        for item in playlist.get("trackIds") or playlist.get("tracks") or []:
+            try:
+                track_ids.append(int(item["id"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if not track_ids:
+            raise NeteaseError(f"歌单没有曲目: {playlist_id}")
+        return str(playlist.get("name") or f"playlist-{playlist_id}"), track_ids
+
+    def song_details(self, song_ids: List[int]) -> Dict[int, Song]:
+        """批量查询歌曲名、歌手和时长。"""
+        songs: Dict[int, Song] = {}
+        for batch in _chunks(song_ids, DETAIL_BATCH):
+            data = self._get_json("/api/song/detail/", {"ids": json.dumps(batch, separators=(",", ":"))})
+            for raw in data.get("songs") or []:
+                artists = raw.get("artists") or raw.get("ar") or []
+                songs[int(raw["id"])] = Song(
+                    int(raw["id"]),
+                    str(raw.get("name") or "Unknown"),
+                    ", ".join(a.get("name", "") for a in artists if a.get("name")) or "Unknown",
+                    (raw.get("duration") or raw.get("dt") or 0) / 1000 or None,
+                )
+        return songs
+
+    def song_url(self, song_id: int) -> SongURL:
+        """查询单曲的播放地址（先用新版接口，拿不到再用旧版接口）。"""
+        ids = json.dumps([song_id], separators=(",", ":"))
+        encode_type = "flac" if self.level in ("lossless", "hires") else "mp3"
+        data = self._get_json(
+            "/api/song/enhance/player/url/v1", {"ids": ids, "level": self.level, "encodeType": encode_type}
+        )
+        items = data.get("data") or []
+        if not items or not items[0].get("url"):
+            data = self._get_json("/api/song/enhance/player/url", {"ids": ids, "br": LEVEL_TO_BR[self.level]})
+            items = data.get("data") or []
+        if not items or not items[0].get("url"):
+            raise NeteaseError("没有拿到可播放 URL；付费/VIP 歌曲请设置 MUSIC_U")
+        item = items[0]
+        ext = str(item.get("type") or "").lower()
+        if ext not in ("mp3", "flac"):
+            suffix = os.path.splitext(urlsplit(str(item["url"])).path)[1].lstrip(".").lower()
+            ext = suffix if suffix in ("mp3", "flac") else "mp3"
+        return SongURL(str(item["url"]), ext, int(item.get("size") or 0))
+
+    def download(self, url: str, dest: str) -> int:
+        """把音频流式写入 dest（先写 .part 再改名），返回字节数。"""
+        headers = self.headers()
+        headers["Accept"] = "audio/*;q=0.9,*/*;q=0.5"
+        tmp = dest + ".part"
+        try:
+            release, resp = self.pool.open("GET", url, headers)
+        except (OSError, http.client.HTTPException) as e:
+            raise NeteaseError(f"下载失败: {e}")
+        written = 0
+        try:
+            if resp.status not in (200, 206):
+                resp.read()
+                raise NeteaseError(f"下载失败: HTTP {resp.status}")
+            with open(tmp, "wb") as f:
+                while True:
+                    chunk = resp.read(256 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+        except (OSError, http.client.HTTPException) as e:
+            raise NeteaseError(f"下载失败: {e}")
+        finally:
+            release()
+        os.replace(tmp, dest)
+        return written
+
+    def close(self):
+        self.pool.close()
+
+
+class NativeNeteaseDownloader:
+    """
+    单曲级并行下载器：所有歌单的歌曲共享 workers 个下载线程和一个 HTTP 连接池。
+
+    :param output_dir: 歌曲输出目录（例如 downloads/audios）。
+    :param index_dir: 下载索引所在的根目录，默认 output_dir 为 audios 时取其上级目录，与批量脚本共用。
+    """
+
+    def __init__(self, output_dir: str, client: Optional[NeteaseClient] = None, workers: int = 8,
+                 overwrite: bool = False, index_dir: Optional[str] = None):
+        self.output_dir = output_dir
+        self.client = client or NeteaseClient(pool=HTTPPool(max_idle_per_host=workers))
+        self.overwrite = overwrite
+        self.index_dir = index_dir or default_index_dir(output_dir)
+        self.index = open_index(index_dir)
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="netease")
+        self._inflight: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+
+    def _download_song(self, song: Song) -> Tuple[str, str]:
+        """下载一首歌，返回 (状态, 路径)，状态为 "下载"/"跳过"。失败时抛出 NeteaseError。"""
+        if not self.overwrite:
+            indexed = self.index.lookup(INDEX_EXTRACTOR, str(song.id), "audio")
+            if indexed:
+                return "跳过", indexed
+            # 同一首歌已从其他来源下载过：不再请求播放地址
+            duplicate = default_dedup.check_metadata(
+                self.index_dir, INDEX_EXTRACTOR, str(song.id), f"{song.artists} - {song.name}", song.duration,
+                os.path.join(self.output_dir, song_filename(song, "mp3")),
+            )
+            if duplicate:
+                return "跳过", duplicate
+        info = self.client.song_url(song.id)
+        dest = os.path.join(self.output_dir, song_filename(song, info.ext))
+        if os.path.exists(dest) and not self.overwrite:
+            self.index.record(INDEX_EXTRACTOR, str(song.id), "audio", dest)
+            return "跳过", dest
+        written = self.client.download(info.url, dest)
+        if info.size and written != info.size:
+            os.remove(dest)
+            raise NeteaseError(f"文件大小不符: {written}/{info.size}")
+        self.index.record(INDEX_EXTRACTOR, str(song.id), "audio", dest)
+        return "下载", default_dedup.dedup_file(self.index_dir, INDEX_EXTRACTOR, str(song.id), dest)
+
+    def submit(self, song: Song) -> Tuple[Future, bool]:
+        """提交一首歌，返回 (任务, 是否为新任务)；同一首歌正在下载时直接复用那个任务。"""
+        with self._lock:
+            future = self._inflight.get(song.id)
+            if future is not None:
+                return future, False
+            future = self._pool.submit(self._download_song, song)
+            self._inflight[song.id] = future
+        future.add_done_callback(lambda _f, song_id=song.id: self._forget(song_id))
+        return future, True
+
+    def _forget(self, song_id: int):
+        with self._lock:
+            self._inflight.pop(song_id, None)
+
+    def download_playlist(self, playlist_id: int) -> PlaylistResult:
+        """
+        下载一个歌单：解析歌曲 ID，已在索引中的歌曲零网络跳过，其余歌曲提交到共享线程池。
+
+        歌单本身取不到（接口错误/歌单不存在）时抛出 NeteaseError，由调用方回退到 ncm-dl。
+        """
+        tag = f"[歌单 {playlist_id}]"
+        start = time.monotonic()
+        result = PlaylistResult(playlist_id)
+        result.name, track_ids = self.client.playlist(playlist_id)
+        result.track_count = len(track_ids)
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_print(f"{tag} {result.name}: {result.track_count} 首")
+
+        # 先查全局索引：多个歌单共有的歌曲和上次已下载的歌曲都不需要再请求详情
+        pending: List[int] = []
+        for song_id in track_ids:
+            if not self.overwrite and self.index.lookup(INDEX_EXTRACTOR, str(song_id), "audio"):
+                result.skipped += 1
+            else:
+                pending.append(song_id)
+
+        songs = self.client.song_details(pending) if pending else {}
+        futures = []
+        for song_id in pending:
+            song = songs.get(song_id)
+            if song is None:
+                result.failed += 1
+                result.errors.append(f"{song_id}: 查询不到歌曲信息")
+                continue
+            futures.append((song, *self.submit(song)))
+
+        for song, future, is_new in futures:
+            try:
+                status, path = future.result()
+            except NeteaseError as e:
+                result.failed += 1
+                result.errors.append(f"{song.id}: {e}")
+                safe_print(f"{tag} [{result.processed}/{result.track_count}] 失败: {song.name} - {e}")
+                continue
+            except Exception as e:
+                result.failed += 1
+                result.errors.append(f"{song.id}: {e}")
+                continue
+            # 与其他歌单同时下载的共有歌曲只在发起下载的歌单里计为“下载”
+            if status == "下载" and is_new:
+                result.downloaded += 1
+                safe_print(f"{tag} [{result.processed}/{result.track_count}] 完成: {os.path.basename(path)}")
+            else:
+                result.skipped += 1
+
+        result.returncode = 0
+        result.elapsed = time.monotonic() - start
+        safe_print(f"{tag} {result.name} 完成 {result.progress_text()}，用时 {result.elapsed:.1f}s")
+        return result
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.client.close()
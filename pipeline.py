@@ -0,0 +1,314 @@
+"""
+下载 / 转码两级流水线。
+
+网络下载（IO 密集）和 ffmpeg 转码（CPU 密集）各用一组独立的 worker，中间用有界队列连接：
+下载 worker 只负责把原始音频流拉到本地，转码 worker（默认按 CPU 核数）只负责跑 ffmpeg。
+队列满时下载 worker 会阻塞等待，这段时间计入“背压”统计，用来判断瓶颈在哪一级。
+每个条目的排队、等待转码、转码耗时另外按条目记录到 metrics.default_metrics。
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from host_scheduler import HostScheduler
+from metrics import default_metrics
+
+_STOP = object()
+# 输入读完/取消时放进结果队列，让 run() 立即检查是否已全部完成，不必等轮询超时
+_WAKE = object()
+
+
+class FetchResult(NamedTuple):
+    """
+    下载阶段的结果：status 为 "成功"/"已存在"/"错误"/"展开"；jobs 为需要继续交给转码阶段的任务；
+    children 为播放列表展开出的条目链接，会作为独立条目重新进入下载阶段。
+    """
+    status: str
+    extra: Optional[str] = None
+    jobs: Tuple = ()
+    children: Tuple = ()
+
+
+class StageStats:
+    """单个阶段的计数与耗时统计（线程安全）。"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.busy_time = 0.0     # 实际干活的时间
+        self.idle_time = 0.0     # 等待上游输入的时间（上游是瓶颈）
+        self.blocked_time = 0.0  # 等待下游队列腾出空位的时间（下游是瓶颈，即背压）
+        self.peak_queue = 0      # 该阶段输入队列的最大深度
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, idle=0.0, blocked=0.0, processed=0, queue_depth=0):
+        with self._lock:
+            self.busy_time += busy
+            self.idle_time += idle
+            self.blocked_time += blocked
+            self.processed += processed
+            self.peak_queue = max(self.peak_queue, queue_depth)
+
+    def summary(self, wall_time: float) -> str:
+        capacity = max(wall_time * self.workers, 1e-9)
+        return (
+            f"{self.name}: {self.workers} 个 worker, 处理 {self.processed} 项, "
+            f"忙碌 {self.busy_time / capacity:.0%}, 等待输入 {self.idle_time / capacity:.0%}, "
+            f"背压阻塞 {self.blocked_time / capacity:.0%}, 输入队列峰值 {self.peak_queue}"
+        )
+
+
+class _ItemState:
+    __slots__ = ("url", "start_time", "status", "extra", "pending")
+
+    def __init__(self, url: str, start_time: float):
+        self.url = url
+        self.start_time = start_time
+        self.status = "成功"
+        self.extra = None
+        self.pending = 0
+
+
+class StagedPipeline:
+    """
+    两级流水线：fetch_fn(url) -> FetchResult 在下载 worker 中运行，
+    transcode_fn(job) -> Optional[str]（返回错误信息，成功为 None）在转码 worker 中运行。
+    下载 worker 从 HostScheduler 取条目，按站点限制并发/速率，被限流的条目由调度器退避后重新排队。
+    fetch_fn 返回带 children 的结果时（播放列表），经 expand_fn(父链接, children) 过滤后逐条加入调度器，
+    与其他条目共享全部下载 worker；父条目本身以 "展开" 状态产出一条结果。
+    precheck_fn(url) -> Optional[FetchResult] 是不联网的跳过检查（任务日志、本地索引），在条目进入调度器之前调用：
+    有结论的条目直接产出结果（或交给转码阶段），不占站点的并发名额和令牌。
+
+    run() 按完成顺序产出 (url, status, extra_info, elapsed_time)，与 download_single_url 的返回值一致。
+    """
+
+    def __init__(
+        self,
+        fetch_fn: Callable[[str], FetchResult],
+        transcode_fn: Callable[[object], Optional[str]],
+        download_workers: int = 8,
+        transcode_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        use_processes: bool = False,
+        scheduler: Optional[HostScheduler] = None,
+        expand_fn: Optional[Callable[[str, Tuple], Iterable[str]]] = None,
+        precheck_fn: Optional[Callable[[str], Optional[FetchResult]]] = None,
+    ):
+        self.fetch_fn = fetch_fn
+        self.transcode_fn = transcode_fn
+        self.download_workers = download_workers
+        self.transcode_workers = transcode_workers or os.cpu_count() or 1
+        self.queue_size = queue_size or self.transcode_workers * 2
+        self.use_processes = use_processes
+
+        self.download_stats = StageStats("下载阶段", self.download_workers)
+        self.transcode_stats = StageStats("转码阶段", self.transcode_workers)
+        self.wall_time = 0.0
+
+        self.scheduler = scheduler or HostScheduler()
+        self.expand_fn = expand_fn
+        self.precheck_fn = precheck_fn
+        self._transcode_q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        self._results_q: "queue.Queue" = queue.Queue()
+        self._states = {}
+        self._stop_event = threading.Event()
+        self._pending_lock = threading.Lock()
+        # [已入队数量, 输入是否读完]；播放列表展开出的条目也计入已入队数量
+        self._counter = [0, 0]
+        # 条目进入调度器的时间，用于记录排队耗时
+        self._enqueued = {}
+        self._process_pool: Optional[Executor] = None
+
+    # ---- 下载阶段 ----
+    def _download_worker(self):
+        while True:
+            t0 = time.time()
+            url = self.scheduler.get()
+            self.download_stats.add(idle=time.time() - t0, queue_depth=self.scheduler.qsize() + 1)
+            if url is None:
+                break
+            state = self._states.setdefault(url, _ItemState(url, time.time()))
+            enqueued = self._enqueued.pop(url, None)
+            if enqueued is not None:
+                default_metrics.record("schedule", time.time() - enqueued, url=url)
+
+            t0 = time.time()
+            try:
+                with default_metrics.item(url):
+                    result = self.fetch_fn(url)
+            except Exception as e:
+                result = FetchResult("错误", str(e))
+            self.download_stats.add(busy=time.time() - t0, processed=1)
+
+            # 展开的条目要在父条目 release 之前入队，否则其他 worker 可能误以为已全部完成而退出
+            if result.children:
+                self._add_children(url, result.children)
+
+            # 被限流的条目由调度器重新排队，暂不产出结果
+            # 重新排队的条目要在 release 之前记下入队时间，否则可能已被其他 worker 取走
+            self._enqueued[url] = time.time()
+            if self.scheduler.release(url, result.extra if result.status == "错误" else None):
+                default_metrics.record_retry("throttled", url=url)
+                continue
+            self._enqueued.pop(url, None)
+            del self._states[url]
+            self._complete(state, result)
+
+    def _complete(self, state: _ItemState, result: FetchResult):
+        """下载阶段有了结论：没有转码任务时直接产出结果，否则交给转码阶段（队列满时阻塞，计入背压）。"""
+        state.status, state.extra = result.status, result.extra
+        if not result.jobs:
+            self._finish(state)
+            return
+
+        state.pending = len(result.jobs)
+        for job in result.jobs:
+            t0 = time.time()
+            self._transcode_q.put((state, job, t0))
+            self.download_stats.add(blocked=time.time() - t0)
+
+    def _precheck(self, url: str) -> bool:
+        """条目入队前的本地跳过检查；有结论时直接完成该条目并返回 True，不经过调度器。"""
+        if self.precheck_fn is None:
+            return False
+        start = time.time()
+        try:
+            with default_metrics.item(url):
+                result = self.precheck_fn(url)
+        except Exception:
+            return False  # 本地检查出错时按正常流程交给下载 worker
+        if result is None:
+            return False
+        with self._pending_lock:
+            self._counter[0] += 1
+        self._complete(_ItemState(url, start), result)
+        return True
+
+    # ---- 转码阶段 ----
+    def _transcode_worker(self):
+        while True:
+            t0 = time.time()
+            entry = self._transcode_q.get()
+            self.transcode_stats.add(idle=time.time() - t0, queue_depth=self._transcode_q.qsize() + 1)
+            if entry is _STOP:
+                break
+            state, job, put_time = entry
+            video_id = getattr(job, "video_id", None)
+
+            t0 = time.time()
+            default_metrics.record("queue", t0 - put_time, url=state.url, video_id=video_id)
+            try:
+                with default_metrics.item(state.url):
+                    if self._process_pool is not None:
+                        error = self._process_pool.submit(self.transcode_fn, job).result()
+                    else:
+                        error = self.transcode_fn(job)
+            except Exception as e:
+                error = str(e)
+            self.transcode_stats.add(busy=time.time() - t0, processed=1)
+            default_metrics.record("transcode", time.time() - t0, url=state.url, video_id=video_id)
+
+            with self._pending_lock:
+                if error:
+                    state.status, state.extra = "错误", error
+                state.pending -= 1
+                done = state.pending == 0
+            if done:
+                self._finish(state)
+
+    def _add_children(self, url: str, children: Tuple):
+        if self.expand_fn is not None:
+            children = self.expand_fn(url, children)
+        for child in children:
+            if self._precheck(child):
+                continue
+            self._enqueued[child] = time.time()
+            if not self.scheduler.add(child):
+                self._enqueued.pop(child, None)
+                break
+            with self._pending_lock:
+                self._counter[0] += 1
+
+    def _finish(self, state: _ItemState):
+        self._results_q.put((state.url, state.status, state.extra, time.time() - state.start_time))
+
+    # ---- 调度 ----
+    def _feed(self, urls: Iterable[str]):
+        for url in urls:
+            if self._stop_event.is_set():
+                break
+            if self._precheck(url):
+                continue
+            self._enqueued[url] = time.time()
+            if not self.scheduler.put(url):
+                self._enqueued.pop(url, None)
+                break
+            with self._pending_lock:
+                self._counter[0] += 1
+        self._counter[1] = 1  # 输入已全部入队
+        self.scheduler.close()
+        self._results_q.put(_WAKE)
+
+    def stop(self):
+        """请求停止：已在处理的条目会做完，尚未开始的条目不再处理；run() 在进行中的条目结束后返回。"""
+        self._stop_event.set()
+        dropped = self.scheduler.cancel()
+        with self._pending_lock:
+            self._counter[0] -= dropped
+        self._results_q.put(_WAKE)
+
+    def run(self, urls: Iterable[str]) -> Iterator[Tuple[str, str, Optional[str], float]]:
+        start = time.time()
+        if self.use_processes:
+            # 进程池连带导入 multiprocessing，只在使用进程池时才导入
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._process_pool = ProcessPoolExecutor(max_workers=self.transcode_workers)
+
+        counter = self._counter
+        feeder = threading.Thread(target=self._feed, args=(urls,), daemon=True)
+        downloaders = [
+            threading.Thread(target=self._download_worker, daemon=True)
+            for _ in range(self.download_workers)
+        ]
+        transcoders = [
+            threading.Thread(target=self._transcode_worker, daemon=True)
+            for _ in range(self.transcode_workers)
+        ]
+        for t in [feeder, *downloaders, *transcoders]:
+            t.start()
+
+        finished = 0
+        try:
+            while not (counter[1] and finished >= counter[0]):
+                try:
+                    result = self._results_q.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if result is _WAKE:
+                    continue
+                finished += 1
+                yield result
+        finally:
+            self.stop()
+            for t in downloaders:
+                t.join()
+            for _ in transcoders:
+                self._transcode_q.put(_STOP)
+            for t in transcoders:
+                t.join()
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+            self.wall_time = time.time() - start
+
+    def stats_lines(self) -> List[str]:
+        return [
+            self.download_stats.summary(self.wall_time),
+            self.transcode_stats.summary(self.wall_time),
+            *self.scheduler.stats_lines(),
+        ]
@@ -0,0 +1,287 @@
+"""
+集中的进度输出 —— worker 只往队列里放轻量的事件，由一个渲染线程统一写终端。
+
+worker 线程（yt-dlp 的 progress_hooks、批量脚本的 safe_print）从不直接写 stdout，也不争抢打印锁：
+事件放进无界的 SimpleQueue 后立即返回。渲染线程按固定频率合并事件后输出：
+- bars 模式（stdout 是终端时的默认）：消息照常逐行打印在上方，底部重绘正在下载的文件的进度条，
+  以及总速度、完成数和预计剩余时间；
+- json 模式（stdout 被重定向时的默认）：消息照常逐行打印，进度每隔 JSON_INTERVAL 秒输出一行 JSON 快照，
+  不刷进度条，日志文件保持干净；
+- plain 模式：只打印消息。
+
+渲染线程没有启动时（例如 main.py 单个链接下载），log() 直接打印。
+"""
+
+import atexit
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+PROGRESS_MODES = ("auto", "bars", "json", "plain")
+
+# bars 模式的重绘间隔（状态没变化时按 IDLE_FRAME_INTERVAL 刷新速度与剩余时间）与最多显示的进度条数
+FRAME_INTERVAL = 0.1
+IDLE_FRAME_INTERVAL = 1.0
+MAX_BARS = 8
+# json 模式的快照间隔
+JSON_INTERVAL = 5.0
+# 总速度按最近这段时间内新下载的字节数计算
+SPEED_WINDOW = 5.0
+
+_STOP = object()
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def _format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class _Transfer:
+    __slots__ = ("name", "downloaded", "total", "speed")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.downloaded = 0
+        self.total = None
+        self.speed = None
+
+
+class ProgressReporter:
+    """进度事件的汇总与渲染；所有状态只在渲染线程中修改，worker 侧只有 queue.put。"""
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self.mode = "plain"
+        self._transfers: Dict[str, _Transfer] = {}
+        self._recent_bytes = deque()  # [(时间, 新增字节数)]，用于计算总速度
+        self._done = 0
+        self._total = 0
+        self._total_final = False
+        self._started = 0.0
+        self._items_started = 0.0
+        self._drawn_lines = 0
+        self._dirty = False
+        self._last_frame = 0.0
+
+    # ---- worker 侧：只入队，不做任何 IO ----
+    def log(self, *args, sep=" ", file=None):
+        """打印一条消息；渲染线程运行时入队，由渲染线程输出。"""
+        text = sep.join(str(arg) for arg in args)
+        if self._thread is None:
+            print(text, file=file or sys.stdout, flush=True)
+        else:
+            self._queue.put(("log", text, file))
+
+    def hook(self, d):
+        """yt-dlp progress_hooks：只转发下载中的字节数和完成事件。"""
+        if self._thread is None:
+            return
+        status = d.get("status")
+        # 以最终文件名区分各个传输（finished 事件里没有 tmpfilename）
+        if status == "downloading":
+            self._queue.put((
+                "bytes", d.get("filename"), d.get("downloaded_bytes") or 0,
+                d.get("total_bytes") or d.get("total_bytes_estimate"), d.get("speed"),
+            ))
+        elif status in ("finished", "error"):
+            self._queue.put(("end", d.get("filename"), d.get("downloaded_bytes") or d.get("total_bytes") or 0,
+                             None, None))
+
+    def set_items(self, done: int, total: int, final: bool = True):
+        """
+        已处理完的条目数（成功、跳过或失败）与条目总数，用于显示完成数与预计剩余时间。
+
+        :param final: False 表示输入还没读完，总数还会增长（不估算剩余时间）。
+        """
+        if self._thread is not None:
+            self._queue.put(("items", done, total, final))
+
+    # ---- 生命周期 ----
+    def start(self, mode: str = "auto"):
+        if self._thread is not None:
+            return
+        if mode == "auto":
+            mode = "bars" if sys.stdout.isatty() else "json"
+        if mode == "bars" and os.name == "nt":
+            # 让 Windows 控制台解析 ANSI 转义序列（Windows 10 起支持）
+            os.system("")
+        self.mode = mode
+        self._started = self._items_started = time.time()
+        self._thread = threading.Thread(target=self._render_loop, name="progress", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """输出队列中剩余的消息、清除进度条并停止渲染线程；之后 log() 直接打印。"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+        self._thread = None
+        self._transfers.clear()
+
+    # ---- 渲染线程 ----
+    def _render_loop(self):
+        interval = FRAME_INTERVAL if self.mode == "bars" else JSON_INTERVAL
+        next_frame = time.time() + interval
+        while True:
+            timeout = max(next_frame - time.time(), 0)
+            try:
+                event = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                event = None
+            logs = []
+            stop = False
+            # 一次取完积压的事件，每帧最多重绘一次
+            while event is not None:
+                if event is _STOP:
+                    stop = True
+                    break
+                if event[0] == "log":
+                    logs.append(event)
+                else:
+                    self._apply(event)
+                    self._dirty = True
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    event = None
+
+            if logs:
+                self._clear_bars()
+                for _, text, file in logs:
+                    print(text, file=file or sys.stdout)
+                sys.stderr.flush()
+                sys.stdout.flush()
+            if stop:
+                self._clear_bars()
+                sys.stdout.flush()
+                return
+            now = time.time()
+            if logs and self.mode == "bars":
+                # 消息打印后立刻补画进度条，避免进度条闪烁消失
+                self._frame(now)
+            elif now >= next_frame:
+                next_frame = now + interval
+                if self.mode != "bars" or self._dirty or now - self._last_frame >= IDLE_FRAME_INTERVAL:
+                    self._frame(now)
+
+    def _apply(self, event):
+        kind = event[0]
+        if kind == "bytes":
+            _, key, downloaded, total, speed = event
+            transfer = self._transfers.get(key)
+            if transfer is None:
+                transfer = self._transfers[key] = _Transfer(os.path.basename(key or "?"))
+            self._add_bytes(downloaded - transfer.downloaded)
+            transfer.downloaded, transfer.total, transfer.speed = downloaded, total, speed
+        elif kind == "end":
+            _, key, nbytes, _, _ = event
+            transfer = self._transfers.pop(key, None)
+            # 没有中间进度事件的小文件（或 yt-dlp 跳过的已存在文件）按完成时的大小计
+            self._add_bytes(nbytes - (transfer.downloaded if transfer else 0))
+        elif kind == "items":
+            if event[1] < self._done:
+                # 新一轮（例如重试失败条目）从头计数，剩余时间也从这一轮开始估算
+                self._items_started = time.time()
+            _, self._done, self._total, self._total_final = event
+
+    def _add_bytes(self, delta: int):
+        if delta > 0:
+            self._recent_bytes.append((time.time(), delta))
+
+    def snapshot(self, now: float) -> dict:
+        # 总速度 = 最近 SPEED_WINDOW 秒内所有传输新增的字节 / 窗口长度
+        cutoff = now - SPEED_WINDOW
+        while self._recent_bytes and self._recent_bytes[0][0] < cutoff:
+            self._recent_bytes.popleft()
+        window = min(SPEED_WINDOW, max(now - self._started, 1e-3))
+        speed = sum(n for _, n in self._recent_bytes) / window
+        elapsed = now - self._started
+        eta = None
+        if self._total_final and self._done and self._total > self._done:
+            eta = (now - self._items_started) / self._done * (self._total - self._done)
+        return {
+            "done": self._done,
+            "total": self._total,
+            "total_final": self._total_final,
+            "active": len(self._transfers),
+            "bytes_per_sec": round(speed),
+            "elapsed": round(elapsed, 1),
+            "eta": None if eta is None else round(eta, 1),
+        }
+
+    def _frame(self, now: float):
+        self._dirty = False
+        self._last_frame = now
+        snap = self.snapshot(now)
+        if self.mode == "json":
+            print(json.dumps({"progress": snap}), flush=True)
+            return
+        if self.mode != "bars":
+            return
+        width = shutil.get_terminal_size((100, 20)).columns - 1
+        lines = []
+        for transfer in sorted(self._transfers.values(), key=lambda t: t.name)[:MAX_BARS]:
+            name = transfer.name if len(transfer.name) <= 36 else transfer.name[:33] + "..."
+            if transfer.total:
+                frac = min(transfer.downloaded / transfer.total, 1.0)
+                bar = "#" * int(frac * 20)
+                detail = f"{frac:6.1%} of {_format_bytes(transfer.total)}"
+            else:
+                bar = ""
+                detail = _format_bytes(transfer.downloaded)
+            speed = f"{_format_bytes(transfer.speed)}/s" if transfer.speed else ""
+            lines.append(f"{name:<36} [{bar:<20}] {detail} {speed}"[:width])
+        hidden = len(self._transfers) - MAX_BARS
+        if hidden > 0:
+            lines.append(f"... 另有 {hidden} 个下载进行中")
+        done = f"{snap['done']}/{snap['total']}{'' if snap['total_final'] else '+'}" if snap['total'] else "0"
+        lines.append(
+            f"完成 {done}，下载中 {snap['active']}，"
+            f"总速度 {_format_bytes(snap['bytes_per_sec'])}/s，预计剩余 {_format_eta(snap['eta'])}"[:width]
+        )
+        self._clear_bars()
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+        self._drawn_lines = len(lines)
+
+    def _clear_bars(self):
+        if self._drawn_lines:
+            # 光标上移到进度条第一行并清除到屏幕末尾
+            sys.stdout.write(f"\x1b[{self._drawn_lines}F\x1b[J")
+            self._drawn_lines = 0
+
+
+# 进程内共享的进度输出
+default_progress = ProgressReporter()
+atexit.register(default_progress.stop)
+
+
+def add_progress_arguments(parser):
+    parser.add_argument(
+        "--progress",
+        choices=PROGRESS_MODES,
+        default="auto",
+        help="进度显示方式 (默认为 auto)：终端中显示多进度条 (bars)，输出被重定向时每隔几秒输出一行 JSON (json)，\n"
+             "plain 只打印消息。"
+    )
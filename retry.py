@@ -0,0 +1,123 @@
+"""
+重试策略 —— 按错误类型决定是否重试、重试几次、等多久。
+
+- transient（网络抖动、超时、5xx）：指数退避 + 随机抖动后重试；
+- throttled（HTTP 412/429/403 风控）：批量脚本交给 HostScheduler 对整个站点退避，顺序下载时在这里等待重试；
+- permanent（私有/已删除/地区限制/不支持的链接）：立即失败，不浪费请求；
+- postprocess（ffmpeg 失败）：原始文件还在，只重试转码这一步。
+"""
+
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+from host_scheduler import is_throttle_error
+from metrics import default_metrics
+
+TRANSIENT = "transient"
+THROTTLED = "throttled"
+PERMANENT = "permanent"
+POSTPROCESS = "postprocess"
+
+ERROR_CLASS_LABELS = {
+    TRANSIENT: "临时错误",
+    THROTTLED: "被限流",
+    PERMANENT: "永久错误",
+    POSTPROCESS: "转码错误",
+}
+
+
+class RetryPolicy(NamedTuple):
+    max_attempts: int   # 含第一次在内的最多尝试次数
+    base_delay: float   # 第一次重试前的基础等待秒数
+    max_delay: float    # 单次等待上限
+
+
+POLICIES: Dict[str, RetryPolicy] = {
+    TRANSIENT: RetryPolicy(3, 2.0, 30.0),
+    THROTTLED: RetryPolicy(3, 10.0, 120.0),
+    PERMANENT: RetryPolicy(1, 0.0, 0.0),
+    POSTPROCESS: RetryPolicy(2, 1.0, 5.0),
+}
+
+_PERMANENT_RE = re.compile(
+    r"Private video|Video unavailable|This video (?:has been removed|is (?:private|unavailable))"
+    r"|has been terminated|not available in your country|geo.?restrict|members.?only|Join this channel"
+    r"|copyright|Unsupported URL|is not a valid URL|HTTP Error 404|HTTP Error 410"
+    r"|Requested format is not available|啊叻？视频不见了|稿件不可见|缺少 ffmpeg",
+    re.IGNORECASE,
+)
+_POSTPROCESS_RE = re.compile(r"ffmpeg|ffprobe|Postprocessing|转码失败|Conversion failed", re.IGNORECASE)
+
+
+def classify_error(message: Optional[str]) -> str:
+    """根据错误信息判断错误类型；无法识别的错误按临时错误处理（有限次重试）。"""
+    message = message or ""
+    if _PERMANENT_RE.search(message):
+        return PERMANENT
+    if is_throttle_error(message):
+        return THROTTLED
+    if _POSTPROCESS_RE.search(message):
+        return POSTPROCESS
+    return TRANSIENT
+
+
+def backoff_delay(attempt: int, policy: RetryPolicy) -> float:
+    """第 attempt 次重试前的等待时间（指数退避 + full jitter）。"""
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1)))
+
+
+class RetryStats:
+    """线程安全地记录每个 URL 的重试次数，供批量脚本的状态输出使用。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._retries: Dict[str, int] = {}
+
+    def add(self, url: str):
+        with self._lock:
+            self._retries[url] = self._retries.get(url, 0) + 1
+
+    def retries(self, url: str) -> int:
+        with self._lock:
+            return self._retries.get(url, 0)
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self._retries.values())
+
+
+def call_with_retry(
+    fn: Callable,
+    get_error: Callable[[object], Optional[str]],
+    retry_classes=(TRANSIENT, THROTTLED, POSTPROCESS),
+    on_retry: Optional[Callable[[int, str, str, float], None]] = None,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """
+    调用 fn()，按错误类型重试。
+
+    :param get_error: 从 fn 的返回值中取出错误信息，成功时返回 None。
+    :param retry_classes: 允许在这里重试的错误类型；不在其中的类型直接返回给调用方处理。
+    :param on_retry: 每次重试前的回调 (第几次重试, 错误类型, 错误信息, 等待秒数)。
+    :return: 最后一次调用的返回值。
+    """
+    attempt = 0
+    while True:
+        result = fn()
+        error = get_error(result)
+        if not error:
+            return result
+        error_class = classify_error(error)
+        policy = POLICIES[error_class]
+        attempt += 1
+        if error_class not in retry_classes or attempt >= policy.max_attempts:
+            return result
+        delay = backoff_delay(attempt, policy)
+        default_metrics.record_retry(error_class, attempt=attempt)
+        if on_retry is not None:
+            on_retry(attempt, error_class, error, delay)
+        sleep(delay)
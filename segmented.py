@@ -0,0 +1,218 @@
+"""
+分段并发下载 —— 大文件拆成多个 Range 请求并发拉取，所有下载线程共用一个全局连接上限。
+
+yt-dlp 默认每个媒体流只用一条 HTTP 连接；到 YouTube/B 站 CDN 的延迟较高时，单条 TCP 连接跑不满带宽，
+长视频尤其明显。这里在 yt-dlp 的分片下载器（FragmentFD）之上做了两件事：
+
+- 渐进式文件（http/https）不小于 MIN_SEGMENTED_SIZE 时，按 SEGMENT_SIZE 切成字节范围分片，
+  用 segments 个线程并发下载后按顺序拼接，支持断点续传（.ytdl 文件）；提取器没给出文件大小时
+  （例如直链）先发一个 1 字节的 Range 请求探测大小，服务器不支持 Range 就按单连接下载；
+  DASH/HLS 的分片列表本来就是分片，按 segments 设置 concurrent_fragment_downloads 让 yt-dlp 并发下载；
+- 每个分片请求（以及未分段的整文件下载）都要先从进程内共享的连接池里拿到一个名额，
+  所以 批量 worker 数 × 每个文件的分段数 再大，同时打开的媒体连接也不超过 max_connections。
+
+元数据提取（网页、API）的请求不计入连接上限。分段拼出的文件大小与预期不符时（服务器忽略了 Range），
+删掉分段结果改用单连接重新下载。
+"""
+
+import functools
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+# 每个字节范围分片的大小，以及启用分段下载的最小文件大小
+SEGMENT_SIZE = 4 * 1024 * 1024
+MIN_SEGMENTED_SIZE = 2 * SEGMENT_SIZE
+# 开启分段下载但没有指定 --max-connections 时的全局连接上限
+DEFAULT_MAX_CONNECTIONS = 16
+
+
+class DownloadConnections:
+    """进程内的分段下载设置：每个文件的并发分段数，以及所有下载线程合计的媒体连接上限。"""
+
+    def __init__(self):
+        self.segments = 1
+        self.max_connections: Optional[int] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+
+    def configure(self, segments: int = 1, max_connections: Optional[int] = None):
+        """
+        :param segments: 每个文件（或分片列表）同时使用的连接数，1 表示不分段。
+        :param max_connections: 全局连接上限；None 时分段下载用 DEFAULT_MAX_CONNECTIONS，不分段则不限制。
+        """
+        self.segments = max(1, segments)
+        if max_connections is None and self.segments > 1:
+            max_connections = DEFAULT_MAX_CONNECTIONS
+        self.max_connections = max_connections if max_connections and max_connections > 0 else None
+        self._slots = threading.BoundedSemaphore(self.max_connections) if self.max_connections else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.segments > 1 or self._slots is not None
+
+    @contextmanager
+    def slot(self):
+        """占用一个连接名额直到 with 块结束；没有上限时直接放行。"""
+        slots = self._slots
+        if slots is None:
+            yield
+            return
+        with slots:
+            yield
+
+    def describe(self) -> str:
+        if not self.enabled:
+            return "单连接"
+        limit = f"全局最多 {self.max_connections} 个连接" if self.max_connections else "连接数不限"
+        return f"每个文件 {self.segments} 个分段, {limit}"
+
+
+# 进程内共享的设置：ydl_pool 创建的 YoutubeDL 都按它选择下载器
+default_connections = DownloadConnections()
+
+
+@functools.lru_cache(maxsize=None)
+def youtube_dl_class():
+    """
+    返回按 default_connections 选择下载器的 YoutubeDL 子类。
+
+    与 ydl_pool 一样在用到时才导入 yt_dlp；未启用分段/连接上限时行为与原版 YoutubeDL 完全相同。
+    """
+    import yt_dlp
+    from yt_dlp.downloader import get_suitable_downloader
+    from yt_dlp.downloader.dash import DashSegmentsFD
+    from yt_dlp.downloader.fragment import FragmentFD
+    from yt_dlp.downloader.hls import HlsFD
+    from yt_dlp.downloader.http import HttpFD
+    from yt_dlp.networking import Request
+    from yt_dlp.networking.exceptions import RequestError
+
+    class _CappedFragments:
+        """每个分片请求前先拿到一个全局连接名额。"""
+
+        def _download_fragment(self, *args, **kwargs):
+            with default_connections.slot():
+                return super()._download_fragment(*args, **kwargs)
+
+    class CappedHttpFD(HttpFD):
+        """单连接整文件下载，下载期间占用一个连接名额。"""
+
+        def real_download(self, filename, info_dict):
+            with default_connections.slot():
+                return super().real_download(filename, info_dict)
+
+    class CappedDashSegmentsFD(_CappedFragments, DashSegmentsFD):
+        pass
+
+    class CappedHlsFD(_CappedFragments, HlsFD):
+        pass
+
+    class SegmentedHttpFD(_CappedFragments, FragmentFD):
+        """把一个渐进式文件按字节范围切成分片，用 concurrent_fragment_downloads 个线程并发下载。"""
+
+        FD_NAME = "segmented"
+
+        def _probe_size(self, info_dict) -> Optional[int]:
+            """请求第一个字节，从 Content-Range 读出文件总大小；服务器不支持 Range 时返回 None。"""
+            headers = {**(info_dict.get("http_headers") or {}), "Range": "bytes=0-0"}
+            try:
+                with default_connections.slot(), self.ydl.urlopen(Request(info_dict["url"], headers=headers)) as response:
+                    response.read()
+                    if response.status != 206:
+                        return None
+                    match = re.search(r"/(\d+)\s*$", response.headers.get("Content-Range") or "")
+            except RequestError:
+                return None
+            return int(match.group(1)) if match else None
+
+        def _single_connection(self, filename, info_dict):
+            fd = CappedHttpFD(self.ydl, self.params)
+            for hook in self._progress_hooks:
+                fd.add_progress_hook(hook)
+            return fd.real_download(filename, info_dict)
+
+        def real_download(self, filename, info_dict):
+            filesize = info_dict.get("filesize") or self._probe_size(info_dict)
+            if not filesize or filesize < MIN_SEGMENTED_SIZE:
+                return self._single_connection(filename, info_dict)
+            chunk = (info_dict.get("downloader_options") or {}).get("http_chunk_size") or SEGMENT_SIZE
+            size = min(SEGMENT_SIZE, chunk)
+            fragments = [
+                {"frag_index": i + 1, "index": i, "url": info_dict["url"],
+                 "byte_range": {"start": start, "end": min(start + size, filesize)}}
+                for i, start in enumerate(range(0, filesize, size))
+            ]
+            ctx = {"filename": filename, "total_frags": len(fragments)}
+            self._prepare_and_start_frag_download(ctx, info_dict)
+            if not self.download_and_append_fragments(ctx, fragments, info_dict):
+                return False
+            actual = os.path.getsize(filename) if os.path.exists(filename) else None
+            if actual != filesize:
+                # 服务器忽略了 Range（每个分片都是整个文件）或中途换了文件：改用单连接重新下载
+                self.report_warning(
+                    f"分段下载得到 {actual} 字节，应为 {filesize} 字节，改用单连接重新下载")
+                os.remove(filename)
+                return self._single_connection(filename, info_dict)
+            return True
+
+    capped = {HttpFD: CappedHttpFD, DashSegmentsFD: CappedDashSegmentsFD, HlsFD: CappedHlsFD}
+
+    class SegmentedYoutubeDL(yt_dlp.YoutubeDL):
+        def _choose_downloader(self, info):
+            fd_class = get_suitable_downloader(info, self.params)
+            if fd_class is HttpFD and default_connections.segments > 1 and not info.get("is_live"):
+                # 大小未知时由 SegmentedHttpFD 探测，太小的文件再退回单连接
+                filesize = info.get("filesize")
+                if (not filesize or filesize >= MIN_SEGMENTED_SIZE) and info.get("protocol") in ("http", "https"):
+                    return SegmentedHttpFD
+            return capped.get(fd_class)
+
+        def dl(self, name, info, subtitle=False, test=False):
+            fd_class = None
+            if default_connections.enabled and not test and not subtitle and name != "-":
+                fd_class = self._choose_downloader(info)
+            if fd_class is None:
+                return super().dl(name, info, subtitle, test)
+
+            # 以下与 YoutubeDL.dl 的非测试分支相同，只是换成上面选出的下载器，分片并发数取 segments
+            params = self.params
+            if default_connections.segments > 1:
+                params = {**params, "concurrent_fragment_downloads": default_connections.segments}
+            fd = fd_class(self, params)
+            for ph in self._progress_hooks:
+                fd.add_progress_hook(ph)
+            self.write_debug(f'Invoking {fd.FD_NAME} downloader on "{info.get("url")}"')
+            new_info = self._copy_infodict(info)
+            if new_info.get("http_headers") is None:
+                new_info["http_headers"] = self._calc_headers(new_info)
+            return fd.download(name, new_info, subtitle)
+
+    return SegmentedYoutubeDL
+
+
+def add_segmented_arguments(parser):
+    """给命令行加上 --segments / --max-connections。"""
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=1,
+        metavar="N",
+        help="每个文件同时使用 N 个连接分段下载 (默认为 1，即不分段)：大于 "
+             f"{MIN_SEGMENTED_SIZE // (1024 * 1024)}MB 的文件按 Range 切片，\n"
+             "DASH/HLS 分片列表同时下载 N 个分片。适合到 CDN 延迟高、单连接跑不满带宽的情况。"
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=None,
+        metavar="M",
+        help="所有下载线程合计最多同时打开 M 个媒体连接 (分段下载时默认为 "
+             f"{DEFAULT_MAX_CONNECTIONS}，否则不限制)，\n"
+             "与 worker 数配合使用：worker 数 × 分段数 超过 M 时多出来的请求排队等待。"
+    )
+
+
+def configure_segmented_from_args(args):
+    default_connections.configure(args.segments, args.max_connections)
@@ -0,0 +1,233 @@
+"""
+启动耗时基准 —— 衡量各入口脚本的冷启动：查看帮助、空列表、全部条目都已存在时的用时与导入开销。
+
+这些脚本经常由 cron / 钩子一天调用上千次，大部分调用其实没有要下载的东西。入口脚本应当先解析参数、
+读取输入、查本地索引，只有真正需要联网时才导入 yt-dlp（见 ydl_pool.require_yt_dlp），
+而且只加载输入里的站点对应的 extractor（见 main.allowed_extractors_for_url）。
+
+每个场景在独立的子进程里运行（不访问网络）：
+- 先跑一次预热（生成 .pyc），再跑 --runs 次取最短用时（与 timeit 一样，受机器负载的影响最小）；
+- 再用 python -X importtime 跑一次，统计导入总耗时和耗时最多的顶层模块；
+- 任一场景导入了 yt_dlp 或运行失败即视为退化，退出码为 1；
+- --compare 与之前 --json 保存的基线对比，用时变慢超过 --tolerance 且超过 --min-delta 毫秒时同样退出码为 1
+  （两个条件都满足才算，避免几毫秒的抖动误报）。
+
+用法：
+  # 运行全部场景，结果存为基线
+  python startup_benchmark.py --json startup.json
+
+  # 改动后与基线对比（允许 30% 的波动）
+  python startup_benchmark.py --compare startup.json --tolerance 0.3
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (场景名, 脚本及参数)；{links} / {empty} / {out} 运行时替换为临时文件和目录
+SCENARIOS = (
+    ("main --help", ["main.py", "--help"]),
+    ("batch_audio_only --help", ["batch_audio_only.py", "--help"]),
+    ("batch_download --help", ["batch_download.py", "--help"]),
+    ("async_batch --help", ["async_batch.py", "--help"]),
+    ("daemon --help", ["daemon.py", "--help"]),
+    ("netease_dl --help", ["netease_dl.py", "--help"]),
+    ("batch_audio_only 空列表", ["batch_audio_only.py", "{empty}", "-o", "{out}", "--progress", "plain"]),
+    ("batch_audio_only 全部已存在",
+     ["batch_audio_only.py", "{links}", "-o", "{out}", "--fresh", "--progress", "plain"]),
+    ("batch_download 全部已存在", ["batch_download.py", "{links}", "-o", "{out}", "--no-video"]),
+)
+
+# 上面的场景都不应导入的模块
+FORBIDDEN_MODULES = ("yt_dlp",)
+
+# “全部已存在”场景登记到下载索引里的条目（只用于零网络跳过，不会真正访问）
+INDEXED_ITEMS = (
+    ("youtube", "dQw4w9WgXcQ", "https://www.youtube.com/watch?v=dQw4w9WgXcQ"),
+    ("youtube", "9bZkp7q19f0", "https://youtu.be/9bZkp7q19f0"),
+    ("bilibili", "BV1xx411c7mD", "https://www.bilibili.com/video/BV1xx411c7mD"),
+)
+
+# python -X importtime 的输出：import time: 自身耗时 | 累计耗时 | 缩进 + 模块名（单位微秒）
+_IMPORT_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """解析 -X importtime 的输出，返回导入总耗时、顶层模块的累计耗时和全部导入的模块名。"""
+    total_us = 0
+    top_level: Dict[str, int] = {}
+    modules = set()
+    for line in stderr.splitlines():
+        m = _IMPORT_LINE_RE.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        total_us += self_us
+        modules.add(name)
+        if len(indent) == 1:
+            top_level[name] = top_level.get(name, 0) + cumulative_us
+    return {"total_us": total_us, "top_level": top_level, "modules": modules}
+
+
+def make_fixture(work_dir: str) -> Dict[str, str]:
+    """准备场景用到的空列表、链接文件和已登记全部条目的输出目录。"""
+    sys.path.insert(0, HERE)
+    from download_index import open_index
+
+    out_dir = os.path.join(work_dir, "out")
+    audio_dir = os.path.join(out_dir, "audios")
+    os.makedirs(audio_dir)
+    index = open_index(out_dir)
+    links_path = os.path.join(work_dir, "links.txt")
+    with open(links_path, "w", encoding="utf-8") as f:
+        for extractor, video_id, url in INDEXED_ITEMS:
+            path = os.path.join(audio_dir, f"fixture [{video_id}].mp3")
+            open(path, "wb").close()
+            index.record(extractor, video_id, "audio", path)
+            f.write(url + "\n")
+    index.close()
+    empty_path = os.path.join(work_dir, "empty.txt")
+    open(empty_path, "w").close()
+    if shutil.which("ffmpeg") is None:
+        _fake_ffmpeg(os.path.join(work_dir, "bin"))
+    return {"links": links_path, "empty": empty_path, "out": out_dir}
+
+
+def _fake_ffmpeg(bin_dir: str):
+    """
+    入口脚本启动时检查 ffmpeg 是否存在（audio_profile.require_ffmpeg）；这些场景都不会转码，
+    没装 ffmpeg 的机器上放一个占位命令到子进程的 PATH 里，只让启动检查通过。
+    """
+    os.makedirs(bin_dir)
+    with open(os.path.join(bin_dir, "ffmpeg"), "w") as f:
+        f.write("#!/bin/sh\nexit 1\n")
+    os.chmod(os.path.join(bin_dir, "ffmpeg"), 0o755)
+    with open(os.path.join(bin_dir, "ffmpeg.bat"), "w") as f:
+        f.write("@exit /b 1\n")
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+
+def _run(argv: List[str], importtime: bool = False) -> subprocess.CompletedProcess:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + argv
+    return subprocess.run(cmd, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          stdin=subprocess.DEVNULL, text=True, encoding="utf-8", errors="replace")
+
+
+def run_scenario(name: str, argv: List[str], runs: int) -> dict:
+    _run(argv)  # 预热：生成 .pyc，与 cron 反复调用时的状态一致
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        _run(argv)
+        walls.append(time.perf_counter() - start)
+    proc = _run(argv, importtime=True)
+    parsed = parse_importtime(proc.stderr)
+    forbidden = sorted(
+        prefix for prefix in FORBIDDEN_MODULES
+        if any(mod == prefix or mod.startswith(prefix + ".") for mod in parsed["modules"])
+    )
+    top = sorted(parsed["top_level"].items(), key=lambda kv: kv[1], reverse=True)[:4]
+    return {
+        "name": name,
+        "wall_ms": min(walls) * 1000,
+        "import_ms": parsed["total_us"] / 1000,
+        "modules": len(parsed["modules"]),
+        "forbidden": forbidden,
+        "top": [[mod, us / 1000] for mod, us in top],
+        "returncode": proc.returncode,
+    }
+
+
+def _change(value: float, base: float) -> str:
+    if not base:
+        return "-"
+    return f"{(value - base) / base:+.1%}"
+
+
+def print_table(results: List[dict], baseline: Optional[Dict[str, dict]] = None):
+    print(f"{'场景':<30} {'用时ms':>7} {'导入ms':>7} {'模块数':>6}  导入耗时最多的顶层模块")
+    print("-" * 110)
+    for r in results:
+        top = ", ".join(f"{mod} {ms:.0f}" for mod, ms in r["top"])
+        line = f"{r['name']:<30} {r['wall_ms']:>7.0f} {r['import_ms']:>7.0f} {r['modules']:>6}  {top}"
+        base = (baseline or {}).get(r["name"])
+        if base:
+            line += f"  用时 {_change(r['wall_ms'], base['wall_ms'])}, 模块数 {r['modules'] - base['modules']:+d}"
+        if r["forbidden"]:
+            line += f"  [导入了 {', '.join(r['forbidden'])}]"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="启动耗时基准：各入口脚本查看帮助、空列表、全部已存在时的用时与导入开销（-X importtime）。",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog=__doc__.split("用法：", 1)[1],
+    )
+    parser.add_argument("--runs", type=int, default=10, help="每个场景计时的次数，取最短用时 (默认为 10)。")
+    parser.add_argument("--only", metavar="TEXT", help="只运行名称中包含 TEXT 的场景，例如 --help。")
+    parser.add_argument("--json", metavar="FILE", help="把结果写入 JSON 文件（可作为之后 --compare 的基线）。")
+    parser.add_argument("--compare", metavar="FILE", help="与之前 --json 保存的基线对比用时。")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="--compare 时允许的用时增幅，超过即视为退化 (默认为 0.25，即 25%%)。")
+    parser.add_argument("--min-delta", type=float, default=25.0, metavar="MS",
+                        help="--compare 时用时至少增加多少毫秒才算退化 (默认为 25)。")
+    args = parser.parse_args()
+
+    if args.runs < 1:
+        print("错误: --runs 必须大于 0。")
+        sys.exit(1)
+    scenarios = [(name, argv) for name, argv in SCENARIOS if not args.only or args.only in name]
+    if not scenarios:
+        print(f"错误: 没有名称包含 '{args.only}' 的场景。")
+        sys.exit(1)
+
+    work_dir = tempfile.mkdtemp(prefix="startup_bench_")
+    results = []
+    try:
+        paths = make_fixture(work_dir)
+        for name, argv in scenarios:
+            print(f"运行 {name} ...", flush=True)
+            results.append(run_scenario(name, [arg.format(**paths) for arg in argv], args.runs))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print()
+    print_table(results, baseline)
+
+    # 脚本启动失败时耗时没有意义（例如导入出错会“变快”），同样视为退化
+    problems = [f"{r['name']} 退出码 {r['returncode']}" for r in results if r["returncode"]]
+    problems += [f"{r['name']} 导入了 {', '.join(r['forbidden'])}" for r in results if r["forbidden"]]
+    for r in results:
+        base = (baseline or {}).get(r["name"])
+        if (base and r["wall_ms"] > base["wall_ms"] * (1 + args.tolerance)
+                and r["wall_ms"] - base["wall_ms"] > args.min_delta):
+            problems.append(f"{r['name']} 用时 {r['wall_ms']:.0f} ms，基线 {base['wall_ms']:.0f} ms "
+                            f"({_change(r['wall_ms'], base['wall_ms'])})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json}")
+    if problems:
+        print("\n启动耗时退化:")
+        for problem in problems:
+            print(f"- {problem}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
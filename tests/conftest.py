@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 脚本都是仓库根目录下的平铺模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+import random
+
+from audio_dedup import MIN_OVERLAP_FRAMES, similarity, title_from_path, title_key
+
+
+def test_title_key_ignores_decorations():
+    assert title_key("Artist - Song Name (Official Music Video) [HD]") == title_key("artist - song name 【歌词版】")
+    assert title_key("Ｓｏｎｇ　Ｎａｍｅ Lyrics") == title_key("song name")
+
+
+def test_title_key_too_short():
+    assert title_key("Intro") == ""
+    assert title_key("") == ""
+
+
+def test_title_from_path():
+    assert title_from_path("/x/audios/Artist - Song [BV1xx411c7mD].mp3") == "Artist - Song"
+
+
+def _bits(n, seed):
+    rng = random.Random(seed)
+    return rng.getrandbits(n)
+
+
+def test_similarity_identical_and_shifted():
+    n = 600
+    bits = _bits(n, 1)
+    assert similarity(bits, n, bits, n) == 1.0
+    # 开头多了 5 帧（0.5 秒）也能对齐
+    shifted = (bits << 5) | 0b10110
+    assert similarity(shifted, n + 5, bits, n) == 1.0
+
+
+def test_similarity_unrelated_and_too_short():
+    n = 600
+    assert similarity(_bits(n, 1), n, _bits(n, 2), n) < 0.7
+    short = MIN_OVERLAP_FRAMES - 1
+    bits = _bits(short, 3)
+    assert similarity(bits, short, bits, short) == 0.0
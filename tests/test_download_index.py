@@ -0,0 +1,40 @@
+import pytest
+
+from download_index import DownloadIndex, normalize_extractor, url_media_key
+
+
+@pytest.mark.parametrize("extractor_key, expected", [
+    ("Youtube", "youtube"),
+    ("BiliBili", "bilibili"),
+    ("Douyin", "douyin"),
+    ("NetEaseMusic", "netease"),
+    (None, ""),
+])
+def test_normalize_extractor_matches_site_names(extractor_key, expected):
+    assert normalize_extractor(extractor_key) == expected
+
+
+@pytest.mark.parametrize("url, key", [
+    ("https://music.163.com/#/song?id=186016", ("netease", "186016")),
+    ("https://www.bilibili.com/video/BV1xx411c7mD?p=1", ("bilibili", "BV1xx411c7mD_p1")),
+    # yt-dlp 以 BV 号登记，av 号不联网查不到
+    ("https://www.bilibili.com/video/av170001", None),
+    ("https://www.youtube.com/playlist?list=PL123", None),
+    ("https://example.com/a.mp3", None),
+])
+def test_url_media_key(url, key):
+    assert url_media_key(url) == key
+
+
+def test_lookup_url_after_record(tmp_path):
+    audio = tmp_path / "audios" / "晴天 [186016].mp3"
+    audio.parent.mkdir()
+    audio.write_bytes(b"x")
+    index = DownloadIndex(str(tmp_path))
+    try:
+        assert index.record(normalize_extractor("NetEaseMusic"), "186016", "audio", str(audio))
+        assert index.lookup_url("https://music.163.com/song?id=186016") == str(audio)
+        audio.unlink()
+        assert index.lookup_url("https://music.163.com/song?id=186016") is None
+    finally:
+        index.close()
@@ -0,0 +1,25 @@
+import os
+
+from js_challenge import PlayerCache, ResultCache
+
+
+def test_player_cache_creates_directory_on_first_write(tmp_path):
+    directory = tmp_path / ".jsc_cache" / "players"
+    cache = PlayerCache(str(directory), max_disk=2)
+    assert cache.get("a") is None
+    assert not directory.exists()
+    for key in ("a", "b", "c"):
+        cache.put(key, f"// {key}")
+    assert len(os.listdir(directory)) == 2
+    # 磁盘上的文件在新实例里也能读到
+    assert PlayerCache(str(directory)).get("c") == "// c"
+
+
+def test_result_cache_saves_into_missing_directory(tmp_path):
+    path = tmp_path / ".jsc_cache" / "results.json"
+    cache = ResultCache(str(path))
+    cache.save()
+    assert not path.parent.exists()
+    cache.put("n", "player", "abc", "xyz")
+    cache.save()
+    assert ResultCache(str(path)).get("n", "player", "abc") == "xyz"
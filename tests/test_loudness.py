@@ -0,0 +1,12 @@
+from loudness import Loudness, normalization_gain
+
+
+def test_gain_reaches_target():
+    assert normalization_gain(Loudness(-20.0, -10.0, 6.0), -14.0) == 6.0
+    assert normalization_gain(Loudness(-8.5, -0.3, 5.0), -14.0) == -5.5
+
+
+def test_gain_limited_by_true_peak():
+    # 提升 6 dB 会让真峰值到 +2 dBTP，只能提升到 -1 dBTP 为止
+    assert normalization_gain(Loudness(-20.0, -4.0, 6.0), -14.0) == 3.0
+    assert normalization_gain(Loudness(-20.0, -4.0, 6.0), -14.0, true_peak_limit=-2.0) == 2.0
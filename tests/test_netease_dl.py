@@ -0,0 +1,42 @@
+from netease_dl import NcmPlaylistResult
+
+NCM_OUTPUT = """\
+歌单: 测试歌单 (504948603)
+曲目: 4/4
+[1/4] 2001
+歌曲: 歌一 - 歌手
+输出: out/歌手 - 歌一 [2001].mp3
+成功匹配文件: 1/4
+[2/4] 2002
+输出: out/歌手 - 歌二 [2002].mp3
+已存在同 ID 文件，跳过下载
+[3/4] 2003
+失败: 2003: 需要 VIP
+[4/4] 2004
+输出: out/歌手 - 歌四 [2004].flac
+"""
+
+
+def test_feed_counts_tracks():
+    result = NcmPlaylistResult(504948603)
+    finished = [result.feed(line) for line in NCM_OUTPUT.splitlines()]
+    result.close()
+    assert result.name == "测试歌单"
+    assert result.track_count == 4
+    assert (result.downloaded, result.skipped, result.failed) == (2, 1, 1)
+    assert result.errors == ["2003: 需要 VIP"]
+    # 只有新下载的文件交给 --dedup 处理，跳过的不算
+    assert result.files == [("2001", "out/歌手 - 歌一 [2001].mp3"), ("2004", "out/歌手 - 歌四 [2004].flac")]
+    # “成功匹配文件”、或开始下一首时上一首还未结束，都算一首处理完毕；最后一首由 close() 结算
+    assert finished.count(True) == 3
+
+
+def test_timed_out_last_track_not_counted():
+    result = NcmPlaylistResult(1)
+    for line in ("曲目: 2/2", "[1/2] 11", "成功匹配文件: 1/2", "[2/2] 12"):
+        result.feed(line)
+    result.timed_out = True
+    result.close()
+    assert (result.downloaded, result.processed) == (1, 1)
+    assert result.files == []
+    assert not result.ok
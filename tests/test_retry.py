@@ -0,0 +1,22 @@
+import pytest
+
+from retry import PERMANENT, POSTPROCESS, THROTTLED, TRANSIENT, classify_error
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("ERROR: [youtube] abc: Private video. Sign in if you've been granted access", PERMANENT),
+    ("ERROR: [youtube] abc: Video unavailable", PERMANENT),
+    ("ERROR: Unsupported URL: https://example.com/", PERMANENT),
+    ("ERROR: unable to download video data: HTTP Error 404: Not Found", PERMANENT),
+    ("ERROR: [BiliBili] BV1xx: 啊叻？视频不见了", PERMANENT),
+    ("ERROR: unable to download webpage: HTTP Error 429: Too Many Requests", THROTTLED),
+    ("ERROR: [BiliBili] BV1xx: HTTP Error 412: Precondition Failed", THROTTLED),
+    ("ERROR: Postprocessing: Conversion failed!", POSTPROCESS),
+    ("转码失败: item000000 [item000000].wav", POSTPROCESS),
+    ("缺少 ffmpeg，无法转码: item000000 [item000000].wav", PERMANENT),
+    ("ERROR: Read timed out.", TRANSIENT),
+    ("", TRANSIENT),
+    (None, TRANSIENT),
+])
+def test_classify_error(message, expected):
+    assert classify_error(message) == expected
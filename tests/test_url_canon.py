@@ -0,0 +1,104 @@
+import pytest
+
+from url_canon import canonicalize_url, unique_canonical_urls
+
+BV = "BV1xx411c7mD"
+YT = "dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url, key, canonical", [
+    # YouTube：各种写法归一到 watch?v=
+    (f"https://www.youtube.com/watch?v={YT}", ("youtube", YT), f"https://www.youtube.com/watch?v={YT}"),
+    (f"http://youtube.com/watch?v={YT}&pp=ygUE&si=abc", ("youtube", YT), f"https://www.youtube.com/watch?v={YT}"),
+    (f"https://m.youtube.com/watch?v={YT}&feature=share", ("youtube", YT), f"https://www.youtube.com/watch?v={YT}"),
+    (f"https://youtu.be/{YT}?si=xyz", ("youtube", YT), f"https://www.youtube.com/watch?v={YT}"),
+    (f"https://www.youtube.com/shorts/{YT}", ("youtube", YT), f"https://www.youtube.com/watch?v={YT}"),
+    (f"www.youtube-nocookie.com/embed/{YT}", ("youtube", YT), f"https://www.youtube.com/watch?v={YT}"),
+    # 同时带 v 和 list 时按列表处理
+    (f"https://www.youtube.com/watch?v={YT}&list=PL123", ("youtube:playlist", "PL123"),
+     "https://www.youtube.com/playlist?list=PL123"),
+    # Bilibili：去掉追踪参数；显式给出的 p（包括 p=1）保留
+    (f"https://www.bilibili.com/video/{BV}/?spm_id_from=333.1007&vd_source=abc", ("bilibili", BV),
+     f"https://www.bilibili.com/video/{BV}/"),
+    (f"https://m.bilibili.com/video/{BV}", ("bilibili", BV), f"https://www.bilibili.com/video/{BV}/"),
+    (f"https://www.bilibili.com/video/{BV}?p=1", ("bilibili", f"{BV}_p1"), f"https://www.bilibili.com/video/{BV}/?p=1"),
+    (f"https://www.bilibili.com/video/{BV}?p=2&vd_source=x", ("bilibili", f"{BV}_p2"),
+     f"https://www.bilibili.com/video/{BV}/?p=2"),
+    (f"https://www.bilibili.com/video/{BV}?p=02", ("bilibili", f"{BV}_p2"), f"https://www.bilibili.com/video/{BV}/?p=2"),
+    (f"https://www.bilibili.com/video/{BV}?p=0", ("bilibili", BV), f"https://www.bilibili.com/video/{BV}/"),
+    ("https://www.bilibili.com/video/av170001", ("bilibili", "av170001"), "https://www.bilibili.com/video/av170001/"),
+    # 抖音、网易云单曲
+    ("https://www.douyin.com/video/7312345678901234567?previous_page=app", ("douyin", "7312345678901234567"),
+     "https://www.douyin.com/video/7312345678901234567"),
+    ("https://music.163.com/#/song?id=186016", ("netease", "186016"), "https://music.163.com/song?id=186016"),
+    ("https://y.music.163.com/m/song?id=186016&userid=1", ("netease", "186016"), "https://music.163.com/song?id=186016"),
+])
+def test_site_urls(url, key, canonical):
+    canon = canonicalize_url(url, resolve_short_links=False)
+    assert canon.key == key
+    assert canon.url == canonical
+
+
+@pytest.mark.parametrize("url", [
+    f"https://notyoutube.com/watch?v={YT}",
+    f"https://youtube.com.evil.example/watch?v={YT}",
+    f"https://fakebilibili.com/video/{BV}",
+    "https://notdouyin.com/video/7312345678901234567",
+    "https://evilmusic.163.com.example/song?id=186016",
+])
+def test_lookalike_hosts_are_generic(url):
+    canon = canonicalize_url(url, resolve_short_links=False)
+    assert canon.extractor == "generic"
+    assert canon.url == url
+
+
+def test_generic_drops_tracking_params_and_scheme():
+    a = canonicalize_url("https://www.example.com/a.mp3?utm_source=x&b=2&a=1#t", resolve_short_links=False)
+    b = canonicalize_url("http://example.com/a.mp3?a=1&b=2&si=zz", resolve_short_links=False)
+    assert a.key == b.key == ("generic", "example.com/a.mp3?a=1&b=2")
+    # 通用链接原样交给 yt-dlp
+    assert a.url == "https://www.example.com/a.mp3?utm_source=x&b=2&a=1#t"
+
+
+def test_non_url_input_is_its_own_key():
+    assert canonicalize_url("ytsearch:关键词", resolve_short_links=False).key == ("generic", "ytsearch:关键词")
+
+
+class _StubResolver:
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.calls = []
+
+    def resolve(self, url):
+        self.calls.append(url)
+        return self.mapping.get(url)
+
+
+def test_short_link_resolved():
+    resolver = _StubResolver({"https://b23.tv/abc123": f"https://www.bilibili.com/video/{BV}?p=3&share_source=copy"})
+    canon = canonicalize_url("b23.tv/abc123", resolver=resolver)
+    assert canon.key == ("bilibili", f"{BV}_p3")
+    assert resolver.calls == ["https://b23.tv/abc123"]
+
+
+def test_short_link_unresolved_or_disabled_stays_generic():
+    resolver = _StubResolver({})
+    assert canonicalize_url("https://v.douyin.com/iAbCdEf/", resolver=resolver).extractor == "generic"
+    resolver = _StubResolver({"https://b23.tv/abc123": f"https://www.bilibili.com/video/{BV}"})
+    assert canonicalize_url("https://b23.tv/abc123", resolve_short_links=False, resolver=resolver).extractor == "generic"
+    assert resolver.calls == []
+
+
+def test_unique_canonical_urls_keeps_first_and_order():
+    urls = [
+        f"https://youtu.be/{YT}",
+        f"https://www.bilibili.com/video/{BV}?p=1",
+        f"https://www.youtube.com/watch?v={YT}&si=1",
+        f"https://www.bilibili.com/video/{BV}",
+        f"https://www.bilibili.com/video/{BV}/?p=1&vd_source=2",
+    ]
+    assert list(unique_canonical_urls(urls, resolve_short_links=False)) == [
+        f"https://www.youtube.com/watch?v={YT}",
+        f"https://www.bilibili.com/video/{BV}/?p=1",
+        f"https://www.bilibili.com/video/{BV}/",
+    ]
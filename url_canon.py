@@ -0,0 +1,185 @@
+"""
+链接规范化 —— 把用户提供的各种链接写法归一成 (站点, 媒体 ID) 键，用于入队前去重。
+
+同一个视频在 links.txt 里常见多种写法：YouTube 带 &pp= / &si= 等追踪参数，
+Bilibili 带 spm_id_from / vd_source，http 与 https、有无 www 混用，以及 b23.tv 短链。
+这些写法在这里都会得到同一个键和同一个规范 URL，三个入口脚本共用。
+"""
+
+import re
+import threading
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from links_input import HashedKeySet
+
+
+class CanonicalURL(NamedTuple):
+    extractor: str  # 'youtube' / 'bilibili' / 'douyin' / 'netease' / 'generic'
+    media_id: str   # 站内 ID；generic 时为规范化后的整条 URL
+    url: str        # 实际交给 yt-dlp 的规范 URL
+
+    @property
+    def key(self):
+        return (self.extractor, self.media_id)
+
+
+YOUTUBE_ID_RE = re.compile(r"^[0-9A-Za-z_-]{11}$")
+BILIBILI_BV_RE = re.compile(r"(BV[0-9A-Za-z]{10})")
+_BILIBILI_AV_RE = re.compile(r"/video/av(\d+)", re.IGNORECASE)
+_DOUYIN_ID_RE = re.compile(r"/(?:video|note)/(\d+)")
+
+# 需要先跟随跳转才能得知真实地址的短链域名
+SHORT_LINK_HOSTS = ("b23.tv", "v.douyin.com")
+
+# 通用链接里一律丢弃的追踪参数
+_GENERIC_TRACKING_PARAMS = ("spm_id_from", "vd_source", "share_source", "share_medium", "from_spmid", "si", "pp", "feature")
+
+
+class ShortLinkResolver:
+    """跟随 HTTP 跳转展开短链，结果按短链缓存在内存中（线程安全），同一短链只请求一次。"""
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self._cache: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url: str) -> Optional[str]:
+        with self._lock:
+            if url in self._cache:
+                return self._cache[url]
+        resolved = self._fetch_location(url)
+        with self._lock:
+            self._cache[url] = resolved
+        return resolved
+
+    def _fetch_location(self, url: str) -> Optional[str]:
+        # urllib.request 连带导入 http.client / email 等，只有真正展开短链时才需要
+        import urllib.request
+
+        request = urllib.request.Request(
+            url, method="HEAD", headers={"User-Agent": "Mozilla/5.0"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+                return resp.geturl()
+        except Exception:
+            # 展开失败时保持原样，交给 yt-dlp 自己处理
+            return None
+
+
+default_resolver = ShortLinkResolver()
+
+
+def _on_domain(host: str, domain: str) -> bool:
+    """host 是 domain 本身或其子域名（notyoutube.com 不算 youtube.com）。"""
+    return host == domain or host.endswith("." + domain)
+
+
+def _with_scheme(url: str) -> str:
+    url = url.strip()
+    if not re.match(r"^[a-zA-Z][a-zA-Z0-9+.-]*://", url):
+        url = "https://" + url
+    return url
+
+
+def canonicalize_url(url: str, resolve_short_links: bool = True,
+                     resolver: Optional[ShortLinkResolver] = None) -> CanonicalURL:
+    """
+    把链接归一成 CanonicalURL。
+
+    :param url: 原始链接（可以缺少 http(s):// 前缀）。
+    :param resolve_short_links: 是否联网展开 b23.tv / v.douyin.com 短链；为 False 时短链按通用链接处理。
+    :param resolver: 短链解析器，默认使用进程内共享的带缓存实例。
+    """
+    raw = url.strip()
+    try:
+        parsed = urlparse(_with_scheme(raw))
+        port = parsed.port
+    except ValueError:
+        # 例如 'ytsearch:关键词' 这类非 URL 输入，原样作为键
+        return CanonicalURL("generic", raw, raw)
+    host = (parsed.hostname or "").lower()
+    query = parse_qs(parsed.query)
+
+    if resolve_short_links and host in SHORT_LINK_HOSTS:
+        resolved = (resolver or default_resolver).resolve(_with_scheme(raw))
+        if resolved and (urlparse(resolved).hostname or "").lower() not in SHORT_LINK_HOSTS:
+            return canonicalize_url(resolved, resolve_short_links=False)
+
+    # YouTube
+    if _on_domain(host, "youtube.com") or _on_domain(host, "youtube-nocookie.com") or host == "youtu.be":
+        if host == "youtu.be":
+            vid = parsed.path.lstrip("/").split("/")[0]
+        elif parsed.path == "/watch":
+            vid = (query.get("v") or [""])[0]
+        else:
+            m = re.match(r"^/(?:shorts|embed|live|v)/([^/?#]+)", parsed.path)
+            vid = m.group(1) if m else ""
+        playlist_id = (query.get("list") or [""])[0]
+        # 同时带 v 和 list 时 yt-dlp 默认下载整个列表，这里按列表去重以保持原有行为
+        if playlist_id and (parsed.path in ("/watch", "/playlist")):
+            return CanonicalURL(
+                "youtube:playlist", playlist_id,
+                f"https://www.youtube.com/playlist?list={playlist_id}",
+            )
+        if YOUTUBE_ID_RE.match(vid):
+            return CanonicalURL("youtube", vid, f"https://www.youtube.com/watch?v={vid}")
+
+    # Bilibili
+    if _on_domain(host, "bilibili.com"):
+        m = BILIBILI_BV_RE.search(parsed.path)
+        if m:
+            vid = m.group(1)
+            page = (query.get("p") or [""])[0]
+            canonical = f"https://www.bilibili.com/video/{vid}/"
+            # 显式给出 p（包括 p=1）时保留：多 P 视频不带 p 时 yt-dlp 会下载全部分 P，
+            # 带 p 时只下载这一 P，ID 为 BV…_pN
+            if page.isdigit() and int(page) >= 1:
+                return CanonicalURL("bilibili", f"{vid}_p{int(page)}", f"{canonical}?p={int(page)}")
+            return CanonicalURL("bilibili", vid, canonical)
+        m = _BILIBILI_AV_RE.search(parsed.path)
+        if m:
+            return CanonicalURL("bilibili", f"av{m.group(1)}", f"https://www.bilibili.com/video/av{m.group(1)}/")
+
+    # 抖音
+    if _on_domain(host, "douyin.com") and host not in SHORT_LINK_HOSTS:
+        m = _DOUYIN_ID_RE.search(parsed.path)
+        if m:
+            return CanonicalURL("douyin", m.group(1), f"https://www.douyin.com/video/{m.group(1)}")
+
+    # 网易云单曲（歌单由 netease_dl.py 处理）
+    if _on_domain(host, "music.163.com"):
+        target = parsed.fragment if parsed.fragment.startswith("/") else parsed.path
+        target_parsed = urlparse(target)
+        song_id = (parse_qs(target_parsed.query).get("id") or query.get("id") or [""])[0]
+        if target_parsed.path.rstrip("/").endswith("/song") and song_id.isdigit():
+            return CanonicalURL("netease", song_id, f"https://music.163.com/song?id={song_id}")
+
+    # 通用：忽略 scheme、统一 host 大小写、去掉 www、丢弃追踪参数和 #锚点，只用于去重键
+    netloc = host[4:] if host.startswith("www.") else host
+    if port:
+        netloc = f"{netloc}:{port}"
+    kept = sorted(
+        (k, v) for k, values in query.items() for v in values
+        if k not in _GENERIC_TRACKING_PARAMS and not k.startswith("utm_")
+    )
+    normalized = netloc + (parsed.path or "/")
+    if kept:
+        normalized += "?" + urlencode(kept)
+    return CanonicalURL("generic", normalized, raw)
+
+
+def unique_canonical_urls(urls: Iterable[str], resolve_short_links: bool = True, seen=None) -> Iterator[str]:
+    """
+    按 (站点, 媒体 ID) 去重并保持原有顺序，产出规范 URL（生成器，边读边产出）。
+
+    :param seen: 去重结构（links_input.HashedKeySet / BloomFilter），默认新建 HashedKeySet；
+                 调用方可传入自己的实例，结束后从 seen.duplicates 读取合并的重复数。
+    """
+    if seen is None:
+        seen = HashedKeySet()
+    for url in urls:
+        canon = canonicalize_url(url, resolve_short_links=resolve_short_links)
+        if seen.add(canon.key):
+            yield canon.url
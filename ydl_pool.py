@@ -0,0 +1,161 @@
+"""
+长期存活的 YoutubeDL 实例池 —— 每个线程按参数复用已配置好的 YoutubeDL，避免每个 URL 重复初始化。
+
+每新建一个 YoutubeDL 都要：加载全部 extractor、解析 Cookie 文件（cookiesfrombrowser 还要解密浏览器数据库）、
+创建新的 HTTP 请求处理器（连接无法复用）。批量下载大量短视频时，这部分开销占总耗时的比例很明显。
+
+这里的做法：
+- 每个线程按“静态参数”（格式、输出模板、后处理器、请求头、Cookie 来源等）缓存实例，LRU 淘汰；
+- logger、progress_hooks、postprocessor_hooks 这些每个 URL 不同的参数，在借出时替换，归还时清空；
+- 同一 Cookie 来源在整个进程内只加载一次，所有实例共享同一个 cookie jar（CookieJar 自带锁，线程安全）；
+- 实例在进程退出时统一关闭（此时才写回 Cookie 文件）。
+"""
+
+import atexit
+import importlib.util
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# 每个 URL 都不同、借出时替换的参数
+_PER_CALL_KEYS = ("logger", "progress_hooks", "postprocessor_hooks")
+
+# 每个线程最多缓存的实例数（不同阶段/不同 Cookie 来源各占一个）
+PER_THREAD_LIMIT = 8
+
+
+def require_yt_dlp():
+    """
+    入口脚本解析完参数后调用：只检查 yt-dlp 是否已安装（不导入），缺失时打印安装提示并退出。
+
+    yt_dlp 本身要到第一次创建 YoutubeDL 时才导入，查看帮助、全部条目都已存在时不必加载它。
+    """
+    if importlib.util.find_spec("yt_dlp") is None:
+        print("错误：yt-dlp 未安装。请在 conda 环境中运行 'conda install -c conda-forge yt-dlp' 来安装。")
+        sys.exit(1)
+
+
+class _PooledYdl:
+    __slots__ = ("ydl", "progress_hooks", "postprocessor_hooks", "busy")
+
+    def __init__(self):
+        self.ydl = None
+        self.progress_hooks: List = []
+        self.postprocessor_hooks: List = []
+        self.busy = False
+
+
+def _static_key(opts: dict) -> str:
+    return repr(sorted((k, v) for k, v in opts.items() if k not in _PER_CALL_KEYS))
+
+
+def _cookie_key(opts: dict) -> tuple:
+    return (opts.get("cookiefile"), tuple(opts.get("cookiesfrombrowser") or ()))
+
+
+class YdlPool:
+    """线程本地的 YoutubeDL 缓存；用 borrow(opts) 借出实例。"""
+
+    def __init__(self, per_thread_limit: int = PER_THREAD_LIMIT):
+        self.per_thread_limit = per_thread_limit
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._jars: Dict[tuple, object] = {}
+        self._all: List[_PooledYdl] = []
+        self.created = 0
+        self.reused = 0
+
+    def _create(self, opts: dict) -> _PooledYdl:
+        # 第一次真正需要联网时才导入 yt_dlp（及 JS 挑战求解器），缺失时由入口脚本给出安装提示
+        from js_challenge import register_providers
+        from segmented import youtube_dl_class
+
+        register_providers()
+
+        entry = _PooledYdl()
+        static = {k: v for k, v in opts.items() if k not in _PER_CALL_KEYS}
+        # 钩子在创建后无法移除，这里只注册一个转发函数，转发给当前借用者的钩子
+        static["progress_hooks"] = [lambda d: [hook(d) for hook in list(entry.progress_hooks)]]
+        static["postprocessor_hooks"] = [lambda d: [hook(d) for hook in list(entry.postprocessor_hooks)]]
+        # 按 segmented.default_connections 选择下载器（分段并发、全局连接上限）
+        entry.ydl = youtube_dl_class()(static)
+
+        # 同一 Cookie 来源只加载一次（浏览器 Cookie 解密很慢），之后的实例直接共享
+        with self._lock:
+            key = _cookie_key(opts)
+            jar = self._jars.get(key)
+            if jar is None:
+                jar = self._jars[key] = entry.ydl.cookiejar
+            entry.ydl.__dict__["cookiejar"] = jar
+            self._all.append(entry)
+            self.created += 1
+        return entry
+
+    def _cache(self) -> "OrderedDict[str, _PooledYdl]":
+        cache = getattr(self._local, "cache", None)
+        if cache is None:
+            cache = self._local.cache = OrderedDict()
+        return cache
+
+    @contextmanager
+    def borrow(self, opts: dict) -> Iterator:
+        """借出一个按 opts 配置的 YoutubeDL；同一线程内嵌套借用同一配置时临时新建一个。"""
+        cache = self._cache()
+        key = _static_key(opts)
+        entry = cache.get(key)
+        if entry is None or entry.busy:
+            entry = self._create(opts)
+            if key not in cache:
+                cache[key] = entry
+                while len(cache) > self.per_thread_limit:
+                    _, evicted = cache.popitem(last=False)
+                    self._discard(evicted)
+        else:
+            with self._lock:
+                self.reused += 1
+            cache.move_to_end(key)
+
+        ydl = entry.ydl
+        entry.busy = True
+        entry.progress_hooks[:] = opts.get("progress_hooks") or []
+        entry.postprocessor_hooks[:] = opts.get("postprocessor_hooks") or []
+        ydl.params["logger"] = opts.get("logger")
+        # 上一个 URL 的失败状态不能带到下一个 URL
+        ydl._download_retcode = 0
+        try:
+            yield ydl
+        finally:
+            entry.progress_hooks.clear()
+            entry.postprocessor_hooks.clear()
+            ydl.params["logger"] = None
+            entry.busy = False
+            if cache.get(key) is not entry:
+                # 嵌套借用时临时新建的实例，用完即关闭
+                self._discard(entry)
+
+    def _discard(self, entry: _PooledYdl):
+        if entry.busy:
+            return
+        with self._lock:
+            if entry in self._all:
+                self._all.remove(entry)
+        entry.ydl.close()
+
+    def stats_line(self) -> str:
+        return f"YoutubeDL 实例: 新建 {self.created} 个, 复用 {self.reused} 次"
+
+    def close(self):
+        """关闭所有实例（写回 Cookie 文件、关闭连接）。"""
+        with self._lock:
+            entries, self._all = self._all, []
+        for entry in entries:
+            try:
+                entry.ydl.close()
+            except Exception:
+                pass
+
+
+default_pool = YdlPool()
+atexit.register(default_pool.close)